@@ -1,34 +1,276 @@
 from __future__ import annotations
 
+import contextvars
 import json
-import webbrowser
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Protocol
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from dataclasses import dataclass, field
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Protocol,
+    Sequence,
+    TypeVar,
+)
+
+import tracing
+from extensions import ExtensionLoader
+from json_stream import IncrementalJSONParser, parse_first_object
+from messages import Message
+
+if TYPE_CHECKING:
+    import asyncio
+
+T = TypeVar("T")
 
 
 class ChatBackend(Protocol):
-    def send(self, messages: List[Dict[str, str]]) -> str: ...
+    def send(self, messages: Sequence[Mapping[str, str]]) -> str: ...
+
+
+class StreamingChatBackend(ChatBackend, Protocol):
+    def stream(self, messages: Sequence[Mapping[str, str]]) -> Iterator[str]: ...
+
+
+class ToolCallingBackend(ChatBackend, Protocol):
+    def send_with_tools(
+        self, messages: Sequence[Mapping[str, str]], tools: List[Dict[str, Any]]
+    ) -> Dict[str, Any]: ...
+
+
+class AsyncChatBackend(Protocol):
+    async def send(self, messages: Sequence[Mapping[str, str]]) -> str: ...
+
+    def stream(self, messages: Sequence[Mapping[str, str]]) -> AsyncIterator[str]: ...
+
+
+class AsyncBackendAdapter:
+    """Exposes a sync ChatBackend as an AsyncChatBackend by running calls in threads."""
+
+    def __init__(self, backend: ChatBackend) -> None:
+        self.backend = backend
+
+    async def send(self, messages: Sequence[Mapping[str, str]]) -> str:
+        import asyncio
+
+        return await asyncio.to_thread(self.backend.send, messages)
+
+    async def stream(self, messages: Sequence[Mapping[str, str]]) -> AsyncIterator[str]:
+        yield await self.send(messages)
+
+
+class BlockingBackendAdapter:
+    """Exposes an AsyncChatBackend to sync code (Planner, agents) in worker threads.
+
+    Calls are scheduled on ``loop`` and block the calling thread, so they must
+    never be made from the loop thread itself.
+    """
+
+    def __init__(self, backend: AsyncChatBackend, loop: asyncio.AbstractEventLoop) -> None:
+        self.backend = backend
+        self.loop = loop
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.backend, name)
+
+    def with_json_mode(self) -> "BlockingBackendAdapter":
+        return BlockingBackendAdapter(self.backend.with_json_mode(), self.loop)
+
+    def _run(self, awaitable: Awaitable[T]) -> T:
+        """Runs ``awaitable`` on the loop with the caller's context variables (spans, usage)."""
+        import asyncio
+
+        context = contextvars.copy_context()
+
+        async def with_context() -> T:
+            for variable, value in context.items():
+                variable.set(value)
+            return await awaitable
+
+        return asyncio.run_coroutine_threadsafe(with_context(), self.loop).result()
+
+    def send(self, messages: Sequence[Mapping[str, str]]) -> str:
+        return self._run(self.backend.send(messages))
+
+    def send_with_tools(
+        self, messages: Sequence[Mapping[str, str]], tools: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        return self._run(self.backend.send_with_tools(messages, tools))
+
+    def stream(self, messages: Sequence[Mapping[str, str]]) -> Iterator[str]:
+        iterator = self.backend.stream(messages).__aiter__()
+        try:
+            while True:
+                try:
+                    yield self._run(iterator.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._run(iterator.aclose())
+
+
+@dataclass
+class PlanStep:
+    """One agent call of a multi-step plan; starts once the ``depends_on`` steps finish."""
+
+    id: str
+    agent: str
+    arguments: Dict[str, Any]
+    depends_on: List[str] = field(default_factory=list)
+
+
+MULTI_STEP_AGENT = "steps"
 
 
 @dataclass
 class AgentPlan:
+    """Agent to run for a turn.
+
+    A plan with several independent actions has ``agent`` set to
+    ``MULTI_STEP_AGENT`` and lists them in ``steps``; ``arguments`` is then empty.
+    """
+
     agent: str
     arguments: Dict[str, Any]
     user_visible_message: Optional[str] = None
+    steps: List[PlanStep] = field(default_factory=list)
+
+
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate: ~4 UTF-8 bytes per token (≈2 Cyrillic characters)."""
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+class PromptCacheStats:
+    """Provider-side prompt cache counters taken from response ``usage``.
+
+    DeepSeek reports ``prompt_cache_hit_tokens``/``prompt_cache_miss_tokens``;
+    OpenAI-style ``prompt_tokens_details.cached_tokens`` is accepted as well.
+    """
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.hit_tokens = 0
+        self.miss_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, usage: Dict[str, Any]) -> None:
+        hit = usage.get("prompt_cache_hit_tokens")
+        miss = usage.get("prompt_cache_miss_tokens")
+        if hit is None and isinstance(usage.get("prompt_tokens_details"), dict):
+            hit = usage["prompt_tokens_details"].get("cached_tokens")
+            if isinstance(hit, int) and isinstance(usage.get("prompt_tokens"), int):
+                miss = usage["prompt_tokens"] - hit
+        if not isinstance(hit, int) or not isinstance(miss, int):
+            return
+        with self._lock:
+            self.requests += 1
+            self.hit_tokens += hit
+            self.miss_tokens += miss
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hit_tokens + self.miss_tokens
+        return self.hit_tokens / total if total else 0.0
 
 
 class ConversationBuffer:
-    """Utility to manage rolling chat history with a system prompt."""
+    """Utility to manage rolling chat history with a system prompt.
+
+    History is trimmed to ``limit`` messages and, when ``token_budget`` is
+    set, to that many tokens (system prompt included). The newest message is
+    always kept, even when it alone exceeds the budget. Token counts are
+    computed once per message and kept alongside a running total.
+
+    With ``eviction_chunk`` > 0 an overflow evicts that extra share of the
+    capacity at once, so the prompt prefix stays unchanged for several turns
+    between evictions and the provider's prompt cache keeps hitting. With 0
+    the window slides by one message per turn.
+
+    ``recall`` is a transient system message (long-term memory snippets for
+    the current turn). It is placed right before the last message so the
+    cached prefix is unaffected, and it is not part of the stored history.
 
-    def __init__(self, system_prompt: str, limit: int) -> None:
+    Messages are stored as :class:`messages.Message` objects, which keep
+    their encoded JSON, so ``snapshot()`` and request bodies reuse them
+    instead of rebuilding dicts and re-serializing the history every turn.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        limit: int,
+        token_budget: Optional[int] = None,
+        token_counter: Callable[[str], int] = estimate_tokens,
+        eviction_chunk: float = 0.0,
+    ) -> None:
         self.limit = max(limit, 2)
-        self.messages: List[Dict[str, str]] = [
-            {"role": "system", "content": system_prompt.strip()}
-        ]
+        self.token_budget = token_budget
+        self.token_counter = token_counter
+        self.eviction_chunk = min(max(eviction_chunk, 0.0), 1.0)
+        self.cache_stats = PromptCacheStats()
+        self.evictions = 0
+        self.system_message = Message("system", system_prompt.strip())
+        self.system_tokens = self._count(self.system_message.content)
+        self._history: Deque[Message] = deque()
+        self._token_counts: Deque[int] = deque()
+        self.history_tokens = 0
+        self._recall: Optional[Message] = None
+        self._lock = threading.RLock()
+
+    @property
+    def messages(self) -> List[Message]:
+        return self.snapshot()
+
+    @property
+    def recall(self) -> Optional[str]:
+        return self._recall.content if self._recall is not None else None
+
+    @recall.setter
+    def recall(self, content: Optional[str]) -> None:
+        self._recall = Message("system", content) if content else None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.system_tokens + self.history_tokens
+
+    def _count(self, content: str) -> int:
+        return self.token_counter(content) + MESSAGE_TOKEN_OVERHEAD
 
     def add(self, role: str, content: str) -> None:
-        self.messages.append({"role": role, "content": content})
-        self._trim()
+        tokens = self._count(content)
+        with self._lock:
+            self._history.append(Message(role, content))
+            self._token_counts.append(tokens)
+            self.history_tokens += tokens
+            self._trim()
+
+    def restore(self, messages: Sequence[Mapping[str, str]]) -> None:
+        """Replaces the history with ``messages`` saved earlier from ``history()``."""
+        with self._lock:
+            self._history.clear()
+            self._token_counts.clear()
+            self.history_tokens = 0
+            for message in messages:
+                tokens = self._count(message["content"])
+                self._history.append(Message.from_mapping(message))
+                self._token_counts.append(tokens)
+                self.history_tokens += tokens
+            self._trim()
 
     def add_user(self, content: str) -> None:
         self.add("user", content)
@@ -36,20 +278,92 @@ class ConversationBuffer:
     def add_assistant(self, content: str) -> None:
         self.add("assistant", content)
 
-    def snapshot(self) -> List[Dict[str, str]]:
-        return list(self.messages)
+    def snapshot(self) -> List[Message]:
+        with self._lock:
+            messages = [self.system_message, *self._history]
+            if self._recall is not None and len(messages) > 1:
+                messages.insert(-1, self._recall)
+            return messages
+
+    def history(self) -> List[Message]:
+        with self._lock:
+            return list(self._history)
 
     def last_assistant(self) -> Optional[str]:
-        for message in reversed(self.messages):
-            if message["role"] == "assistant":
-                return message["content"]
+        with self._lock:
+            for message in reversed(self._history):
+                if message.role == "assistant":
+                    return message.content
         return None
 
+    def replace_with_summary(self, summarized: Sequence[Mapping[str, str]], summary: str) -> None:
+        """Atomically swaps the still-present prefix of ``summarized`` for a summary.
+
+        ``summarized`` must be a prefix of ``history()`` taken earlier; messages
+        added since then are kept after the summary.
+        """
+        summarized_ids = {id(message) for message in summarized}
+        summary_message = Message("system", summary)
+        with self._lock:
+            while self._history and id(self._history[0]) in summarized_ids:
+                self._evict_oldest()
+            tokens = self._count(summary)
+            self._history.appendleft(summary_message)
+            self._token_counts.appendleft(tokens)
+            self.history_tokens += tokens
+            self._trim()
+
+    def _evict_oldest(self) -> None:
+        self._history.popleft()
+        self.history_tokens -= self._token_counts.popleft()
+
     def _trim(self) -> None:
-        if len(self.messages) <= self.limit:
+        capacity = self.limit - 1
+        if len(self._history) > capacity:
+            self.evictions += 1
+            target = max(capacity - int(capacity * self.eviction_chunk), 1)
+            while len(self._history) > target:
+                self._evict_oldest()
+        if self.token_budget is None or self.total_tokens <= self.token_budget:
             return
-        system_message = self.messages[0]
-        self.messages = [system_message] + self.messages[-(self.limit - 1) :]
+        self.evictions += 1
+        target_tokens = self.token_budget - int(self.token_budget * self.eviction_chunk)
+        while len(self._history) > 1 and self.total_tokens > target_tokens:
+            self._evict_oldest()
+
+
+def build_steps(raw: Any) -> List[PlanStep]:
+    """Validated steps from a planner ``steps`` list.
+
+    Steps without an agent are dropped, missing or repeated ids are replaced
+    with ``s<position>``, and ``depends_on`` (a list or a single id) keeps only
+    ids of other steps in the plan.
+    """
+    if not isinstance(raw, list):
+        return []
+    steps: List[PlanStep] = []
+    requested: List[List[str]] = []
+    for position, item in enumerate(raw, start=1):
+        if not isinstance(item, dict):
+            continue
+        agent = str(item.get("agent") or "").lower().strip()
+        if not agent:
+            continue
+        step_id = str(item.get("id") or "").strip()
+        if not step_id or any(step.id == step_id for step in steps):
+            step_id = f"s{position}"
+        arguments = item.get("arguments") or {}
+        depends_on = item.get("depends_on") or []
+        if not isinstance(depends_on, list):
+            depends_on = [depends_on]
+        steps.append(PlanStep(step_id, agent, arguments if isinstance(arguments, dict) else {}))
+        requested.append([str(dependency) for dependency in depends_on])
+    known = {step.id for step in steps}
+    for step, depends_on in zip(steps, requested):
+        step.depends_on = [
+            dependency for dependency in depends_on if dependency in known and dependency != step.id
+        ]
+    return steps
 
 
 class Planner:
@@ -64,21 +378,55 @@ class Planner:
         self.error_cls = error_cls
 
     def plan(self) -> AgentPlan:
-        raw_response = self.client.send(self.buffer.snapshot())
-        parsed = self._extract_json(raw_response)
+        with tracing.span("planner.plan"), tracing.usage_listener(self.buffer.cache_stats.record):
+            return self._plan(self.buffer.snapshot())
+
+    def plan_messages(self, messages: List[Message]) -> AgentPlan:
+        """Plans over ``messages`` instead of the buffer: history plus a pending prompt."""
+        with tracing.span("planner.plan", ahead=True), tracing.usage_listener(
+            self.buffer.cache_stats.record
+        ):
+            return self._plan(messages)
+
+    def _plan(self, messages: List[Message]) -> AgentPlan:
+        raw_response = self.client.send(messages)
+        with tracing.span("planner.parse_json"):
+            parsed = self._extract_json(raw_response)
         if not parsed:
             raise self.error_cls("Планировщик не смог вернуть валидный JSON.")
+        return self.build_plan(parsed)
+
+    def stream_plan(
+        self, executor: Executor, ready: Callable[[Dict[str, Any]], bool]
+    ) -> "PlanStream":
+        """Streams the planner completion on ``executor``; see :class:`PlanStream`."""
+        return PlanStream(self, executor, ready)
+
+    @staticmethod
+    def build_plan(parsed: Dict[str, Any]) -> AgentPlan:
+        """Plan from the planner's JSON: one ``agent`` or a list of ``steps``.
+
+        A single valid step is returned as an ordinary one-agent plan.
+        """
+        user_visible_message = parsed.get("user_visible_message")
+        if user_visible_message is not None:
+            user_visible_message = str(user_visible_message).strip()
+        steps = build_steps(parsed.get("steps"))
+        if len(steps) > 1:
+            return AgentPlan(MULTI_STEP_AGENT, {}, user_visible_message, steps)
+        if steps:
+            return AgentPlan(steps[0].agent, steps[0].arguments, user_visible_message)
         agent = str(parsed.get("agent", "qa")).lower().strip()
         arguments = parsed.get("arguments") or {}
         if not isinstance(arguments, dict):
             arguments = {}
-        user_visible_message = parsed.get("user_visible_message")
-        if user_visible_message is not None:
-            user_visible_message = str(user_visible_message).strip()
         return AgentPlan(agent=agent, arguments=arguments, user_visible_message=user_visible_message)
 
     @staticmethod
     def _extract_json(payload: str) -> Optional[Dict[str, Any]]:
+        parsed = parse_first_object(payload)
+        if parsed:
+            return parsed
         try:
             start = payload.index("{")
             end = payload.rindex("}") + 1
@@ -90,19 +438,197 @@ class Planner:
             return None
 
 
+class PlanStream:
+    """Planner completion parsed incrementally while it streams in a worker thread.
+
+    ``early_plan`` returns as soon as ``ready`` accepts the top-level fields
+    parsed so far (normally ``agent`` plus the arguments that agent needs), so
+    the agent can start before ``user_visible_message`` has been generated.
+    ``final_plan`` waits for the complete object.
+    """
+
+    def __init__(
+        self,
+        planner: Planner,
+        executor: Executor,
+        ready: Callable[[Dict[str, Any]], bool],
+    ) -> None:
+        self.planner = planner
+        self.ready = ready
+        self.time_to_dispatch: Optional[float] = None
+        self._early: Optional[AgentPlan] = None
+        self._early_event = threading.Event()
+        self._started = time.perf_counter()
+        context = contextvars.copy_context()
+        self.future: Future[AgentPlan] = executor.submit(context.run, self._run)
+
+    def _run(self) -> AgentPlan:
+        try:
+            with tracing.span("planner.stream") as stream_span, tracing.usage_listener(
+                self.planner.buffer.cache_stats.record
+            ):
+                plan = self._consume()
+                stream_span.set(agent=plan.agent, time_to_dispatch=self.time_to_dispatch)
+                return plan
+        finally:
+            self._early_event.set()
+
+    def _consume(self) -> AgentPlan:
+        parser = IncrementalJSONParser()
+        parts: List[str] = []
+        for token in self.planner.client.stream(self.planner.buffer.snapshot()):
+            parts.append(token)
+            if parser.done or parser.failed:
+                continue
+            parser.feed(token)
+            if self._early is None and "agent" in parser.fields and self.ready(parser.fields):
+                self._early = self.planner.build_plan(parser.fields)
+                self.time_to_dispatch = time.perf_counter() - self._started
+                self._early_event.set()
+        parsed = parser.result() or self.planner._extract_json("".join(parts))
+        if not parsed:
+            raise self.planner.error_cls("Планировщик не смог вернуть валидный JSON.")
+        return self.planner.build_plan(parsed)
+
+    def early_plan(self) -> AgentPlan:
+        """Plan with the agent and its arguments; raises the planner's error if parsing failed."""
+        self._early_event.wait()
+        if self._early is not None:
+            return self._early
+        return self.future.result()
+
+    def final_plan(self) -> AgentPlan:
+        return self.future.result()
+
+
 class QuestionAnswerAgent:
-    """LLM-backed agent that answers user questions."""
+    """LLM-backed agent that answers user questions.
+
+    When ``on_token`` is given and the client supports streaming, tokens are
+    forwarded to the callback as they arrive and the assembled reply is
+    returned once the stream ends.
+    """
 
-    def __init__(self, client: ChatBackend, buffer: ConversationBuffer) -> None:
+    def __init__(
+        self,
+        client: ChatBackend,
+        buffer: ConversationBuffer,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> None:
         self.client = client
         self.buffer = buffer
+        self.on_token = on_token
+
+    def run(self, stream_tokens: bool = True) -> str:
+        """Answers the last user message; ``stream_tokens=False`` skips ``on_token``."""
+        with tracing.usage_listener(self.buffer.cache_stats.record):
+            return self._run(stream_tokens)
+
+    def _run(self, stream_tokens: bool) -> str:
+        stream = getattr(self.client, "stream", None)
+        if self.on_token is None or stream is None or not stream_tokens:
+            return self.client.send(self.buffer.snapshot())
+        parts: List[str] = []
+        for token in stream(self.buffer.snapshot()):
+            parts.append(token)
+            self.on_token(token)
+        return "".join(parts).strip()
+
+
+@dataclass
+class SpeculationStats:
+    started: int = 0
+    used: int = 0
+    wasted: int = 0
+    cancelled_in_flight: int = 0
+
+
+class SpeculativeAnswer:
+    """QA completion started before the planner decided which agent to run.
+
+    Tokens are buffered until ``result`` attaches a sink; ``discard`` stops
+    reading the stream so the HTTP response is closed early.
+    """
+
+    def __init__(self, qa_agent: QuestionAnswerAgent, executor: Executor) -> None:
+        self.qa_agent = qa_agent
+        self._lock = threading.Lock()
+        self._tokens: List[str] = []
+        self._sink: Optional[Callable[[str], None]] = None
+        self._cancelled = threading.Event()
+        self.future: Future[str] = executor.submit(contextvars.copy_context().run, self._run)
+
+    def _run(self) -> str:
+        with tracing.usage_listener(self.qa_agent.buffer.cache_stats.record):
+            return self._collect()
+
+    def _collect(self) -> str:
+        client = self.qa_agent.client
+        messages = self.qa_agent.buffer.snapshot()
+        stream = getattr(client, "stream", None)
+        if stream is None:
+            return client.send(messages)
+        iterator = stream(messages)
+        try:
+            for token in iterator:
+                if self._cancelled.is_set():
+                    break
+                with self._lock:
+                    self._tokens.append(token)
+                    if self._sink is not None:
+                        self._sink(token)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        return "".join(self._tokens).strip()
+
+    def result(self, on_token: Optional[Callable[[str], None]] = None) -> str:
+        if on_token is not None:
+            with self._lock:
+                for token in self._tokens:
+                    on_token(token)
+                self._sink = on_token
+        return self.future.result()
+
+    def discard(self) -> bool:
+        """Cancels the speculative call; returns True if it was still running."""
+        self._cancelled.set()
+        if self.future.cancel():
+            return True
+        return not self.future.done()
+
+
+class Speculator:
+    """Starts QA answers in parallel with planning and counts wasted calls."""
+
+    def __init__(self, qa_agent: QuestionAnswerAgent, executor: Executor) -> None:
+        self.qa_agent = qa_agent
+        self.executor = executor
+        self.stats = SpeculationStats()
+
+    def start(self) -> SpeculativeAnswer:
+        self.stats.started += 1
+        return SpeculativeAnswer(self.qa_agent, self.executor)
 
-    def run(self) -> str:
-        return self.client.send(self.buffer.snapshot())
+    def use(self, answer: SpeculativeAnswer) -> str:
+        self.stats.used += 1
+        return answer.result(self.qa_agent.on_token)
+
+    def discard(self, answer: SpeculativeAnswer) -> None:
+        self.stats.wasted += 1
+        if answer.discard():
+            self.stats.cancelled_in_flight += 1
 
 
 class BrowserAgent:
-    """Agent that opens websites in the default system browser."""
+    """Agent that opens websites in the default system browser.
+
+    With ``dry_run`` the URL is validated and reported but not opened.
+    """
+
+    def __init__(self, dry_run: bool = False) -> None:
+        self.dry_run = dry_run
 
     def run(self, arguments: Dict[str, Any]) -> str:
         url = (arguments.get("url") or "").strip()
@@ -110,7 +636,10 @@ class BrowserAgent:
             raise ValueError("BrowserAgent требует поле 'url'.")
         if not url.startswith(("http://", "https://")):
             url = f"https://{url}"
-        webbrowser.open(url)
+        if not self.dry_run:
+            import webbrowser
+
+            webbrowser.open(url)
         tab_label = arguments.get("label")
         if tab_label:
             tab_label = str(tab_label).strip()
@@ -122,13 +651,445 @@ class BrowserAgent:
         return action_message
 
 
+@dataclass
+class StepResult:
+    step: PlanStep
+    reply: str
+    seconds: float = 0.0
+    error: bool = False
+
+
+@dataclass
+class StepStats:
+    plans: int = 0
+    steps: int = 0
+    failed: int = 0
+    wall_seconds: float = 0.0
+    step_seconds: float = 0.0
+
+    def record(self, wall_seconds: float, results: Sequence[StepResult]) -> None:
+        self.plans += 1
+        self.steps += len(results)
+        self.failed += sum(result.error for result in results)
+        self.wall_seconds += wall_seconds
+        self.step_seconds += sum(result.seconds for result in results)
+
+    @property
+    def saved_seconds(self) -> float:
+        return max(0.0, self.step_seconds - self.wall_seconds)
+
+
 class AgentRegistry:
-    def __init__(self, qa_agent: QuestionAnswerAgent, browser_agent: BrowserAgent) -> None:
+    """Maps plan agent names to agents.
+
+    ``qa`` is built in; every other agent is an extension from ``extensions``
+    that is imported and constructed on first dispatch. Unknown agents fall
+    back to QA. Steps of a multi-step plan run on ``step_executor`` as soon as
+    their dependencies finish (one after another without it); their replies
+    are merged in plan order and timings go to ``step_stats``.
+    """
+
+    def __init__(
+        self,
+        qa_agent: QuestionAnswerAgent,
+        extensions: Optional[ExtensionLoader] = None,
+        step_executor: Optional[Executor] = None,
+    ) -> None:
         self.qa_agent = qa_agent
-        self.browser_agent = browser_agent
+        self.extensions = extensions if extensions is not None else ExtensionLoader([])
+        self.step_executor = step_executor
+        self.step_stats = StepStats()
+
+    def resolves_to_qa(self, plan: AgentPlan) -> bool:
+        return not plan.steps and plan.agent not in self.extensions
+
+    def ready_to_dispatch(self, fields: Dict[str, Any]) -> bool:
+        """True once a partially parsed plan names an agent and holds the fields it needs."""
+        agent = str(fields.get("agent", "")).lower().strip()
+        spec = self.extensions.specs.get(agent)
+        return spec is None or not spec.required or "arguments" in fields
 
     def run(self, plan: AgentPlan) -> str:
-        if plan.agent == "browser":
-            return self.browser_agent.run(plan.arguments)
-        return self.qa_agent.run()
+        if plan.steps:
+            return self.run_steps(plan.steps)
+        with tracing.span("registry.run", agent=plan.agent):
+            if plan.agent in self.extensions:
+                return self.extensions.run(plan.agent, plan.arguments)
+            return self.qa_agent.run()
+
+    def run_steps(self, steps: Sequence[PlanStep]) -> str:
+        """Runs ``steps`` respecting ``depends_on`` and merges their replies.
+
+        A failed step does not stop the others; steps depending on it are
+        skipped. If dependencies form a cycle the first waiting step starts
+        anyway.
+        """
+        with tracing.span("registry.steps", steps=len(steps)) as steps_span:
+            started = time.perf_counter()
+            results: Dict[str, StepResult] = {}
+            waiting = list(steps)
+            running: Dict["Future[StepResult]", PlanStep] = {}
+            while waiting or running:
+                ready = [
+                    step
+                    for step in waiting
+                    if all(dependency in results for dependency in step.depends_on)
+                ]
+                if not ready and not running:
+                    ready = waiting[:1]
+                for step in ready:
+                    waiting.remove(step)
+                    failed = [
+                        dependency
+                        for dependency in step.depends_on
+                        if dependency in results and results[dependency].error
+                    ]
+                    if failed:
+                        reply = f"[Шаг {step.id} пропущен: не выполнен шаг {failed[0]}]"
+                        results[step.id] = StepResult(step, reply, error=True)
+                    else:
+                        running[self._submit_step(step)] = step
+                if running:
+                    done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results[running.pop(future).id] = future.result()
+            wall_seconds = time.perf_counter() - started
+            ordered = [results[step.id] for step in steps]
+            self.step_stats.record(wall_seconds, ordered)
+            steps_span.set(
+                wall_seconds=wall_seconds,
+                step_seconds=sum(result.seconds for result in ordered),
+                failed=sum(result.error for result in ordered),
+            )
+            return "\n".join(result.reply for result in ordered if result.reply)
+
+    def _submit_step(self, step: PlanStep) -> "Future[StepResult]":
+        if self.step_executor is None:
+            finished: "Future[StepResult]" = Future()
+            finished.set_result(self._run_step(step))
+            return finished
+        context = contextvars.copy_context()
+        return self.step_executor.submit(context.run, self._run_step, step)
+
+    def _run_step(self, step: PlanStep) -> StepResult:
+        started = time.perf_counter()
+        try:
+            with tracing.span("registry.step", step=step.id, agent=step.agent):
+                if step.agent in self.extensions:
+                    reply = self.extensions.run(step.agent, step.arguments)
+                else:
+                    # Step replies are shown together once all steps finish, so QA does not stream.
+                    reply = self.qa_agent.run(stream_tokens=False)
+        except Exception as exc:  # noqa: BLE001
+            reply = f"[Ошибка агента {step.agent}] {exc}"
+            return StepResult(step, reply, time.perf_counter() - started, error=True)
+        return StepResult(step, reply, time.perf_counter() - started)
+
+
+def select_user_reply(plan: AgentPlan, agent_reply: str) -> str:
+    if plan.steps:
+        return "\n".join(part for part in (plan.user_visible_message, agent_reply) if part)
+    if plan.agent == "qa":
+        return agent_reply
+    if plan.user_visible_message:
+        return plan.user_visible_message
+    return agent_reply
+
+
+@dataclass
+class TurnResult:
+    plan: AgentPlan
+    reply: str
+    error: bool = False
+
+
+def recall_memory(memory: Any, buffer: ConversationBuffer, user_prompt: str) -> None:
+    """Puts long-term memory snippets relevant to ``user_prompt`` into ``buffer.recall``.
+
+    Memory rows from the first stored message still present in the buffer
+    onward are skipped, so only turns that have already left the window (or
+    been summarized) are recalled.
+    """
+    if memory is None:
+        return
+    with tracing.span("memory.recall") as recall_span:
+        first_stored = next(
+            (message.memory_id for message in buffer.history() if message.memory_id is not None),
+            None,
+        )
+        buffer.recall = memory.recall_block(user_prompt, exclude_from=first_stored)
+        recall_span.set(hit=buffer.recall is not None)
+
+
+def remember_turn(
+    memory: Any, buffer: ConversationBuffer, user_prompt: str, result: TurnResult
+) -> None:
+    """Stores the turn and tags its buffer messages with their memory row ids."""
+    if memory is None or result.error:
+        return
+    untagged = {
+        ("user", user_prompt): memory.append("user", user_prompt),
+        ("assistant", result.reply): memory.append("assistant", result.reply),
+    }
+    for message in reversed(buffer.history()):
+        if not untagged:
+            break
+        memory_id = untagged.pop((message.role, message.content), None)
+        if memory_id is not None and message.memory_id is None:
+            message.memory_id = memory_id
+
+
+class Dispatcher:
+    """Runs one user turn: fast-path routing or planning, then the chosen agent.
+
+    Optional components are duck-typed: ``fast_router`` (``route`` and
+    ``record_planner_call``), ``speculator`` and history ``compressors``
+    (``maybe_compress``). With ``plan_executor`` the planner completion is
+    streamed and parsed incrementally, and the agent starts as soon as the
+    plan names it and its arguments. ``memory`` (``recall_block`` and
+    ``append``) stores every turn and feeds relevant past turns to the agent.
+    :meth:`plan_ahead` plans a prompt before its turn, and
+    ``handle(prompt, planned)`` then skips planning.
+    """
+
+    def __init__(
+        self,
+        planner: Planner,
+        registry: AgentRegistry,
+        user_buffer: ConversationBuffer,
+        planner_buffer: ConversationBuffer,
+        fast_router: Any = None,
+        speculator: Optional[Speculator] = None,
+        compressors: Sequence[Any] = (),
+        on_notice: Callable[[str], None] = print,
+        plan_executor: Optional[Executor] = None,
+        memory: Any = None,
+    ) -> None:
+        self.planner = planner
+        self.registry = registry
+        self.user_buffer = user_buffer
+        self.planner_buffer = planner_buffer
+        self.fast_router = fast_router
+        self.speculator = speculator
+        self.compressors = list(compressors)
+        self.on_notice = on_notice
+        self.plan_executor = plan_executor
+        self.memory = memory
+
+    def _plan(self, get_plan: Callable[[], AgentPlan]) -> AgentPlan:
+        started = time.perf_counter()
+        try:
+            plan = get_plan()
+        except self.planner.error_cls as exc:
+            self.on_notice(f"[Планировщик] {exc} — переключаюсь в режим QA.")
+            plan = AgentPlan(agent="qa", arguments={}, user_visible_message=None)
+        if self.fast_router is not None:
+            self.fast_router.record_planner_call(time.perf_counter() - started)
+        return plan
+
+    def plan_ahead(self, user_prompt: str, executor: Executor) -> "Future[AgentPlan]":
+        """Starts planning ``user_prompt`` before its turn, e.g. on a partial voice transcript.
+
+        The planner sees the current history plus the prompt; neither buffer
+        changes. Pass the result to :meth:`handle` as ``planned`` if the prompt
+        turns out unchanged. The history snapshot is taken before returning.
+        """
+        if self.fast_router is not None:
+            plan = self.fast_router.route(user_prompt)
+            if plan is not None:
+                routed: "Future[AgentPlan]" = Future()
+                routed.set_result(plan)
+                return routed
+        messages = self.planner_buffer.snapshot()
+        messages.append(Message("user", f"Пользователь: {user_prompt}"))
+        return executor.submit(self._plan, lambda: self.planner.plan_messages(messages))
+
+    def handle(self, user_prompt: str, planned: Optional[AgentPlan] = None) -> TurnResult:
+        with tracing.span("turn") as turn_span:
+            recall_memory(self.memory, self.user_buffer, user_prompt)
+            try:
+                result = self._handle(user_prompt, planned)
+            finally:
+                self.user_buffer.recall = None
+            remember_turn(self.memory, self.user_buffer, user_prompt, result)
+            turn_span.set(agent=result.plan.agent, failed=result.error)
+            return result
+
+    def _handle(self, user_prompt: str, planned: Optional[AgentPlan] = None) -> TurnResult:
+        self.user_buffer.add_user(user_prompt)
+        self.planner_buffer.add_user(f"Пользователь: {user_prompt}")
+
+        plan = planned
+        if plan is None and self.fast_router is not None:
+            with tracing.span("fast_path") as route_span:
+                plan = self.fast_router.route(user_prompt)
+                route_span.set(hit=plan is not None)
+        speculation = (
+            self.speculator.start() if self.speculator is not None and plan is None else None
+        )
+        plan_stream: Optional[PlanStream] = None
+        try:
+            if plan is None and self.plan_executor is not None:
+                plan_stream = self.planner.stream_plan(
+                    self.plan_executor, self.registry.ready_to_dispatch
+                )
+                plan = self._plan(plan_stream.early_plan)
+            elif plan is None:
+                plan = self._plan(self.planner.plan)
+
+            try:
+                if speculation is not None and self.registry.resolves_to_qa(plan):
+                    answer, speculation = speculation, None
+                    with tracing.span("speculation.use"):
+                        agent_reply = self.speculator.use(answer)
+                else:
+                    if speculation is not None:
+                        answer, speculation = speculation, None
+                        self.speculator.discard(answer)
+                    agent_reply = self.registry.run(plan)
+            except Exception as exc:  # noqa: BLE001
+                error_message = f"[Ошибка агента {plan.agent}] {exc}"
+                self.user_buffer.add_assistant(error_message)
+                self.planner_buffer.add_assistant(error_message)
+                return TurnResult(plan=plan, reply=error_message, error=True)
+        finally:
+            # Planning may fail with anything, not only ``error_cls``; the
+            # speculative answer must not keep streaming after the turn ends.
+            if speculation is not None:
+                self.speculator.discard(speculation)
+
+        if plan_stream is not None:
+            plan = self._complete_plan(plan, plan_stream)
+        final_reply = select_user_reply(plan, agent_reply)
+        self.user_buffer.add_assistant(final_reply)
+        agents = ", ".join(f"'{step.agent}'" for step in plan.steps) or f"'{plan.agent}'"
+        self.planner_buffer.add_assistant(f"Агент {agents} завершил действие. Ответ: {final_reply}")
+        ext_call = not self.registry.resolves_to_qa(plan)
+        for compressor in self.compressors:
+            compressor.maybe_compress(ext_call=ext_call)
+        return TurnResult(plan=plan, reply=final_reply)
+
+    def _complete_plan(self, plan: AgentPlan, plan_stream: PlanStream) -> AgentPlan:
+        """Waits for the rest of a streamed plan to pick up ``user_visible_message``."""
+        try:
+            final = plan_stream.final_plan()
+        except self.planner.error_cls:
+            return plan
+        return AgentPlan(plan.agent, plan.arguments, final.user_visible_message, plan.steps)
+
+
+def plan_from_tool_message(message: Dict[str, Any]) -> AgentPlan:
+    """Turns an assistant message from a tools request into a plan.
+
+    A tool call names the agent and carries its JSON arguments; text sent
+    alongside it becomes ``user_visible_message``. Several tool calls become
+    independent steps of one plan. Without a tool call the message is a direct
+    QA answer held in ``user_visible_message``.
+    """
+    content = (message.get("content") or "").strip() or None
+    steps: List[Dict[str, Any]] = []
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function") or {}
+        name = str(function.get("name") or "").lower().strip()
+        if not name:
+            continue
+        raw_arguments = function.get("arguments") or "{}"
+        if isinstance(raw_arguments, dict):
+            arguments = raw_arguments
+        else:
+            arguments = parse_first_object(str(raw_arguments)) or {}
+        steps.append({"id": tool_call.get("id"), "agent": name, "arguments": arguments})
+    if not steps:
+        return AgentPlan(agent="qa", arguments={}, user_visible_message=content)
+    return Planner.build_plan({"steps": steps, "user_visible_message": content})
+
+
+class ToolCallingDispatcher:
+    """Single-call mode: one completion on the chat buffer with agents exposed as tools.
+
+    The model either answers directly (one request per QA turn instead of a
+    planner call plus a QA call) or returns a tool call that is routed through
+    the registry. There is no planner buffer; ``fast_router``,
+    ``compressors`` and ``memory`` work as in :class:`Dispatcher`.
+    """
+
+    speculator: Optional[Speculator] = None
+    plan_executor: Optional[Executor] = None
+    planner_buffer: Optional[ConversationBuffer] = None
+
+    def __init__(
+        self,
+        client: ToolCallingBackend,
+        registry: AgentRegistry,
+        user_buffer: ConversationBuffer,
+        tools: List[Dict[str, Any]],
+        fast_router: Any = None,
+        compressors: Sequence[Any] = (),
+        on_notice: Callable[[str], None] = print,
+        memory: Any = None,
+    ) -> None:
+        self.client = client
+        self.registry = registry
+        self.user_buffer = user_buffer
+        self.tools = tools
+        self.fast_router = fast_router
+        self.compressors = list(compressors)
+        self.on_notice = on_notice
+        self.memory = memory
+
+    def handle(self, user_prompt: str) -> TurnResult:
+        with tracing.span("turn", mode="tools") as turn_span:
+            recall_memory(self.memory, self.user_buffer, user_prompt)
+            try:
+                result = self._handle(user_prompt)
+            finally:
+                self.user_buffer.recall = None
+            remember_turn(self.memory, self.user_buffer, user_prompt, result)
+            turn_span.set(agent=result.plan.agent, failed=result.error)
+            return result
+
+    def _complete(self) -> AgentPlan:
+        with tracing.span("tools.complete"), tracing.usage_listener(
+            self.user_buffer.cache_stats.record
+        ):
+            message = self.client.send_with_tools(self.user_buffer.snapshot(), self.tools)
+        return plan_from_tool_message(message)
+
+    def _handle(self, user_prompt: str) -> TurnResult:
+        self.user_buffer.add_user(user_prompt)
+
+        plan = None
+        if self.fast_router is not None:
+            with tracing.span("fast_path") as route_span:
+                plan = self.fast_router.route(user_prompt)
+                route_span.set(hit=plan is not None)
+
+        try:
+            if plan is None:
+                plan = self._complete()
+                answered = plan.agent == "qa" and plan.user_visible_message is not None
+            else:
+                answered = False
+            if answered:
+                agent_reply = plan.user_visible_message or ""
+                on_token = self.registry.qa_agent.on_token
+                if on_token is not None:
+                    on_token(agent_reply)
+            else:
+                agent_reply = self.registry.run(plan)
+        except Exception as exc:  # noqa: BLE001
+            agent = plan.agent if plan is not None else "qa"
+            error_message = f"[Ошибка агента {agent}] {exc}"
+            self.user_buffer.add_assistant(error_message)
+            return TurnResult(
+                plan=plan or AgentPlan(agent="qa", arguments={}),
+                reply=error_message,
+                error=True,
+            )
 
+        final_reply = select_user_reply(plan, agent_reply)
+        self.user_buffer.add_assistant(final_reply)
+        ext_call = not self.registry.resolves_to_qa(plan)
+        for compressor in self.compressors:
+            compressor.maybe_compress(ext_call=ext_call)
+        return TurnResult(plan=plan, reply=final_reply)
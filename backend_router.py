@@ -0,0 +1,266 @@
+"""Маршрутизация запросов между несколькими бэкендами (моделями или эндпоинтами).
+
+`BackendRouter` держит набор клиентов с интерфейсом ChatBackend и для каждой
+роли (planner, qa, summarizer) — свой список кандидатов. По каждому бэкенду
+ведутся отдельные EWMA полного ответа и времени до первого токена потока и
+EWMA доли ошибок. Стратегия `fastest` выбирает самый быстрый здоровый бэкенд
+(для потока — по первому токену, для остальных вызовов — по полному ответу),
+`failover` — первый здоровый по порядку маршрута. При ошибке клиента с
+`retryable=True` (сеть, 429, 5xx) запрос уходит следующему кандидату; ошибки
+самого запроса (`retryable=False`, например 400) и прочие исключения
+возвращаются сразу и здоровье бэкенда не портят. После ошибки бэкенд
+пропускается `cooldown` секунд, а доля ошибок со временем затухает (период
+полураспада `error_half_life`), так что бэкенд возвращается в ротацию и без
+успешных вызовов. Каждые `explore_every` вызовов роли один уходит давно не
+использованному бэкенду, чтобы его оценка не устаревала.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence
+
+import tracing
+
+FASTEST = "fastest"
+FAILOVER = "failover"
+
+
+@dataclass
+class RoutingPolicy:
+    strategy: str = FASTEST
+    alpha: float = 0.2
+    max_error_rate: float = 0.5
+    cooldown: float = 30.0
+    error_half_life: float = 60.0
+    explore_every: int = 20
+
+
+def _fails_over(exc: BaseException) -> bool:
+    """Переключаться на другой бэкенд стоит только при повторяемой ошибке клиента."""
+    return getattr(exc, "retryable", False) is True
+
+
+class BackendHealth:
+    """EWMA задержки и ошибок одного бэкенда и счётчики выбора."""
+
+    def __init__(self, name: str, alpha: float, half_life: float = 0.0) -> None:
+        self.name = name
+        self.alpha = alpha
+        self.half_life = half_life
+        self.latency: Optional[float] = None
+        self.first_token: Optional[float] = None
+        self.error_rate = 0.0
+        self.selected = 0
+        self.failures = 0
+        self.last_used = 0.0
+        self.last_failure: Optional[float] = None
+        self._error_updated = 0.0
+        self._lock = threading.Lock()
+
+    def mark_selected(self, now: float) -> None:
+        with self._lock:
+            self.selected += 1
+            self.last_used = now
+
+    def _ewma(self, current: Optional[float], seconds: float) -> float:
+        return seconds if current is None else self.alpha * seconds + (1 - self.alpha) * current
+
+    def record_success(self, seconds: float) -> None:
+        """Полный ответ (или весь поток) за `seconds`."""
+        with self._lock:
+            self.latency = self._ewma(self.latency, seconds)
+            self.error_rate *= 1 - self.alpha
+            self.last_failure = None
+        tracing.set_gauge("backend_latency_ewma_seconds", self.latency, backend=self.name)
+
+    def record_first_token(self, seconds: float) -> None:
+        with self._lock:
+            self.first_token = self._ewma(self.first_token, seconds)
+        tracing.set_gauge("backend_ttft_ewma_seconds", self.first_token, backend=self.name)
+
+    def estimate(self, streaming: bool) -> float:
+        """Оценка для сортировки; бэкенд без замеров идёт первым, чтобы его измерить."""
+        value = self.first_token if streaming else self.latency
+        return value or 0.0
+
+    def error_rate_at(self, now: float) -> float:
+        """Доля ошибок с учётом затухания со времени последней ошибки."""
+        if self.half_life <= 0:
+            return self.error_rate
+        elapsed = max(now - self._error_updated, 0.0)
+        return self.error_rate * 0.5 ** (elapsed / self.half_life)
+
+    def record_failure(self, now: float) -> None:
+        with self._lock:
+            self.failures += 1
+            self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate_at(now)
+            self._error_updated = now
+            self.last_failure = now
+        tracing.set_gauge("backend_error_rate_ewma", self.error_rate, backend=self.name)
+
+    def healthy(self, policy: RoutingPolicy, now: float) -> bool:
+        if self.last_failure is not None and now - self.last_failure < policy.cooldown:
+            return False
+        return self.error_rate_at(now) < policy.max_error_rate
+
+
+class BackendRouter:
+    def __init__(
+        self,
+        backends: Dict[str, Any],
+        routes: Dict[str, Sequence[str]],
+        policy: Optional[RoutingPolicy] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        unknown = {name for names in routes.values() for name in names} - set(backends)
+        if unknown:
+            raise ValueError(
+                f"В маршрутах указаны неизвестные бэкенды: {', '.join(sorted(unknown))}"
+            )
+        self.backends = backends
+        self.routes = {role: list(names) for role, names in routes.items()}
+        self.policy = policy or RoutingPolicy()
+        self.clock = clock
+        self.health = {
+            name: BackendHealth(name, self.policy.alpha, self.policy.error_half_life)
+            for name in backends
+        }
+        self._json_backends: Dict[str, Any] = {}
+        self._role_calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def for_role(self, role: str) -> "RoutedBackend":
+        return RoutedBackend(self, role)
+
+    def candidates(self, role: str, streaming: bool = False) -> List[str]:
+        """Бэкенды роли в порядке попыток: выбранный стратегией, затем остальные."""
+        names = self.routes.get(role) or self.routes.get("default") or list(self.backends)
+        now = self.clock()
+        healthy = [name for name in names if self.health[name].healthy(self.policy, now)]
+        with self._lock:
+            calls = self._role_calls[role] = self._role_calls.get(role, 0) + 1
+        if not healthy:
+            return list(names)
+        if self.policy.strategy == FASTEST:
+            healthy.sort(key=lambda name: self.health[name].estimate(streaming))
+            if self.policy.explore_every and calls % self.policy.explore_every == 0:
+                stale = min(healthy, key=lambda name: self.health[name].last_used)
+                healthy.remove(stale)
+                healthy.insert(0, stale)
+        return healthy + [name for name in names if name not in healthy]
+
+    def backend(self, name: str, json_mode: bool) -> Any:
+        if not json_mode:
+            return self.backends[name]
+        backend = self._json_backends.get(name)
+        if backend is None:
+            backend = self._json_backends[name] = self.backends[name].with_json_mode()
+        return backend
+
+    def call(self, role: str, json_mode: bool, request: Callable[[Any], Any]) -> Any:
+        """Выполняет `request(backend)` на кандидатах роли до первого успеха."""
+        errors: List[Exception] = []
+        for name in self.candidates(role):
+            health = self.health[name]
+            started = self.clock()
+            health.mark_selected(started)
+            try:
+                with tracing.span("router.call", role=role, backend=name):
+                    result = request(self.backend(name, json_mode))
+            except Exception as exc:  # noqa: BLE001
+                if not _fails_over(exc):
+                    raise
+                health.record_failure(self.clock())
+                errors.append(exc)
+                continue
+            health.record_success(self.clock() - started)
+            return result
+        raise errors[-1]
+
+    def stream(
+        self, role: str, json_mode: bool, messages: Sequence[Mapping[str, str]]
+    ) -> Iterator[str]:
+        """Поток с переключением на следующий бэкенд, пока не пришёл первый токен."""
+        errors: List[Exception] = []
+        for name in self.candidates(role, streaming=True):
+            health = self.health[name]
+            started = self.clock()
+            health.mark_selected(started)
+            first = True
+            try:
+                for token in self.backend(name, json_mode).stream(messages):
+                    if first:
+                        health.record_first_token(self.clock() - started)
+                        first = False
+                    yield token
+            except Exception as exc:  # noqa: BLE001
+                if not _fails_over(exc):
+                    raise
+                health.record_failure(self.clock())
+                if not first:
+                    raise
+                errors.append(exc)
+                continue
+            health.record_success(self.clock() - started)
+            return
+        raise errors[-1]
+
+    def warm_up(self) -> bool:
+        """Прогревает соединения всех бэкендов; True, если удалось со всеми."""
+        results = [
+            getattr(backend, "warm_up", lambda: True)() for backend in self.backends.values()
+        ]
+        return all(results)
+
+    def summary(self) -> List[str]:
+        lines = []
+        now = self.clock()
+        for name, health in self.health.items():
+            latency = f"{health.latency * 1000:.0f} мс" if health.latency is not None else "—"
+            first_token = (
+                f"{health.first_token * 1000:.0f} мс" if health.first_token is not None else "—"
+            )
+            lines.append(
+                f"{name}: выбран {health.selected} раз, ошибок {health.failures}, "
+                f"EWMA ответа {latency}, первого токена {first_token}, "
+                f"доля ошибок EWMA {health.error_rate_at(now):.0%}"
+            )
+        return lines
+
+
+class RoutedBackend:
+    """ChatBackend одной роли поверх `BackendRouter`.
+
+    Прочие атрибуты (`model`, `stats`, `response_format`) берутся у первого
+    бэкенда маршрута в том же режиме (JSON или обычном).
+    """
+
+    def __init__(self, router: BackendRouter, role: str, json_mode: bool = False) -> None:
+        self.router = router
+        self.role = role
+        self.json_mode = json_mode
+
+    def __getattr__(self, name: str) -> Any:
+        names = self.router.routes.get(self.role) or list(self.router.backends)
+        return getattr(self.router.backend(names[0], self.json_mode), name)
+
+    def with_json_mode(self) -> "RoutedBackend":
+        return RoutedBackend(self.router, self.role, json_mode=True)
+
+    def send(self, messages: Sequence[Mapping[str, str]]) -> str:
+        return self.router.call(self.role, self.json_mode, lambda backend: backend.send(messages))
+
+    def send_with_tools(
+        self, messages: Sequence[Mapping[str, str]], tools: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        return self.router.call(
+            self.role, self.json_mode, lambda backend: backend.send_with_tools(messages, tools)
+        )
+
+    def stream(self, messages: Sequence[Mapping[str, str]]) -> Iterator[str]:
+        return self.router.stream(self.role, self.json_mode, messages)
+
+    def warm_up(self) -> bool:
+        return self.router.warm_up()
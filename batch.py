@@ -0,0 +1,266 @@
+"""Пакетный прогон пользовательских фраз из JSONL через Planner и AgentRegistry.
+
+Каждая строка входного файла — отдельная фраза со своими буферами истории.
+Фразы обрабатываются пулом потоков с ограничением параллелизма и частоты
+запросов; результаты дописываются в выходной JSONL по мере готовности.
+Повторный запуск с тем же выходным файлом пропускает уже обработанные id,
+поэтому прогон можно продолжить после сбоя. Фразы, последний результат
+которых записан с ошибкой, выполняются заново (`--no-retry-failed` отключает).
+
+Запуск: python batch.py prompts.jsonl results.jsonl --concurrency 4 --rate 2 --dry-run
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+from agents import (
+    AgentRegistry,
+    ChatBackend,
+    ConversationBuffer,
+    Dispatcher,
+    Planner,
+    QuestionAnswerAgent,
+)
+from extensions import ExtensionLoader, default_extensions, with_catalog
+
+ID_FIELDS = ("id", "request_id")
+PROMPT_FIELDS = ("prompt", "text", "body")
+
+
+@dataclass
+class BatchSettings:
+    system_prompt: str
+    planner_system_prompt: str
+    chat_history_limit: int
+    planner_history_limit: int
+    concurrency: int = 4
+    rate_per_second: Optional[float] = None
+    dry_run: bool = True
+    retry_failed: bool = True
+
+
+@dataclass
+class BatchSummary:
+    processed: int = 0
+    skipped: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.processed / self.seconds if self.seconds else 0.0
+
+
+class RateLimiter:
+    """Равномерно распределяет старты не чаще `rate_per_second` раз в секунду."""
+
+    def __init__(self, rate_per_second: Optional[float]) -> None:
+        self.interval = 1.0 / rate_per_second if rate_per_second else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def read_prompts(stream: TextIO) -> Iterator[Tuple[str, str]]:
+    """Отдаёт пары (id, текст); id по умолчанию — номер строки."""
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        record_id = next((record[key] for key in ID_FIELDS if key in record), line_number)
+        prompt = next((record[key] for key in PROMPT_FIELDS if key in record), None)
+        if prompt is None:
+            raise ValueError(f"Строка {line_number}: нет ни одного из полей {PROMPT_FIELDS}")
+        yield str(record_id), str(prompt)
+
+
+def completed_ids(path: str, retry_failed: bool = True) -> Set[str]:
+    """Id уже записанных результатов; оборванная последняя строка игнорируется.
+
+    С `retry_failed` id, чья последняя запись содержит ошибку, не считаются
+    готовыми: временный сбой API не должен навсегда остаться в результатах.
+    """
+    done: Set[str] = set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    record_id = str(record["id"])
+                    failed = retry_failed and bool(record.get("error"))
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    continue
+                if failed:
+                    done.discard(record_id)
+                else:
+                    done.add(record_id)
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def run_prompt(
+    client: ChatBackend,
+    settings: BatchSettings,
+    extensions: ExtensionLoader,
+    record_id: str,
+    prompt: str,
+    error_cls: type[Exception] = RuntimeError,
+) -> Dict[str, Any]:
+    user_buffer = ConversationBuffer(settings.system_prompt, settings.chat_history_limit)
+    planner_buffer = ConversationBuffer(
+        with_catalog(settings.planner_system_prompt, list(extensions.specs.values())),
+        settings.planner_history_limit,
+    )
+    notices: List[str] = []
+    dispatcher = Dispatcher(
+        planner=Planner(client=client, buffer=planner_buffer, error_cls=error_cls),
+        registry=AgentRegistry(
+            qa_agent=QuestionAnswerAgent(client=client, buffer=user_buffer),
+            extensions=extensions,
+        ),
+        user_buffer=user_buffer,
+        planner_buffer=planner_buffer,
+        on_notice=notices.append,
+    )
+    started = time.perf_counter()
+    result = dispatcher.handle(prompt)
+    return {
+        "id": record_id,
+        "prompt": prompt,
+        "agent": result.plan.agent,
+        "arguments": result.plan.arguments,
+        "reply": result.reply,
+        "error": result.error,
+        "notices": notices,
+        "seconds": round(time.perf_counter() - started, 4),
+    }
+
+
+def run_batch(
+    client: ChatBackend,
+    settings: BatchSettings,
+    extensions: ExtensionLoader,
+    input_path: str,
+    output_path: str,
+    error_cls: type[Exception] = RuntimeError,
+    limit: Optional[int] = None,
+) -> BatchSummary:
+    summary = BatchSummary()
+    done = completed_ids(output_path, settings.retry_failed)
+    limiter = RateLimiter(settings.rate_per_second)
+    window = max(settings.concurrency * 2, 1)
+    started = time.perf_counter()
+
+    def task(record_id: str, prompt: str) -> Dict[str, Any]:
+        limiter.acquire()
+        return run_prompt(client, settings, extensions, record_id, prompt, error_cls)
+
+    def drain(futures: Set[Future[Dict[str, Any]]], out: TextIO, block_all: bool) -> None:
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                futures.discard(future)
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                summary.processed += 1
+                summary.failed += int(record["error"])
+            if not block_all and len(futures) < window:
+                return
+
+    with open(input_path, "r", encoding="utf-8") as source, open(
+        output_path, "a", encoding="utf-8"
+    ) as out, ThreadPoolExecutor(max_workers=settings.concurrency) as executor:
+        futures: Set[Future[Dict[str, Any]]] = set()
+        submitted = 0
+        for record_id, prompt in read_prompts(source):
+            if record_id in done:
+                summary.skipped += 1
+                continue
+            if limit is not None and submitted >= limit:
+                break
+            futures.add(executor.submit(task, record_id, prompt))
+            submitted += 1
+            if len(futures) >= window:
+                drain(futures, out, block_all=False)
+        drain(futures, out, block_all=True)
+
+    summary.seconds = time.perf_counter() - started
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пакетный прогон фраз через планировщик и агентов")
+    parser.add_argument("input", help="JSONL с полями id/request_id и prompt/text/body")
+    parser.add_argument(
+        "output", help="JSONL с результатами (дописывается, по id действует последняя запись)"
+    )
+    parser.add_argument(
+        "--no-retry-failed",
+        action="store_true",
+        help="не повторять фразы, уже записанные с ошибкой",
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=None, help="запросов в секунду (фраз)")
+    parser.add_argument("--limit", type=int, default=None, help="обработать не больше N фраз")
+    parser.add_argument(
+        "--execute",
+        action="store_true",
+        help="реально выполнять побочные действия агентов (по умолчанию dry-run)",
+    )
+    args = parser.parse_args()
+
+    from chat import DeepSeekClientError, build_client
+    from settings import (
+        CHAT_HISTORY_LIMIT,
+        PLANNER_HISTORY_LIMIT,
+        PLANNER_SYSTEM_PROMPT,
+        SYSTEM_PROMPT,
+    )
+
+    settings = BatchSettings(
+        system_prompt=SYSTEM_PROMPT,
+        planner_system_prompt=PLANNER_SYSTEM_PROMPT,
+        chat_history_limit=CHAT_HISTORY_LIMIT,
+        planner_history_limit=PLANNER_HISTORY_LIMIT,
+        concurrency=args.concurrency,
+        rate_per_second=args.rate,
+        dry_run=not args.execute,
+        retry_failed=not args.no_retry_failed,
+    )
+    extensions = default_extensions({"dry_run": settings.dry_run})
+    summary = run_batch(
+        build_client(),
+        settings,
+        extensions,
+        args.input,
+        args.output,
+        DeepSeekClientError,
+        args.limit,
+    )
+    print(
+        f"Обработано: {summary.processed}, пропущено (уже готово): {summary.skipped}, "
+        f"с ошибкой: {summary.failed}, время: {summary.seconds:.1f} с, "
+        f"{summary.throughput:.2f} фраз/с"
+    )
+
+
+if __name__ == "__main__":
+    main()
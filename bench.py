@@ -0,0 +1,381 @@
+"""Бенчмарк собственного кода диспетчера на локальной подмене DeepSeek.
+
+Запускает MockDeepSeekServer с заданной задержкой, джиттером, долей ошибок и
+темпом потока, прогоняет этапы (буфер, сборка тела запроса на длинной истории,
+клиент, поток, планировщик, полный ход в режиме планировщика и в однозапросном
+режиме tools) и печатает пропускную способность, p50/p95/p99, число запросов
+к API на ход и выделенную память на операцию там, где она замеряется.
+Результат можно сохранить как базовую линию и сравнивать с ней следующие прогоны.
+
+Запуск: python bench.py --iterations 200 --latency 0.01 --save-baseline bench_baseline.json
+        python bench.py --iterations 200 --latency 0.01 --compare bench_baseline.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from agents import (
+    AgentRegistry,
+    ConversationBuffer,
+    Dispatcher,
+    Planner,
+    QuestionAnswerAgent,
+    ToolCallingDispatcher,
+)
+from extensions import default_extensions, tool_definitions
+from mock_server import MockBehavior, MockDeepSeekServer
+
+BENCH_SYSTEM_PROMPT = "Ты голосовой ассистент. Отвечай кратко."
+BENCH_PLANNER_PROMPT = (
+    'Выбери агента и ответь JSON: {"agent": "qa" | "browser", "arguments": {}, '
+    '"user_visible_message": "..."}'
+)
+
+
+@dataclass
+class StageResult:
+    name: str
+    samples: List[float] = field(default_factory=list)
+    errors: int = 0
+    wall_seconds: float = 0.0
+    requests: int = 0
+    allocated_bytes: float = 0.0
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(int(round(q / 100 * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[index]
+
+    @property
+    def throughput(self) -> float:
+        return len(self.samples) / self.wall_seconds if self.wall_seconds else 0.0
+
+    @property
+    def requests_per_op(self) -> float:
+        operations = len(self.samples) + self.errors
+        return self.requests / operations if operations else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "count": len(self.samples),
+            "errors": self.errors,
+            "throughput": self.throughput,
+            "requests_per_op": self.requests_per_op,
+            "allocated_bytes": self.allocated_bytes,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+def measure(
+    name: str,
+    operation: Callable[[], Any],
+    iterations: int,
+    warmup: int = 3,
+    request_counter: Optional[Callable[[], int]] = None,
+) -> StageResult:
+    """Замеряет `operation`; `request_counter` (счётчик запросов к API) даёт запросов на операцию."""
+    for _ in range(warmup):
+        try:
+            operation()
+        except Exception:  # noqa: BLE001
+            pass
+    result = StageResult(name)
+    requests_before = request_counter() if request_counter is not None else 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        try:
+            operation()
+        except Exception:  # noqa: BLE001
+            result.errors += 1
+            continue
+        result.samples.append(time.perf_counter() - call_started)
+    result.wall_seconds = time.perf_counter() - started
+    if request_counter is not None:
+        result.requests = request_counter() - requests_before
+    return result
+
+
+def measure_allocations(operation: Callable[[], Any], iterations: int = 20) -> float:
+    """Средний пик выделенной памяти за вызов `operation` (tracemalloc), в байтах."""
+    peaks: List[int] = []
+    tracemalloc.start()
+    try:
+        for _ in range(iterations):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            operation()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    return sum(peaks) / len(peaks) if peaks else 0.0
+
+
+def _history(size: int) -> List[Dict[str, str]]:
+    return [
+        {"role": "user" if index % 2 == 0 else "assistant", "content": f"Сообщение номер {index} " * 8}
+        for index in range(size)
+    ]
+
+
+def bench_buffer(iterations: int, history_size: int) -> StageResult:
+    buffer = ConversationBuffer(BENCH_SYSTEM_PROMPT, limit=history_size, token_budget=None)
+    for message in _history(history_size):
+        buffer.add(message["role"], message["content"])
+
+    def operation() -> None:
+        buffer.add_user("Какая сегодня погода?")
+        buffer.snapshot()
+
+    return measure("buffer_add_snapshot", operation, iterations)
+
+
+def bench_client(client: Any, iterations: int, history_size: int) -> List[StageResult]:
+    messages = [{"role": "system", "content": BENCH_SYSTEM_PROMPT}, *_history(history_size)]
+    send = measure("client_send", lambda: client.send(messages), iterations)
+
+    ttft = StageResult("client_stream_ttft")
+
+    def stream_operation() -> None:
+        for _ in client.stream(messages):
+            pass
+        if client.last_time_to_first_token is not None:
+            ttft.samples.append(client.last_time_to_first_token)
+
+    measure("client_stream_warmup", stream_operation, 3, warmup=0)
+    ttft.samples.clear()
+    stream = measure("client_stream", stream_operation, iterations, warmup=0)
+    ttft.wall_seconds = stream.wall_seconds
+    return [send, stream, ttft]
+
+
+def bench_planner(client: Any, iterations: int, history_size: int, error_cls: type) -> StageResult:
+    buffer = ConversationBuffer(BENCH_PLANNER_PROMPT, limit=history_size + 1)
+    for message in _history(history_size):
+        buffer.add(message["role"], message["content"])
+    planner = Planner(client=client, buffer=buffer, error_cls=error_cls)
+    return measure("planner_plan", planner.plan, iterations)
+
+
+def bench_request_body(iterations: int, history_size: int) -> List[StageResult]:
+    """Ход на длинной истории без сети: сообщение, снимок буфера и тело запроса.
+
+    `body_json_dumps` — прежний путь (словари и json.dumps всего списка),
+    `body_cached_bytes` — сообщения буфера с закэшированным JSON.
+    """
+    from chat import DeepSeekChatClient
+
+    client = DeepSeekChatClient("bench", "http://127.0.0.1", "deepseek-chat", 0.7, 256, 10)
+    buffer = ConversationBuffer(BENCH_SYSTEM_PROMPT, limit=history_size + 1)
+    for message in _history(history_size):
+        buffer.add(message["role"], message["content"])
+    prompts = iter(BENCH_TURN_PROMPTS * 10**6)
+
+    def json_dumps() -> None:
+        buffer.add_user(next(prompts))
+        payload = client._payload()
+        payload["messages"] = [
+            {"role": message["role"], "content": message["content"]}
+            for message in buffer.snapshot()
+        ]
+        json.dumps(payload).encode("utf-8")
+
+    def cached_bytes() -> None:
+        buffer.add_user(next(prompts))
+        client._body(buffer.snapshot())
+
+    results = []
+    for name, operation in (("body_json_dumps", json_dumps), ("body_cached_bytes", cached_bytes)):
+        result = measure(name, operation, iterations)
+        result.allocated_bytes = measure_allocations(operation)
+        results.append(result)
+    return results
+
+
+BENCH_TURN_PROMPTS = ("Расскажи что-нибудь интересное", "Открой сайт example.com")
+
+
+def _turn_operation(dispatcher: Any) -> Callable[[], None]:
+    prompts = iter(BENCH_TURN_PROMPTS * 10**6)
+
+    def operation() -> None:
+        if dispatcher.handle(next(prompts)).error:
+            raise RuntimeError("turn failed")
+
+    return operation
+
+
+def bench_turn(
+    client: Any,
+    iterations: int,
+    history_size: int,
+    error_cls: type,
+    request_counter: Optional[Callable[[], int]] = None,
+) -> StageResult:
+    """Полный ход в режиме планировщика: план и ответ агента — отдельные запросы."""
+    user_buffer = ConversationBuffer(BENCH_SYSTEM_PROMPT, history_size)
+    planner_buffer = ConversationBuffer(BENCH_PLANNER_PROMPT, history_size)
+    dispatcher = Dispatcher(
+        planner=Planner(client=client, buffer=planner_buffer, error_cls=error_cls),
+        registry=AgentRegistry(
+            qa_agent=QuestionAnswerAgent(client=client, buffer=user_buffer),
+            extensions=default_extensions({"dry_run": True}),
+        ),
+        user_buffer=user_buffer,
+        planner_buffer=planner_buffer,
+        on_notice=lambda message: None,
+    )
+    return measure(
+        "full_turn", _turn_operation(dispatcher), iterations, request_counter=request_counter
+    )
+
+
+def bench_tool_turn(
+    client: Any,
+    iterations: int,
+    history_size: int,
+    request_counter: Optional[Callable[[], int]] = None,
+) -> StageResult:
+    """Тот же ход в однозапросном режиме: агенты переданы модели как tools."""
+    user_buffer = ConversationBuffer(BENCH_SYSTEM_PROMPT, history_size)
+    extensions = default_extensions({"dry_run": True})
+    dispatcher = ToolCallingDispatcher(
+        client=client,
+        registry=AgentRegistry(
+            qa_agent=QuestionAnswerAgent(client=client, buffer=user_buffer),
+            extensions=extensions,
+        ),
+        user_buffer=user_buffer,
+        tools=tool_definitions(list(extensions.specs.values())),
+        on_notice=lambda message: None,
+    )
+    return measure(
+        "full_turn_tools", _turn_operation(dispatcher), iterations, request_counter=request_counter
+    )
+
+
+def print_report(results: List[StageResult]) -> None:
+    print(
+        f"{'этап':<22}{'n':>6}{'ошибок':>8}{'оп/с':>10}{'p50 мс':>10}{'p95 мс':>10}"
+        f"{'p99 мс':>10}{'запр/оп':>9}{'КБ/оп':>9}"
+    )
+    for result in results:
+        row = result.to_dict()
+        requests = f"{row['requests_per_op']:>9.2f}" if result.requests else f"{'—':>9}"
+        allocated = (
+            f"{result.allocated_bytes / 1024:>9.1f}" if result.allocated_bytes else f"{'—':>9}"
+        )
+        print(
+            f"{result.name:<22}{row['count']:>6}{row['errors']:>8}{row['throughput']:>10.1f}"
+            f"{row['p50'] * 1000:>10.3f}{row['p95'] * 1000:>10.3f}{row['p99'] * 1000:>10.3f}"
+            f"{requests}{allocated}"
+        )
+
+
+def save_baseline(path: str, results: List[StageResult], settings: Dict[str, Any]) -> None:
+    data = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "settings": settings,
+        "stages": {result.name: result.to_dict() for result in results},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def compare_with_baseline(
+    path: str, results: List[StageResult], threshold: float
+) -> List[str]:
+    """Печатает изменения p50/p95 относительно базовой линии; возвращает регрессии."""
+    with open(path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions: List[str] = []
+    print(f"\nСравнение с {path} ({baseline.get('created', '?')}):")
+    for result in results:
+        previous = baseline["stages"].get(result.name)
+        if previous is None:
+            continue
+        current = result.to_dict()
+        for metric in ("p50", "p95"):
+            before, after = previous[metric], current[metric]
+            if not before:
+                continue
+            change = (after - before) / before
+            marker = ""
+            if change > threshold:
+                marker = "  РЕГРЕССИЯ"
+                regressions.append(f"{result.name}.{metric}")
+            print(
+                f"  {result.name:<22}{metric}: {before * 1000:8.2f} → {after * 1000:8.2f} мс "
+                f"({change:+.1%}){marker}"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк диспетчера на локальной подмене DeepSeek")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--history", type=int, default=20, help="сообщений в истории")
+    parser.add_argument(
+        "--long-history", type=int, default=500, help="сообщений в истории для тела запроса"
+    )
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-interval", type=float, default=0.0)
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH")
+    parser.add_argument(
+        "--threshold", type=float, default=0.10, help="допустимый рост p50/p95 (доля)"
+    )
+    args = parser.parse_args()
+
+    from chat import DeepSeekChatClient, DeepSeekClientError
+
+    behavior = MockBehavior(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        token_interval=args.token_interval,
+    )
+    with MockDeepSeekServer(behavior) as server:
+        client = DeepSeekChatClient("bench", server.url, "deepseek-chat", 0.7, 256, 10)
+        results = [bench_buffer(args.iterations * 10, args.history)]
+        results += bench_request_body(args.iterations, args.long_history)
+        results += bench_client(client, args.iterations, args.history)
+        results.append(bench_planner(client, args.iterations, args.history, DeepSeekClientError))
+        def request_counter() -> int:
+            return server.requests_served
+
+        results.append(
+            bench_turn(
+                client, args.iterations, args.history, DeepSeekClientError, request_counter
+            )
+        )
+        results.append(bench_tool_turn(client, args.iterations, args.history, request_counter))
+
+    print_report(results)
+    settings = {key: value for key, value in vars(args).items() if key not in {"save_baseline", "compare"}}
+    regressions: List[str] = []
+    if args.compare:
+        regressions = compare_with_baseline(args.compare, results, args.threshold)
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results, settings)
+        print(f"\nБазовая линия сохранена в {args.save_baseline}")
+    if regressions:
+        print(f"\nРегрессии: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,32 @@
 
 from __future__ import annotations
 
+import argparse
+import contextvars
+import copy
+import json
 import sys
-from typing import List, Dict, Any
-
-import requests
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    TypeVar,
+    Union,
+)
 
-from config import (
+from settings import (
     DEEPSEEK_API_KEY,
     DEEPSEEK_API_URL,
     DEEPSEEK_MODEL,
@@ -17,31 +37,121 @@ from config import (
     PLANNER_SYSTEM_PROMPT,
     CHAT_HISTORY_LIMIT,
     PLANNER_HISTORY_LIMIT,
+    CHAT_TOKEN_BUDGET,
+    PLANNER_TOKEN_BUDGET,
+    HISTORY_EVICTION_CHUNK,
+    STREAM_RESPONSES,
+    SPECULATIVE_QA,
+    FAST_PATH_ROUTER,
+    FAST_PATH_THRESHOLD,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_TTL,
+    MEMORY_ENABLED,
+    MEMORY_PATH,
+    MEMORY_TOP_K,
+    SCHEDULER_ENABLED,
+    SCHEDULER_REQUESTS_PER_MINUTE,
+    SCHEDULER_TOKENS_PER_MINUTE,
+    SCHEDULER_MAX_CONCURRENT,
+    SCHEDULER_BACKGROUND_CONCURRENCY,
+    LLM_BACKENDS,
+    LLM_ROUTES,
+    LLM_ROUTING_STRATEGY,
+    LLM_BACKEND_COOLDOWN,
+    VOICE_SAMPLE_RATE,
+    VOICE_ENERGY_THRESHOLD_DB,
+    VOICE_PAUSE_MS,
+    VOICE_HANGOVER_MS,
+    VOICE_STT_MODEL,
+    VOICE_LANGUAGE,
+    VOICE_PLAN_ON_PARTIAL,
+    SESSION_TRACE_DIR,
+    CHAT_COMPRESSION_ENABLED,
+    PLANNER_COMPRESSION_ENABLED,
+    COMPRESSION_TRIGGER_MESSAGES,
+    STREAMING_PLANNER,
+    PLAN_STEP_WORKERS,
+    DISPATCH_MODE,
+    WARM_UP_CONNECTION,
+    EXTENSIONS_MANIFEST,
+    EXTENSION_ENTRY_POINT_GROUP,
+    TRACE_PATH,
+    METRICS_PATH,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_BASE_DELAY,
+    HEDGE_REQUESTS,
+    HEDGE_MIN_DELAY,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
 )
 from agents import (
-    AgentPlan,
     AgentRegistry,
-    BrowserAgent,
+    BlockingBackendAdapter,
+    ChatBackend,
     ConversationBuffer,
+    Dispatcher,
     Planner,
     QuestionAnswerAgent,
+    Speculator,
+    ToolCallingDispatcher,
+    TurnResult,
+)
+from backend_router import BackendRouter, RoutingPolicy
+from compression import CompressionPolicy, HistoryCompressor
+from extensions import default_extensions, tool_definitions, with_catalog
+from intent_router import IntentRouter, default_intent_router
+from memory import LongTermMemory
+from messages import RequestBodyBuilder
+from resilience import (
+    RETRYABLE_STATUSES,
+    CircuitBreaker,
+    HedgePolicy,
+    ResilienceStats,
+    RetryPolicy,
+)
+from response_cache import CachePolicy, ResponseCache
+from session_trace import RecordingBackend, RecordingDispatcher, SessionRecorder
+from scheduler import (
+    BACKGROUND,
+    INTERACTIVE,
+    PLANNER,
+    RequestScheduler,
+    ScheduledBackend,
+    SchedulerPolicy,
+    format_stats,
 )
+import tracing
 
+if TYPE_CHECKING:
+    import asyncio
 
-def _select_user_reply(plan: AgentPlan, agent_reply: str) -> str:
-    if plan.agent == "qa":
-        return agent_reply
-    if plan.user_visible_message:
-        return plan.user_visible_message
-    return agent_reply
+    import requests
+
+T = TypeVar("T")
 
 
 class DeepSeekClientError(RuntimeError):
     """Исключение верхнего уровня для ошибок клиента DeepSeek."""
 
+    def __init__(
+        self,
+        message: str,
+        status: Optional[int] = None,
+        retryable: bool = False,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
 
-class DeepSeekChatClient:
-    """Минимальный клиент для эндпоинта /chat/completions."""
+
+_STREAM_DONE = object()
+
+
+class _DeepSeekRequestBase:
+    """Общие параметры и разбор ответов для синхронного и асинхронного клиентов."""
 
     def __init__(
         self,
@@ -51,6 +161,8 @@ class DeepSeekChatClient:
         temperature: float,
         max_tokens: int,
         timeout: int,
+        retry_policy: Optional[RetryPolicy] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
     ) -> None:
         self.api_key = api_key.strip()
         self.api_url = api_url.rstrip("/")
@@ -58,106 +170,1122 @@ class DeepSeekChatClient:
         self.temperature = temperature
         self.max_tokens = max_tokens
         self.timeout = timeout
-        self._session = requests.Session()
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.stats = ResilienceStats()
+        self.last_time_to_first_token: Optional[float] = None
+        self.response_format: Optional[Dict[str, str]] = None
+        # HTTP-сессия создаётся лениво и общая для копий из `with_json_mode`.
+        self._sessions: Dict[str, Any] = {}
+        self._session_lock = threading.Lock()
+        self._body_builder = RequestBodyBuilder()
 
-    def send(self, messages: List[Dict[str, str]]) -> str:
-        """Отправляет список сообщений в DeepSeek и возвращает ответ ассистента."""
+    def with_json_mode(self: T) -> T:
+        """Копия клиента с общим пулом соединений, запрашивающая ответ в JSON-режиме."""
+        clone = copy.copy(self)
+        clone.response_format = {"type": "json_object"}
+        return clone
+
+    def _payload(self, stream: bool = False) -> Dict[str, Any]:
+        """Параметры запроса без сообщений и `tools`."""
         payload: Dict[str, Any] = {
             "model": self.model,
             "temperature": self.temperature,
             "max_tokens": self.max_tokens,
-            "messages": messages,
         }
-        headers = {
+        if self.response_format is not None:
+            payload["response_format"] = self.response_format
+        if stream:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+        return payload
+
+    def _admit(self) -> int:
+        """Проверяет circuit breaker и возвращает число попыток вызова."""
+        self.stats.calls += 1
+        if self.circuit_breaker is not None and not self.circuit_breaker.allow():
+            self.stats.short_circuits += 1
+            raise DeepSeekClientError("DeepSeek временно недоступен: circuit breaker разомкнут")
+        return self.retry_policy.max_attempts if self.retry_policy is not None else 1
+
+    def _retry_delay(
+        self, exc: DeepSeekClientError, attempt: int, attempts: int
+    ) -> Optional[float]:
+        """Пауза перед следующей попыткой или None, если ошибка окончательная."""
+        if exc.retryable and attempt < attempts and self.retry_policy is not None:
+            self.stats.retries += 1
+            return self.retry_policy.delay(attempt, exc.retry_after)
+        self.stats.failures += 1
+        breaker = self.circuit_breaker
+        if breaker is not None:
+            # Ошибка запроса (4xx) не значит, что сервис ожил или упал.
+            if exc.retryable:
+                breaker.record_failure()
+            else:
+                breaker.release_trial()
+        return None
+
+    def _record_success(self) -> None:
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_success()
+
+    def _release(self) -> None:
+        """Вызов прерван не ошибкой API (исключение в коде, отмена): пробный вызов освобождается."""
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.release_trial()
+
+    def _body(
+        self,
+        messages: Sequence[Mapping[str, str]],
+        stream: bool = False,
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ) -> bytes:
+        """Тело запроса в UTF-8: закодированные сообщения буфера берутся из их кэша."""
+        return self._body_builder.build(self._payload(stream), messages, tools)
+
+    def _headers(self) -> Dict[str, str]:
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
 
+    @staticmethod
+    def _extract_content(data: Any) -> str:
+        try:
+            content = data["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as exc:
+            raise DeepSeekClientError(f"Неожиданный формат ответа: {data}") from exc
+        if not isinstance(content, str):
+            raise DeepSeekClientError(f"Неожиданный формат ответа: {data}")
+        return content.strip()
+
+    @staticmethod
+    def _extract_message(data: Any) -> Dict[str, Any]:
+        try:
+            message = data["choices"][0]["message"]
+        except (KeyError, IndexError, TypeError) as exc:
+            raise DeepSeekClientError(f"Неожиданный формат ответа: {data}") from exc
+        if not isinstance(message, dict):
+            raise DeepSeekClientError(f"Неожиданный формат ответа: {data}")
+        return message
+
+    @staticmethod
+    def _parse_stream_line(line: str) -> Any:
+        """Разбирает одну строку SSE: фрагмент текста, `_STREAM_DONE` или None."""
+        if not line or not line.startswith("data:"):
+            return None
+        data = line[len("data:") :].strip()
+        if data == "[DONE]":
+            return _STREAM_DONE
         try:
-            response = self._session.post(
+            chunk = json.loads(data)
+            choices = chunk.get("choices") or [{}]
+            delta = choices[0].get("delta") or {}
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as exc:
+            raise DeepSeekClientError(f"Неожиданный фрагмент потока: {data}") from exc
+        if chunk.get("usage"):
+            tracing.record_usage(chunk["usage"])
+        return delta.get("content") or None
+
+
+class DeepSeekChatClient(_DeepSeekRequestBase):
+    """Минимальный клиент для эндпоинта /chat/completions.
+
+    Необязательные политики: повторы с экспоненциальной задержкой на 429/5xx,
+    хеджирование (дублирующий запрос после p95 задержки) и circuit breaker.
+    `pool_size` задаёт число keep-alive соединений, когда клиент общий для
+    многих потоков (по умолчанию — пул requests на 10 соединений).
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        api_url: str,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        timeout: int,
+        retry_policy: Optional[RetryPolicy] = None,
+        hedge_policy: Optional[HedgePolicy] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        pool_size: Optional[int] = None,
+    ) -> None:
+        super().__init__(
+            api_key, api_url, model, temperature, max_tokens, timeout, retry_policy, circuit_breaker
+        )
+        self.pool_size = pool_size
+        self.hedge_policy = hedge_policy
+        self._hedge_executor = (
+            ThreadPoolExecutor(max_workers=2 * (hedge_policy.max_hedges + 1))
+            if hedge_policy is not None
+            else None
+        )
+
+    def _get_session(self) -> requests.Session:
+        session = self._sessions.get("default")
+        if session is None:
+            with self._session_lock:
+                session = self._sessions.get("default")
+                if session is None:
+                    import requests
+
+                    session = requests.Session()
+                    if self.pool_size:
+                        adapter = requests.adapters.HTTPAdapter(
+                            pool_connections=1, pool_maxsize=self.pool_size
+                        )
+                        session.mount("http://", adapter)
+                        session.mount("https://", adapter)
+                    self._sessions["default"] = session
+        return session
+
+    def warm_up(self) -> bool:
+        """Заранее открывает keep-alive соединение (DNS, TCP, TLS), пока пользователь печатает."""
+        import requests
+
+        try:
+            with tracing.span("http.warm_up"):
+                self._get_session().head(
+                    self.api_url, headers=self._headers(), timeout=self.timeout
+                )
+        except requests.RequestException:
+            return False
+        return True
+
+    @staticmethod
+    def _wrap_request_error(exc: requests.RequestException) -> DeepSeekClientError:
+        import requests
+
+        response = getattr(exc, "response", None)
+        if response is not None:
+            retry_after: Optional[float] = None
+            try:
+                retry_after = float(response.headers.get("Retry-After", ""))
+            except ValueError:
+                pass
+            return DeepSeekClientError(
+                f"Ошибка сети или API: {exc}",
+                status=response.status_code,
+                retryable=response.status_code in RETRYABLE_STATUSES,
+                retry_after=retry_after,
+            )
+        retryable = isinstance(exc, (requests.ConnectionError, requests.Timeout))
+        return DeepSeekClientError(f"Ошибка сети или API: {exc}", retryable=retryable)
+
+    def _with_resilience(self, call: Callable[[], T]) -> T:
+        attempts = self._admit()
+        try:
+            for attempt in range(1, attempts + 1):
+                try:
+                    result = call()
+                except DeepSeekClientError as exc:
+                    delay = self._retry_delay(exc, attempt, attempts)
+                    if delay is None:
+                        raise
+                    assert self.retry_policy is not None
+                    self.retry_policy.sleep(delay)
+                    continue
+                self._record_success()
+                return result
+        except DeepSeekClientError:
+            raise
+        except BaseException:
+            self._release()
+            raise
+        raise AssertionError("unreachable")
+
+    def _send_once(self, messages: Sequence[Mapping[str, str]]) -> str:
+        with tracing.span("http.chat_completions", model=self.model):
+            return self._post_completion(messages)
+
+    def _post_completion(self, messages: Sequence[Mapping[str, str]]) -> str:
+        return self._extract_content(self._post_json(self._body(messages)))
+
+    def _post_json(self, body: bytes) -> Any:
+        import requests
+
+        started = time.perf_counter()
+        try:
+            response = self._get_session().post(
                 self.api_url,
-                headers=headers,
-                json=payload,
+                headers=self._headers(),
+                data=body,
                 timeout=self.timeout,
             )
             response.raise_for_status()
             data = response.json()
         except requests.RequestException as exc:
-            raise DeepSeekClientError(f"Ошибка сети или API: {exc}") from exc
+            raise self._wrap_request_error(exc) from exc
         except ValueError as exc:
             raise DeepSeekClientError("Не удалось распарсить ответ DeepSeek") from exc
 
+        tracing.record_usage(data.get("usage") if isinstance(data, dict) else None)
+        self.stats.latency.record(time.perf_counter() - started)
+        return data
+
+    def send_with_tools(
+        self, messages: Sequence[Mapping[str, str]], tools: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Запрос с `tools`; возвращает сообщение ассистента целиком (`content` и `tool_calls`)."""
+
+        def call() -> Dict[str, Any]:
+            with tracing.span("http.chat_completions.tools", model=self.model):
+                return self._extract_message(self._post_json(self._body(messages, tools=tools)))
+
+        return self._with_resilience(call)
+
+    def _send_hedged(self, messages: Sequence[Mapping[str, str]]) -> str:
+        """Первый запрос, а если он не успел за p95 — дубликаты; побеждает первый ответ."""
+        assert self.hedge_policy is not None and self._hedge_executor is not None
+        delay = self.hedge_policy.delay(self.stats.latency)
+        primary = self._hedge_executor.submit(
+            contextvars.copy_context().run, self._send_once, messages
+        )
+        futures: List[Future[str]] = [primary]
+        pending = set(futures)
+        errors: List[BaseException] = []
+        while pending:
+            can_hedge = len(futures) <= self.hedge_policy.max_hedges
+            done, pending = wait(
+                pending, timeout=delay if can_hedge else None, return_when=FIRST_COMPLETED
+            )
+            if not done:
+                self.stats.hedges += 1
+                hedge = self._hedge_executor.submit(
+                    contextvars.copy_context().run, self._send_once, messages
+                )
+                futures.append(hedge)
+                pending.add(hedge)
+                continue
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    if future is not primary:
+                        self.stats.hedge_wins += 1
+                    return future.result()
+                errors.append(error)
+        raise errors[0]
+
+    def send(self, messages: Sequence[Mapping[str, str]]) -> str:
+        """Отправляет список сообщений в DeepSeek и возвращает ответ ассистента."""
+        if self.hedge_policy is not None:
+            return self._with_resilience(lambda: self._send_hedged(messages))
+        return self._with_resilience(lambda: self._send_once(messages))
+
+    def _open_stream(self, messages: Sequence[Mapping[str, str]]) -> requests.Response:
+        with tracing.span("http.chat_completions.open_stream", model=self.model):
+            return self._post_stream(messages)
+
+    def _post_stream(self, messages: Sequence[Mapping[str, str]]) -> requests.Response:
+        import requests
+
         try:
-            content = data["choices"][0]["message"]["content"]
-        except (KeyError, IndexError, TypeError) as exc:
-            raise DeepSeekClientError(f"Неожиданный формат ответа: {data}") from exc
+            response = self._get_session().post(
+                self.api_url,
+                headers=self._headers(),
+                data=self._body(messages, stream=True),
+                timeout=self.timeout,
+                stream=True,
+            )
+            response.raise_for_status()
+        except requests.RequestException as exc:
+            raise self._wrap_request_error(exc) from exc
+        return response
 
-        return content.strip()
+    def stream(self, messages: Sequence[Mapping[str, str]]) -> Iterator[str]:
+        """Отправляет запрос с `stream: true` и отдаёт фрагменты ответа по мере прихода (SSE).
 
+        Повторы и circuit breaker применяются к установке соединения.
+        Время до первого фрагмента сохраняется в `last_time_to_first_token`.
+        """
+        import requests
 
-def main() -> None:
-    print("DeepSeek Chat (введите 'exit' чтобы выйти)\n")
-    client = DeepSeekChatClient(
+        self.last_time_to_first_token = None
+        started = time.perf_counter()
+        response = self._with_resilience(lambda: self._open_stream(messages))
+
+        with response:
+            try:
+                for raw_line in response.iter_lines():
+                    token = self._parse_stream_line(raw_line.decode("utf-8", errors="replace"))
+                    if token is None:
+                        continue
+                    if token is _STREAM_DONE:
+                        break
+                    if self.last_time_to_first_token is None:
+                        self.last_time_to_first_token = time.perf_counter() - started
+                    yield token
+            except requests.RequestException as exc:
+                raise DeepSeekClientError(f"Обрыв потока DeepSeek: {exc}") from exc
+
+
+class AsyncDeepSeekChatClient(_DeepSeekRequestBase):
+    """Асинхронный клиент /chat/completions на aiohttp с пулом keep-alive соединений.
+
+    Повторы и circuit breaker работают так же, как в `DeepSeekChatClient`;
+    хеджирования нет.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        api_url: str,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        timeout: int,
+        pool_size: int = 8,
+        keepalive_timeout: float = 60.0,
+        retry_policy: Optional[RetryPolicy] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        super().__init__(
+            api_key, api_url, model, temperature, max_tokens, timeout, retry_policy, circuit_breaker
+        )
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+
+    def _client_errors(self) -> tuple:
+        import asyncio
+
+        import aiohttp
+
+        return (aiohttp.ClientError, asyncio.TimeoutError)
+
+    @staticmethod
+    def _wrap_client_error(exc: BaseException) -> DeepSeekClientError:
+        import asyncio
+
+        import aiohttp
+
+        if isinstance(exc, aiohttp.ClientResponseError):
+            retry_after: Optional[float] = None
+            try:
+                retry_after = float((exc.headers or {}).get("Retry-After", ""))
+            except ValueError:
+                pass
+            return DeepSeekClientError(
+                f"Ошибка сети или API: {exc}",
+                status=exc.status,
+                retryable=exc.status in RETRYABLE_STATUSES,
+                retry_after=retry_after,
+            )
+        retryable = isinstance(exc, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+        return DeepSeekClientError(f"Ошибка сети или API: {exc}", retryable=retryable)
+
+    async def _with_resilience(self, call: Callable[[], Awaitable[T]]) -> T:
+        """Асинхронный аналог `DeepSeekChatClient._with_resilience`."""
+        import asyncio
+
+        attempts = self._admit()
+        try:
+            for attempt in range(1, attempts + 1):
+                try:
+                    result = await call()
+                except DeepSeekClientError as exc:
+                    delay = self._retry_delay(exc, attempt, attempts)
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+                    continue
+                self._record_success()
+                return result
+        except DeepSeekClientError:
+            raise
+        except BaseException:
+            self._release()
+            raise
+        raise AssertionError("unreachable")
+
+    async def _get_session(self) -> Any:
+        session = self._sessions.get("default")
+        if session is None or session.closed:
+            try:
+                import aiohttp
+            except ImportError as exc:
+                raise DeepSeekClientError(
+                    "Для асинхронного клиента нужна библиотека 'aiohttp' (pip install aiohttp)"
+                ) from exc
+            session = self._sessions["default"] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.pool_size, keepalive_timeout=self.keepalive_timeout
+                ),
+                timeout=aiohttp.ClientTimeout(
+                    total=None, sock_connect=self.timeout, sock_read=self.timeout
+                ),
+                headers=self._headers(),
+            )
+        return session
+
+    async def warm_up(self) -> bool:
+        """Асинхронный аналог `DeepSeekChatClient.warm_up`."""
+        session = await self._get_session()
+        try:
+            async with session.head(self.api_url) as response:
+                await response.read()
+        except self._client_errors():
+            return False
+        return True
+
+    async def _post_json(self, body: bytes) -> Any:
+        session = await self._get_session()
+        started = time.perf_counter()
+        try:
+            async with session.post(self.api_url, data=body) as response:
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+        except self._client_errors() as exc:
+            raise self._wrap_client_error(exc) from exc
+        except ValueError as exc:
+            raise DeepSeekClientError("Не удалось распарсить ответ DeepSeek") from exc
+        tracing.record_usage(data.get("usage") if isinstance(data, dict) else None)
+        self.stats.latency.record(time.perf_counter() - started)
+        return data
+
+    async def send(self, messages: Sequence[Mapping[str, str]]) -> str:
+        """Асинхронно отправляет сообщения и возвращает ответ ассистента."""
+        body = self._body(messages)
+        return self._extract_content(await self._with_resilience(lambda: self._post_json(body)))
+
+    async def send_with_tools(
+        self, messages: Sequence[Mapping[str, str]], tools: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Асинхронный аналог `DeepSeekChatClient.send_with_tools`."""
+        body = self._body(messages, tools=tools)
+        return self._extract_message(await self._with_resilience(lambda: self._post_json(body)))
+
+    async def _open_stream(self, body: bytes) -> Any:
+        session = await self._get_session()
+        try:
+            response = await session.post(self.api_url, data=body)
+            try:
+                response.raise_for_status()
+            except BaseException:
+                response.release()
+                raise
+        except self._client_errors() as exc:
+            raise self._wrap_client_error(exc) from exc
+        return response
+
+    async def stream(self, messages: Sequence[Mapping[str, str]]) -> AsyncIterator[str]:
+        """Асинхронный аналог `DeepSeekChatClient.stream`."""
+        self.last_time_to_first_token = None
+        started = time.perf_counter()
+        body = self._body(messages, stream=True)
+        response = await self._with_resilience(lambda: self._open_stream(body))
+        try:
+            async with response:
+                async for raw_line in response.content:
+                    token = self._parse_stream_line(
+                        raw_line.decode("utf-8", errors="replace").strip()
+                    )
+                    if token is None:
+                        continue
+                    if token is _STREAM_DONE:
+                        break
+                    if self.last_time_to_first_token is None:
+                        self.last_time_to_first_token = time.perf_counter() - started
+                    yield token
+        except self._client_errors() as exc:
+            raise DeepSeekClientError(f"Обрыв потока DeepSeek: {exc}") from exc
+
+    async def close(self) -> None:
+        session = self._sessions.pop("default", None)
+        if session is not None:
+            await session.close()
+
+
+class _StreamPrinter:
+    """Печатает токены ответа в консоль по мере поступления."""
+
+    def __init__(self, prefix: str = "DeepSeek: ") -> None:
+        self.prefix = prefix
+        self.started = False
+
+    def __call__(self, token: str) -> None:
+        if not self.started:
+            print(self.prefix, end="", flush=True)
+            self.started = True
+        print(token, end="", flush=True)
+
+    def reset(self) -> None:
+        self.started = False
+
+
+@dataclass
+class _Runtime:
+    dispatcher: Union[Dispatcher, ToolCallingDispatcher, RecordingDispatcher]
+    stream_printer: Optional[_StreamPrinter]
+    response_cache: Optional[ResponseCache] = None
+    compressors: List[HistoryCompressor] = field(default_factory=list)
+    memory: Optional[LongTermMemory] = None
+    scheduler: Optional[RequestScheduler] = None
+    router: Optional[BackendRouter] = None
+    recorder: Optional[SessionRecorder] = None
+
+    def shutdown(self) -> None:
+        """Останавливает фоновые компоненты и печатает их статистику."""
+        tracing.shutdown()
+        if self.recorder is not None:
+            self.recorder.close()
+            print(
+                f"[Запись сессии] {self.recorder.path}: ходов {self.recorder.turns}, "
+                f"запросов к API {self.recorder.exchanges}"
+            )
+        for compressor in self.compressors:
+            compressor.close()
+            stats = compressor.stats
+            print(
+                f"[Выжимка {compressor.name}] запусков: {stats.runs}, ошибок: {stats.failures}, "
+                f"время: {stats.summarize_seconds:.2f} с, "
+                f"токенов промпта за ход: {stats.prompt_tokens_per_turn:.0f}"
+            )
+        if self.response_cache is not None:
+            self.response_cache.close()
+            stats = self.response_cache.stats
+            print(
+                f"[Кэш] попаданий: {stats.hits} (память {stats.memory_hits}, диск {stats.disk_hits}, "
+                f"похожие {stats.near_hits}), промахов: {stats.misses}, "
+                f"вытеснено: {stats.evictions}, устарело: {stats.expirations}"
+            )
+        if self.memory is not None:
+            self.memory.close()
+            stats = self.memory.stats
+            print(
+                f"[Память] сообщений: {len(self.memory)}, добавлено: {stats.appended}, "
+                f"поисков: {stats.recalls} (в среднем {stats.average_recall_ms:.2f} мс), "
+                f"фрагментов в промпте: {stats.recalled_snippets}"
+            )
+        fast_router: Optional[IntentRouter] = self.dispatcher.fast_router
+        if fast_router is not None:
+            stats = fast_router.stats
+            print(
+                f"[Быстрый маршрутизатор] попаданий: {stats.hits}/{stats.calls} "
+                f"({stats.hit_rate:.0%}), сэкономлено ~{stats.saved_seconds:.2f} с"
+            )
+        if self.dispatcher.plan_executor is not None:
+            self.dispatcher.plan_executor.shutdown(wait=False, cancel_futures=True)
+        for name, buffer in (
+            ("чат", self.dispatcher.user_buffer),
+            ("планировщик", self.dispatcher.planner_buffer),
+        ):
+            cache = buffer.cache_stats if buffer is not None else None
+            if cache is not None and cache.requests:
+                print(
+                    f"[Кэш промптов DeepSeek, {name}] попадание {cache.hit_ratio:.0%} "
+                    f"({cache.hit_tokens} из {cache.hit_tokens + cache.miss_tokens} токенов, "
+                    f"запросов: {cache.requests}), вытеснений истории: {buffer.evictions}"
+                )
+        extension_stats = self.dispatcher.registry.extensions.stats
+        loaded = ", ".join(
+            f"{name} (импорт {timing.import_seconds * 1000:.1f} мс, "
+            f"первый вызов {(timing.first_run_seconds or 0.0) * 1000:.1f} мс)"
+            for name, timing in extension_stats.loaded.items()
+        )
+        print(
+            f"[Расширения] манифест: {extension_stats.manifest_seconds * 1000:.1f} мс, "
+            f"загружены: {loaded or 'нет'}"
+        )
+        registry = self.dispatcher.registry
+        if registry.step_executor is not None:
+            registry.step_executor.shutdown(wait=False, cancel_futures=True)
+        step_stats = registry.step_stats
+        if step_stats.plans:
+            print(
+                f"[Многошаговые планы] планов: {step_stats.plans}, шагов: {step_stats.steps} "
+                f"(ошибок {step_stats.failed}), время: {step_stats.wall_seconds:.2f} с "
+                f"при сумме шагов {step_stats.step_seconds:.2f} с, "
+                f"выигрыш {step_stats.saved_seconds:.2f} с"
+            )
+        speculator = self.dispatcher.speculator
+        if speculator is not None:
+            speculator.executor.shutdown(wait=False, cancel_futures=True)
+            stats = speculator.stats
+            print(
+                f"[Спекуляция] запущено: {stats.started}, использовано: {stats.used}, "
+                f"впустую: {stats.wasted} (прервано на лету: {stats.cancelled_in_flight})"
+            )
+        if self.scheduler is not None:
+            for name, line in format_stats(self.scheduler.stats):
+                print(f"[Очередь запросов, {name}] {line}")
+        if self.router is not None:
+            for line in self.router.summary():
+                print(f"[Бэкенды] {line}")
+
+
+def _build_scheduler() -> Optional[RequestScheduler]:
+    if not SCHEDULER_ENABLED:
+        return None
+    return RequestScheduler(
+        SchedulerPolicy(
+            requests_per_minute=SCHEDULER_REQUESTS_PER_MINUTE,
+            tokens_per_minute=SCHEDULER_TOKENS_PER_MINUTE,
+            max_concurrent=SCHEDULER_MAX_CONCURRENT,
+            class_limits={BACKGROUND: SCHEDULER_BACKGROUND_CONCURRENCY},
+        )
+    )
+
+
+def _scheduled(client: Any, scheduler: Optional[RequestScheduler], request_class: str) -> Any:
+    """Клиент с классом очереди `request_class` или сам `client`, если очереди нет."""
+    if scheduler is None:
+        return client
+    return ScheduledBackend(client, scheduler, request_class)
+
+
+def _routed(client: Any, router: Optional[BackendRouter], role: str) -> Any:
+    """Клиент маршрута роли `role` или сам `client`, если бэкенд один."""
+    if router is None:
+        return client
+    return router.for_role(role)
+
+
+def _build_recorder() -> Optional[SessionRecorder]:
+    if not SESSION_TRACE_DIR:
+        return None
+    return SessionRecorder.in_directory(
+        SESSION_TRACE_DIR,
+        {
+            "dispatch_mode": DISPATCH_MODE,
+            "fast_path_router": FAST_PATH_ROUTER,
+            "fast_path_threshold": FAST_PATH_THRESHOLD,
+            "streaming_planner": STREAMING_PLANNER,
+        },
+    )
+
+
+def _build_runtime(client: ChatBackend, router: Optional[BackendRouter] = None) -> _Runtime:
+    tools_mode = DISPATCH_MODE == "tools"
+    scheduler = _build_scheduler()
+    recorder = _build_recorder()
+
+    def backend_for(role: str) -> Any:
+        backend = _routed(client, router, role)
+        return RecordingBackend(backend, recorder, role) if recorder is not None else backend
+
+    extensions = default_extensions(
+        manifest_path=EXTENSIONS_MANIFEST, entry_point_group=EXTENSION_ENTRY_POINT_GROUP
+    )
+    user_buffer = ConversationBuffer(
+        SYSTEM_PROMPT,
+        CHAT_HISTORY_LIMIT,
+        CHAT_TOKEN_BUDGET,
+        eviction_chunk=HISTORY_EVICTION_CHUNK,
+    )
+    planner_buffer = ConversationBuffer(
+        with_catalog(PLANNER_SYSTEM_PROMPT, list(extensions.specs.values())),
+        PLANNER_HISTORY_LIMIT,
+        PLANNER_TOKEN_BUDGET,
+        eviction_chunk=HISTORY_EVICTION_CHUNK,
+    )
+    planner_client: Any = _scheduled(backend_for("planner"), scheduler, PLANNER)
+    if STREAMING_PLANNER:
+        planner_client = planner_client.with_json_mode()
+    qa_client: Any = _scheduled(backend_for("qa"), scheduler, INTERACTIVE)
+    response_cache = ResponseCache(RESPONSE_CACHE_PATH) if RESPONSE_CACHE_ENABLED else None
+    if response_cache is not None:
+        planner_client = response_cache.wrap(
+            planner_client, CachePolicy(ttl_seconds=RESPONSE_CACHE_TTL), namespace="planner"
+        )
+        qa_client = response_cache.wrap(
+            qa_client,
+            CachePolicy(ttl_seconds=RESPONSE_CACHE_TTL, near_duplicate=True),
+            namespace="qa",
+        )
+
+    planner = Planner(client=planner_client, buffer=planner_buffer, error_cls=DeepSeekClientError)
+    stream_printer = _StreamPrinter() if STREAM_RESPONSES else None
+    qa_agent = QuestionAnswerAgent(client=qa_client, buffer=user_buffer, on_token=stream_printer)
+    registry = AgentRegistry(
+        qa_agent=qa_agent,
+        extensions=extensions,
+        step_executor=(
+            ThreadPoolExecutor(max_workers=PLAN_STEP_WORKERS) if PLAN_STEP_WORKERS > 1 else None
+        ),
+    )
+    speculator = (
+        Speculator(qa_agent=qa_agent, executor=ThreadPoolExecutor(max_workers=2))
+        if SPECULATIVE_QA and not tools_mode
+        else None
+    )
+
+    fast_router = (
+        default_intent_router(FAST_PATH_THRESHOLD, background=True, agents=list(extensions.specs))
+        if FAST_PATH_ROUTER
+        else None
+    )
+    compressors = [
+        HistoryCompressor(
+            _scheduled(backend_for("summarizer"), scheduler, BACKGROUND),
+            buffer,
+            CompressionPolicy(enabled=enabled, trigger_messages=COMPRESSION_TRIGGER_MESSAGES),
+            name=name,
+        )
+        for name, buffer, enabled in (
+            ("chat", user_buffer, CHAT_COMPRESSION_ENABLED),
+            ("planner", planner_buffer, PLANNER_COMPRESSION_ENABLED and not tools_mode),
+        )
+        if enabled
+    ]
+    memory = LongTermMemory(MEMORY_PATH, top_k=MEMORY_TOP_K) if MEMORY_ENABLED else None
+
+    dispatcher: Union[Dispatcher, ToolCallingDispatcher, RecordingDispatcher]
+    if tools_mode:
+        dispatcher = ToolCallingDispatcher(
+            # Вызов с tools заменяет план, поэтому идёт вне очереди, как планировщик.
+            client=_scheduled(backend_for("planner"), scheduler, PLANNER),
+            registry=registry,
+            user_buffer=user_buffer,
+            tools=tool_definitions(list(extensions.specs.values())),
+            fast_router=fast_router,
+            compressors=compressors,
+            memory=memory,
+        )
+    else:
+        dispatcher = Dispatcher(
+            planner=planner,
+            registry=registry,
+            user_buffer=user_buffer,
+            planner_buffer=planner_buffer,
+            fast_router=fast_router,
+            speculator=speculator,
+            compressors=compressors,
+            plan_executor=ThreadPoolExecutor(max_workers=2) if STREAMING_PLANNER else None,
+            memory=memory,
+        )
+    if recorder is not None:
+        dispatcher = RecordingDispatcher(dispatcher, recorder)
+    return _Runtime(
+        dispatcher,
+        stream_printer,
+        response_cache,
+        compressors,
+        memory,
+        scheduler,
+        router,
+        recorder,
+    )
+
+
+def _print_turn(result: TurnResult, stream_printer: Optional[_StreamPrinter]) -> None:
+    streamed = stream_printer is not None and stream_printer.started
+    if result.error:
+        if streamed:
+            print()
+        print(result.reply)
+    elif streamed:
+        print("\n")
+    else:
+        print(f"DeepSeek: {result.reply}\n")
+
+
+def _is_exit_command(user_prompt: str) -> bool:
+    return user_prompt.lower() in {"exit", "quit", "выход"}
+
+
+def build_client(
+    pool_size: Optional[int] = None,
+    api_key: Optional[str] = None,
+    api_url: Optional[str] = None,
+    model: Optional[str] = None,
+) -> DeepSeekChatClient:
+    """Создаёт клиент DeepSeek с параметрами и политиками из config.py."""
+    return DeepSeekChatClient(
+        api_key=api_key or DEEPSEEK_API_KEY,
+        api_url=api_url or DEEPSEEK_API_URL,
+        model=model or DEEPSEEK_MODEL,
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
+        timeout=TIMEOUT,
+        retry_policy=RetryPolicy(max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY),
+        hedge_policy=HedgePolicy(min_delay=HEDGE_MIN_DELAY) if HEDGE_REQUESTS else None,
+        circuit_breaker=CircuitBreaker(
+            failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT
+        ),
+        pool_size=pool_size,
+    )
+
+
+def build_async_client() -> AsyncDeepSeekChatClient:
+    """Асинхронный клиент DeepSeek с повторами и circuit breaker из config.py.
+
+    Хеджирование и несколько бэкендов (`LLM_BACKENDS`) асинхронный клиент не
+    поддерживает: вместо молчаливой потери этих настроек — ошибка.
+    """
+    unsupported = [
+        name
+        for name, enabled in (("HEDGE_REQUESTS", HEDGE_REQUESTS), ("LLM_BACKENDS", LLM_BACKENDS))
+        if enabled
+    ]
+    if unsupported:
+        raise DeepSeekClientError(
+            f"--async не поддерживает {', '.join(unsupported)}: "
+            "отключите эти настройки или запустите чат без --async"
+        )
+    return AsyncDeepSeekChatClient(
         api_key=DEEPSEEK_API_KEY,
         api_url=DEEPSEEK_API_URL,
         model=DEEPSEEK_MODEL,
         temperature=TEMPERATURE,
         max_tokens=MAX_TOKENS,
         timeout=TIMEOUT,
+        retry_policy=RetryPolicy(max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY),
+        circuit_breaker=CircuitBreaker(
+            failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT
+        ),
     )
 
-    user_buffer = ConversationBuffer(SYSTEM_PROMPT, CHAT_HISTORY_LIMIT)
-    planner_buffer = ConversationBuffer(PLANNER_SYSTEM_PROMPT, PLANNER_HISTORY_LIMIT)
-    planner = Planner(client=client, buffer=planner_buffer, error_cls=DeepSeekClientError)
-    qa_agent = QuestionAnswerAgent(client=client, buffer=user_buffer)
-    browser_agent = BrowserAgent()
-    registry = AgentRegistry(qa_agent=qa_agent, browser_agent=browser_agent)
 
-    while True:
-        try:
-            user_prompt = input("Вы: ").strip()
-        except (KeyboardInterrupt, EOFError):
-            print("\nВыход.")
-            break
+def build_router(pool_size: Optional[int] = None) -> Optional[BackendRouter]:
+    """Маршрутизатор по LLM_BACKENDS и LLM_ROUTES или None, если бэкенд один."""
+    if not LLM_BACKENDS:
+        return None
+    backends = {
+        name: build_client(
+            pool_size,
+            api_key=settings.get("api_key"),
+            api_url=settings.get("api_url"),
+            model=settings.get("model"),
+        )
+        for name, settings in LLM_BACKENDS.items()
+    }
+    return BackendRouter(
+        backends,
+        LLM_ROUTES or {},
+        RoutingPolicy(strategy=LLM_ROUTING_STRATEGY, cooldown=LLM_BACKEND_COOLDOWN),
+    )
 
-        if not user_prompt:
-            continue
 
-        if user_prompt.lower() in {"exit", "quit", "выход"}:
-            print("Пока!")
-            break
+def _configure_tracing() -> None:
+    if TRACE_PATH or METRICS_PATH:
+        tracing.configure(trace_path=TRACE_PATH, metrics_path=METRICS_PATH)
 
-        user_buffer.add_user(user_prompt)
-        planner_buffer.add_user(f"Пользователь: {user_prompt}")
 
-        try:
-            plan = planner.plan()
-        except DeepSeekClientError as exc:
-            print(f"[Планировщик] {exc} — переключаюсь в режим QA.")
-            plan = AgentPlan(agent="qa", arguments={}, user_visible_message=None)
+def main() -> None:
+    print("DeepSeek Chat (введите 'exit' чтобы выйти)\n")
+    _configure_tracing()
+    client = build_client()
+    router = build_router()
+    runtime = _build_runtime(client, router)
+    if WARM_UP_CONNECTION:
+        warm_up = _scheduled(router or client, runtime.scheduler, BACKGROUND).warm_up
+        threading.Thread(target=warm_up, name="deepseek-warm-up", daemon=True).start()
 
-        try:
-            agent_reply = registry.run(plan)
-        except Exception as exc:  # noqa: BLE001
-            error_message = f"[Ошибка агента {plan.agent}] {exc}"
-            print(error_message)
-            user_buffer.add_assistant(error_message)
-            planner_buffer.add_assistant(error_message)
-            continue
+    try:
+        while True:
+            try:
+                user_prompt = input("Вы: ").strip()
+            except (KeyboardInterrupt, EOFError):
+                print("\nВыход.")
+                break
+
+            if not user_prompt:
+                continue
+
+            if _is_exit_command(user_prompt):
+                print("Пока!")
+                break
+
+            if runtime.stream_printer is not None:
+                runtime.stream_printer.reset()
+            result = runtime.dispatcher.handle(user_prompt)
+            _print_turn(result, runtime.stream_printer)
+    finally:
+        runtime.shutdown()
+
+
+def _start_stdin_reader(
+    loop: asyncio.AbstractEventLoop, prompts: "asyncio.Queue[Optional[str]]"
+) -> None:
+    """Читает stdin в daemon-потоке, чтобы ввод не блокировал цикл событий."""
+    import asyncio
+
+    def read() -> None:
+        while True:
+            line = sys.stdin.readline()
+            if not line:
+                loop.call_soon_threadsafe(prompts.put_nowait, None)
+                return
+            loop.call_soon_threadsafe(prompts.put_nowait, line.strip())
+
+    threading.Thread(target=read, name="stdin-reader", daemon=True).start()
+
+
+async def async_main() -> None:
+    """Асинхронный основной цикл: ввод, планирование, агенты и фоновые задачи не блокируют друг друга.
+
+    Синхронные Planner и агенты работают в потоках через `BlockingBackendAdapter`,
+    а HTTP-запросы выполняет общий пул `AsyncDeepSeekChatClient` в цикле событий.
+    """
+    import asyncio
+
+    client = build_async_client()
+    print("DeepSeek Chat (async, введите 'exit' чтобы выйти)\n")
+    _configure_tracing()
+    loop = asyncio.get_running_loop()
+    warm_up = asyncio.create_task(client.warm_up()) if WARM_UP_CONNECTION else None
+    runtime = _build_runtime(BlockingBackendAdapter(client, loop))
+    prompts: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+    _start_stdin_reader(loop, prompts)
+
+    try:
+        while True:
+            print("Вы: ", end="", flush=True)
+            user_prompt = await prompts.get()
+            if user_prompt is None:
+                print("\nВыход.")
+                break
+
+            if not user_prompt:
+                continue
+
+            if _is_exit_command(user_prompt):
+                print("Пока!")
+                break
+
+            if runtime.stream_printer is not None:
+                runtime.stream_printer.reset()
+            result = await asyncio.to_thread(runtime.dispatcher.handle, user_prompt)
+            _print_turn(result, runtime.stream_printer)
+    finally:
+        if warm_up is not None:
+            warm_up.cancel()
+        runtime.shutdown()
+        await client.close()
 
-        final_reply = _select_user_reply(plan, agent_reply)
-        print(f"DeepSeek: {final_reply}\n")
-        user_buffer.add_assistant(final_reply)
-        planner_buffer.add_assistant(
-            f"Агент '{plan.agent}' завершил действие. Ответ: {final_reply}"
+
+def voice_main(source: str, transcripts: Optional[str] = None, realtime: bool = False) -> None:
+    """Голосовой цикл: фразы из WAV-файла или сырого PCM со stdin (`-`) вместо `input()`."""
+    from voice import (
+        PcmStreamSource,
+        ScriptedSpeechToText,
+        VadPolicy,
+        VoiceActivityDetector,
+        VoicePipeline,
+        WavSource,
+        WhisperSpeechToText,
+        format_report,
+    )
+
+    chunks: Any = (
+        PcmStreamSource(sys.stdin.buffer, VOICE_SAMPLE_RATE)
+        if source == "-"
+        else WavSource(source, realtime=realtime)
+    )
+    stt: Any = (
+        ScriptedSpeechToText.from_file(transcripts)
+        if transcripts
+        else WhisperSpeechToText(VOICE_STT_MODEL, language=VOICE_LANGUAGE)
+    )
+    detector = VoiceActivityDetector(
+        VadPolicy(
+            sample_rate=chunks.sample_rate,
+            energy_threshold_db=VOICE_ENERGY_THRESHOLD_DB,
+            pause_ms=VOICE_PAUSE_MS,
+            hangover_ms=VOICE_HANGOVER_MS,
         )
+    )
+
+    print("DeepSeek Chat (голосовой ввод, Ctrl+C чтобы выйти)\n")
+    _configure_tracing()
+    client = build_client()
+    router = build_router()
+    runtime = _build_runtime(client, router)
+    if WARM_UP_CONNECTION:
+        warm_up = _scheduled(router or client, runtime.scheduler, BACKGROUND).warm_up
+        threading.Thread(target=warm_up, name="deepseek-warm-up", daemon=True).start()
+
+    def on_partial(text: str) -> None:
+        print(f"\r… {text}", end="", flush=True)
+
+    def on_transcript(text: str) -> None:
+        print(f"\rВы (голос): {text}")
+        if runtime.stream_printer is not None:
+            runtime.stream_printer.reset()
+
+    def on_result(text: str, result: TurnResult) -> None:
+        _print_turn(result, runtime.stream_printer)
+
+    pipeline = VoicePipeline(
+        detector,
+        stt,
+        runtime.dispatcher,
+        on_partial=on_partial,
+        on_transcript=on_transcript,
+        on_result=on_result,
+        plan_on_partial=VOICE_PLAN_ON_PARTIAL,
+    )
+    try:
+        pipeline.run(chunks)
+    finally:
+        runtime.shutdown()
+    for line in format_report(pipeline.stats):
+        print(f"[Голос] {line}")
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="DeepSeek Chat")
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="асинхронный основной цикл с пулом соединений aiohttp",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="показать время импорта модулей и этапов инициализации и выйти",
+    )
+    parser.add_argument(
+        "--voice",
+        metavar="WAV",
+        help="голосовой ввод из WAV 16 бит моно или сырого PCM со stdin ('-')",
+    )
+    parser.add_argument(
+        "--transcripts",
+        metavar="TXT",
+        help="текст фраз WAV-фикстуры по строке на фразу вместо распознавания",
+    )
+    parser.add_argument("--realtime", action="store_true", help="читать WAV в темпе записи")
+    return parser.parse_args()
+
+
+def profile_startup() -> None:
+    """Замеряет импорт chat.py в чистом интерпретаторе и этапы инициализации в текущем."""
+    from startup_profile import PhaseTimer, print_report, profile_imports
+
+    imports = profile_imports("chat")
+    timer = PhaseTimer()
+    with timer.phase("tracing"):
+        _configure_tracing()
+    with timer.phase("build_client"):
+        client = build_client()
+    with timer.phase("build_runtime"):
+        runtime = _build_runtime(client)
+    with timer.phase("warm_up (соединение с API)"):
+        connected = client.warm_up()
+    with timer.phase("shutdown"):
+        runtime.shutdown()
+    print_report(imports, timer.phases, root="chat")
+    if not connected:
+        print(f"\nПрогрев соединения с {client.api_url} не удался.")
 
 
 if __name__ == "__main__":
+    args = _parse_args()
     try:
-        main()
+        if args.profile_startup:
+            profile_startup()
+        elif args.voice:
+            voice_main(args.voice, args.transcripts, args.realtime)
+        elif args.use_async:
+            import asyncio
+
+            asyncio.run(async_main())
+        else:
+            main()
+    except KeyboardInterrupt:
+        print("\nВыход.")
     except DeepSeekClientError as exc:
         print(f"Не удалось инициализировать чат: {exc}", file=sys.stderr)
         sys.exit(1)
-
-
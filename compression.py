@@ -0,0 +1,124 @@
+"""Фоновая «выжимка» истории ConversationBuffer с помощью LLM.
+
+По триггеру (`extCall = True` или накопилось `trigger_messages` сообщений)
+старая часть истории сворачивается в краткое summary на рабочем потоке,
+а готовое summary атомарно подменяет свёрнутые сообщения в буфере.
+Следующий ход пользователя при этом не ждёт.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from agents import ChatBackend, ConversationBuffer
+
+SUMMARY_PREFIX = "Краткое содержание предыдущего диалога:"
+
+SUMMARIZER_PROMPT = (
+    "Ты сжимаешь историю диалога пользователя с голосовым ассистентом. "
+    "Сверни переданные сообщения в одно краткое summary на русском языке: "
+    "сохрани факты, намерения пользователя, принятые решения и результаты "
+    "вызванных расширений. Не добавляй ничего от себя. Ответь только текстом summary."
+)
+
+
+@dataclass
+class CompressionPolicy:
+    enabled: bool = True
+    trigger_messages: int = 8
+    on_ext_call: bool = True
+    keep_last: int = 2
+
+
+@dataclass
+class CompressionStats:
+    turns: int = 0
+    prompt_tokens: int = 0
+    runs: int = 0
+    failures: int = 0
+    skipped_busy: int = 0
+    summarize_seconds: float = 0.0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def prompt_tokens_per_turn(self) -> float:
+        return self.prompt_tokens / self.turns if self.turns else 0.0
+
+
+class HistoryCompressor:
+    """Сжимает историю одного буфера в фоне; у планировщика и чата свои экземпляры."""
+
+    def __init__(
+        self,
+        client: ChatBackend,
+        buffer: ConversationBuffer,
+        policy: Optional[CompressionPolicy] = None,
+        name: str = "chat",
+    ) -> None:
+        self.client = client
+        self.buffer = buffer
+        self.policy = policy or CompressionPolicy()
+        self.name = name
+        self.stats = CompressionStats()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"compress-{name}")
+        self._pending: Optional[Future[None]] = None
+        self._lock = threading.Lock()
+
+    def maybe_compress(self, ext_call: bool = False) -> bool:
+        """Учитывает ход и, если сработал триггер, запускает выжимку. Не блокирует."""
+        self.stats.turns += 1
+        self.stats.prompt_tokens += self.buffer.total_tokens
+        if not self.policy.enabled:
+            return False
+        history = self.buffer.history()
+        triggered = len(history) >= self.policy.trigger_messages or (
+            ext_call and self.policy.on_ext_call
+        )
+        to_summarize = history[: max(len(history) - self.policy.keep_last, 0)]
+        if not triggered or len(to_summarize) < 2:
+            return False
+        with self._lock:
+            if self._pending is not None and not self._pending.done():
+                self.stats.skipped_busy += 1
+                return False
+            self._pending = self._executor.submit(self._compress, to_summarize)
+        return True
+
+    def _compress(self, messages: List[Dict[str, str]]) -> None:
+        started = time.perf_counter()
+        tokens_before = self.buffer.total_tokens
+        try:
+            summary = self.client.send(self._summary_request(messages)).strip()
+        except Exception:  # noqa: BLE001
+            self.stats.failures += 1
+            return
+        finally:
+            self.stats.summarize_seconds += time.perf_counter() - started
+        if not summary:
+            self.stats.failures += 1
+            return
+        self.buffer.replace_with_summary(messages, f"{SUMMARY_PREFIX}\n{summary}")
+        self.stats.runs += 1
+        self.stats.tokens_before += tokens_before
+        self.stats.tokens_after += self.buffer.total_tokens
+
+    @staticmethod
+    def _summary_request(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        return [
+            {"role": "system", "content": SUMMARIZER_PROMPT},
+            {"role": "user", "content": transcript},
+        ]
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Дожидается текущей выжимки (для тестов и бенчмарков)."""
+        pending = self._pending
+        if pending is not None:
+            pending.result(timeout)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
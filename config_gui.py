@@ -3,8 +3,83 @@ import tkinter as tk
 from tkinter import messagebox, ttk
 import json
 import os
+import queue
+import threading
+import time
 from pathlib import Path
 
+DEFAULT_API_URL = "https://api.deepseek.com/v1/chat/completions"
+PROBE_PROMPT = "Привет! Ответь одним словом: работает"
+
+
+def percentile(samples, q):
+    """Перцентиль q (0-100) по отсортированной копии выборки; None для пустой."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(q / 100 * len(ordered)), len(ordered) - 1)]
+
+
+class ProbeResult:
+    """Задержки пингов одного эндпоинта: полный ответ и время до первого токена"""
+
+    def __init__(self, name, api_url, model, api_key=None):
+        self.name = name
+        self.api_url = api_url
+        self.model = model
+        self.api_key = api_key
+        self.latencies = []
+        self.ttfts = []
+        self.errors = 0
+        self.last_error = None
+
+    def rank(self):
+        """Ключ сортировки: сначала без ошибок, затем по медиане времени до первого токена"""
+        ttft = percentile(self.ttfts, 50)
+        return (self.errors, ttft if ttft is not None else float("inf"))
+
+
+def probe_endpoint(session, endpoint, api_key, pings, on_ping=None, timeout=10):
+    """Отправляет `pings` потоковых запросов и замеряет полное время и время до первого токена.
+
+    Соединение переиспользуется, поэтому первый пинг включает установку TLS.
+    `on_ping(result)` вызывается после каждого пинга (из рабочего потока).
+    """
+    result = ProbeResult(
+        endpoint["name"], endpoint["api_url"], endpoint["model"], endpoint.get("api_key")
+    )
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {endpoint.get('api_key') or api_key}"
+    }
+    data = {
+        "model": endpoint["model"],
+        "messages": [{"role": "user", "content": PROBE_PROMPT}],
+        "max_tokens": 10,
+        "stream": True
+    }
+    for _ in range(pings):
+        started = time.perf_counter()
+        first_token = None
+        try:
+            with session.post(
+                endpoint["api_url"], headers=headers, json=data, timeout=timeout, stream=True
+            ) as response:
+                if response.status_code != 200:
+                    raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+                for line in response.iter_lines():
+                    if first_token is None and line.startswith(b"data:") and b"content" in line:
+                        first_token = time.perf_counter() - started
+            result.latencies.append(time.perf_counter() - started)
+            if first_token is not None:
+                result.ttfts.append(first_token)
+        except Exception as e:
+            result.errors += 1
+            result.last_error = str(e)
+        if on_ping is not None:
+            on_ping(result)
+    return result
+
 
 class ConfigWindow:
     """Окно настройки конфигурации"""
@@ -12,12 +87,17 @@ class ConfigWindow:
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("Настройка DeepSeek API")
-        self.root.geometry("500x300")
+        self.root.geometry("620x560")
         self.root.resizable(False, False)
         
         # Центрирование окна
         self.center_window()
         
+        # Результаты проверки задержки приходят из рабочего потока через очередь
+        self.probe_queue = queue.Queue()
+        self.probe_thread = None
+        self.probe_results = []
+        
         # Загрузка существующей конфигурации
         self.load_config()
         
@@ -36,6 +116,8 @@ class ConfigWindow:
     def load_config(self):
         """Загрузка существующей конфигурации"""
         self.api_key = ""
+        self.api_url = DEFAULT_API_URL
+        self.endpoints = []
         self.model = "deepseek-chat"
         self.temperature = 0.7
         self.max_tokens = 1000
@@ -60,7 +142,11 @@ class ConfigWindow:
                     config = json.load(f)
                     if "deepseek" in config:
                         self.api_key = config["deepseek"].get("api_key", "")
+                        self.api_url = config["deepseek"].get("api_url", DEFAULT_API_URL)
                         self.model = config["deepseek"].get("model", "deepseek-chat")
+                    # Дополнительные эндпоинты для проверки задержки:
+                    # [{"name": ..., "api_url": ..., "model": ..., "api_key": ...}]
+                    self.endpoints = config.get("endpoints", [])
                     if "request" in config:
                         self.temperature = config["request"].get("temperature", 0.7)
                         self.max_tokens = config["request"].get("max_tokens", 1000)
@@ -107,21 +193,38 @@ class ConfigWindow:
         self.model_entry.insert(0, self.model)
         self.model_entry.grid(row=1, column=1, pady=5, padx=10)
         
+        # API URL
+        url_label = tk.Label(input_frame, text="API URL:", font=("Arial", 10))
+        url_label.grid(row=2, column=0, sticky="w", pady=5)
+        
+        self.url_entry = tk.Entry(input_frame, width=50, font=("Arial", 10))
+        self.url_entry.insert(0, self.api_url)
+        self.url_entry.grid(row=2, column=1, pady=5, padx=10)
+        
         # Temperature
         temp_label = tk.Label(input_frame, text="Temperature:", font=("Arial", 10))
-        temp_label.grid(row=2, column=0, sticky="w", pady=5)
+        temp_label.grid(row=3, column=0, sticky="w", pady=5)
         
         self.temp_entry = tk.Entry(input_frame, width=50, font=("Arial", 10))
         self.temp_entry.insert(0, str(self.temperature))
-        self.temp_entry.grid(row=2, column=1, pady=5, padx=10)
+        self.temp_entry.grid(row=3, column=1, pady=5, padx=10)
         
         # Max Tokens
         tokens_label = tk.Label(input_frame, text="Max Tokens:", font=("Arial", 10))
-        tokens_label.grid(row=3, column=0, sticky="w", pady=5)
+        tokens_label.grid(row=4, column=0, sticky="w", pady=5)
         
         self.tokens_entry = tk.Entry(input_frame, width=50, font=("Arial", 10))
         self.tokens_entry.insert(0, str(self.max_tokens))
-        self.tokens_entry.grid(row=3, column=1, pady=5, padx=10)
+        self.tokens_entry.grid(row=4, column=1, pady=5, padx=10)
+        
+        # Количество пингов на эндпоинт
+        pings_label = tk.Label(input_frame, text="Пингов:", font=("Arial", 10))
+        pings_label.grid(row=5, column=0, sticky="w", pady=5)
+        
+        self.pings_spin = tk.Spinbox(input_frame, from_=1, to=50, width=5, font=("Arial", 10))
+        self.pings_spin.delete(0, tk.END)
+        self.pings_spin.insert(0, "5")
+        self.pings_spin.grid(row=5, column=1, sticky="w", pady=5, padx=10)
         
         # Информация
         info_label = tk.Label(
@@ -131,9 +234,33 @@ class ConfigWindow:
             fg="gray",
             cursor="hand2"
         )
-        info_label.grid(row=4, column=0, columnspan=3, pady=10)
+        info_label.grid(row=6, column=0, columnspan=3, pady=10)
         info_label.bind("<Button-1>", lambda e: self.open_url("https://platform.deepseek.com/"))
         
+        # Результаты проверки задержки
+        probe_frame = tk.Frame(self.root, padx=20)
+        probe_frame.pack(fill=tk.BOTH, expand=True)
+        
+        columns = ("endpoint", "ok", "p50", "p95", "ttft")
+        self.results_tree = ttk.Treeview(probe_frame, columns=columns, show="headings", height=4)
+        for column, title, width in (
+            ("endpoint", "Эндпоинт / модель", 250),
+            ("ok", "Успешно", 70),
+            ("p50", "p50, мс", 70),
+            ("p95", "p95, мс", 70),
+            ("ttft", "TTFT p50, мс", 90),
+        ):
+            self.results_tree.heading(column, text=title)
+            anchor = "w" if column == "endpoint" else "e"
+            self.results_tree.column(column, width=width, anchor=anchor)
+        self.results_tree.pack(fill=tk.X)
+        
+        self.progress = ttk.Progressbar(probe_frame, mode="determinate")
+        self.progress.pack(fill=tk.X, pady=(5, 0))
+        
+        self.status_label = tk.Label(probe_frame, text="", font=("Arial", 9), fg="gray", anchor="w")
+        self.status_label.pack(fill=tk.X)
+        
         # Фрейм для кнопок
         button_frame = tk.Frame(self.root, pady=10)
         button_frame.pack()
@@ -167,9 +294,9 @@ class ConfigWindow:
         cancel_btn.pack(side=tk.LEFT, padx=5)
         
         # Кнопка Тест
-        test_btn = tk.Button(
+        self.test_btn = tk.Button(
             button_frame,
-            text="🧪 Тест подключения",
+            text="🧪 Тест задержки",
             command=self.test_connection,
             bg="#2196F3",
             fg="white",
@@ -178,7 +305,20 @@ class ConfigWindow:
             pady=5,
             cursor="hand2"
         )
-        test_btn.pack(side=tk.LEFT, padx=5)
+        self.test_btn.pack(side=tk.LEFT, padx=5)
+        
+        # Кнопка сохранения самого быстрого эндпоинта (доступна после теста)
+        self.fastest_btn = tk.Button(
+            button_frame,
+            text="⚡ Сохранить самый быстрый",
+            command=self.save_fastest,
+            font=("Arial", 10, "bold"),
+            padx=10,
+            pady=5,
+            state=tk.DISABLED,
+            cursor="hand2"
+        )
+        self.fastest_btn.pack(side=tk.LEFT, padx=5)
     
     def toggle_visibility(self):
         """Переключение видимости API ключа"""
@@ -232,6 +372,7 @@ class ConfigWindow:
             return
         
         api_key = self.api_entry.get().strip()
+        api_url = self.url_entry.get().strip() or DEFAULT_API_URL
         model = self.model_entry.get().strip()
         temperature = float(self.temp_entry.get())
         max_tokens = int(self.tokens_entry.get())
@@ -242,7 +383,7 @@ class ConfigWindow:
 
 # DeepSeek API настройки
 DEEPSEEK_API_KEY = "{api_key}"
-DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
+DEEPSEEK_API_URL = "{api_url}"
 DEEPSEEK_MODEL = "{model}"
 
 # Настройки запросов
@@ -286,7 +427,7 @@ SYSTEM_PROMPT = """Ты - ассистент для управления ком
             config_json = {
                 "deepseek": {
                     "api_key": api_key,
-                    "api_url": "https://api.deepseek.com/v1/chat/completions",
+                    "api_url": api_url,
                     "model": model
                 },
                 "request": {
@@ -295,6 +436,8 @@ SYSTEM_PROMPT = """Ты - ассистент для управления ком
                     "timeout": 30
                 }
             }
+            if self.endpoints:
+                config_json["endpoints"] = self.endpoints
             with open("config.json", "w", encoding="utf-8") as f:
                 json.dump(config_json, f, indent=2, ensure_ascii=False)
         except Exception as e:
@@ -304,51 +447,145 @@ SYSTEM_PROMPT = """Ты - ассистент для управления ком
         messagebox.showinfo("Успех", "Конфигурация успешно сохранена!")
         self.root.destroy()
     
+    def probe_endpoints(self):
+        """Эндпоинты для проверки: из полей окна и из списка endpoints в config.json"""
+        current = {
+            "name": "текущий",
+            "api_url": self.url_entry.get().strip() or DEFAULT_API_URL,
+            "model": self.model_entry.get().strip()
+        }
+        endpoints = [current]
+        for index, endpoint in enumerate(self.endpoints):
+            endpoint = dict(endpoint)
+            endpoint.setdefault("api_url", current["api_url"])
+            endpoint.setdefault("model", current["model"])
+            endpoint.setdefault("name", f"{endpoint['model']} #{index + 1}")
+            if (endpoint["api_url"], endpoint["model"]) == (current["api_url"], current["model"]):
+                continue
+            # Имя — ключ строки в таблице результатов, поэтому должно быть уникальным
+            if any(other["name"] == endpoint["name"] for other in endpoints):
+                endpoint["name"] = f"{endpoint['name']} #{index + 1}"
+            endpoints.append(endpoint)
+        return endpoints
+    
     def test_connection(self):
-        """Тестирование подключения к API"""
+        """Проверка задержки эндпоинтов в рабочем потоке; окно не блокируется"""
         if not self.validate_inputs():
             return
-        
-        api_key = self.api_entry.get().strip()
-        model = self.model_entry.get().strip()
+        if self.probe_thread is not None and self.probe_thread.is_alive():
+            return
         
         try:
             import requests
-            
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}"
-            }
-            
-            data = {
-                "model": model,
-                "messages": [
-                    {"role": "user", "content": "Привет! Ответь одним словом: работает"}
-                ],
-                "max_tokens": 10
-            }
-            
-            messagebox.showinfo("Тест", "Проверка подключения...")
-            
-            response = requests.post(
-                "https://api.deepseek.com/v1/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                message = result["choices"][0]["message"]["content"]
-                messagebox.showinfo("✅ Успех", f"Подключение работает!\n\nОтвет: {message}")
-            else:
-                error_msg = response.text
-                messagebox.showerror("❌ Ошибка", f"Не удалось подключиться:\n\n{error_msg}")
-        
         except ImportError:
             messagebox.showerror("Ошибка", "Библиотека 'requests' не установлена!\n\nУстановите: pip install requests")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка подключения:\n\n{str(e)}")
+            return
+        
+        try:
+            pings = max(int(self.pings_spin.get()), 1)
+        except ValueError:
+            pings = 5
+        endpoints = self.probe_endpoints()
+        api_key = self.api_entry.get().strip()
+        
+        self.probe_results = []
+        self.results_tree.delete(*self.results_tree.get_children())
+        for endpoint in endpoints:
+            self.results_tree.insert(
+                "", tk.END, iid=endpoint["name"],
+                values=(f"{endpoint['name']}: {endpoint['model']}", "…", "", "", "")
+            )
+        self.progress.config(maximum=pings * len(endpoints), value=0)
+        self.status_label.config(text="Проверка задержки...")
+        self.test_btn.config(state=tk.DISABLED)
+        self.fastest_btn.config(state=tk.DISABLED)
+        
+        def work():
+            with requests.Session() as session:
+                for endpoint in endpoints:
+                    result = probe_endpoint(
+                        session, endpoint, api_key, pings,
+                        on_ping=lambda result: self.probe_queue.put(("ping", result))
+                    )
+                    self.probe_queue.put(("done", result))
+            self.probe_queue.put(("finished", None))
+        
+        self.probe_thread = threading.Thread(target=work, name="latency-probe", daemon=True)
+        self.probe_thread.start()
+        self.root.after(100, self.poll_probe)
+    
+    def poll_probe(self):
+        """Забирает прогресс из очереди рабочего потока в главном потоке Tk"""
+        finished = False
+        while True:
+            try:
+                kind, result = self.probe_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "ping":
+                self.progress.step(1)
+                self.show_probe_result(result)
+            elif kind == "done":
+                self.probe_results.append(result)
+            else:
+                finished = True
+        if finished:
+            self.finish_probe()
+        else:
+            self.root.after(100, self.poll_probe)
+    
+    def show_probe_result(self, result):
+        """Обновляет строку эндпоинта в таблице результатов"""
+        def ms(value):
+            return f"{value * 1000:.0f}" if value is not None else "—"
+        
+        done = len(result.latencies) + result.errors
+        self.results_tree.item(result.name, values=(
+            f"{result.name}: {result.model}",
+            f"{len(result.latencies)}/{done}",
+            ms(percentile(result.latencies, 50)),
+            ms(percentile(result.latencies, 95)),
+            ms(percentile(result.ttfts, 50))
+        ))
+        status = f"{result.name}: пинг {done}"
+        if result.last_error:
+            status += f", последняя ошибка: {result.last_error}"
+        self.status_label.config(text=status)
+    
+    def fastest_result(self):
+        """Самый быстрый эндпоинт, ответивший хотя бы раз, или None"""
+        answered = [result for result in self.probe_results if result.latencies]
+        return min(answered, key=ProbeResult.rank) if answered else None
+    
+    def finish_probe(self):
+        """Итог проверки: самый быстрый эндпоинт и кнопка его сохранения"""
+        self.test_btn.config(state=tk.NORMAL)
+        fastest = self.fastest_result()
+        if fastest is None:
+            errors = "; ".join(r.last_error for r in self.probe_results if r.last_error)
+            self.status_label.config(text=f"❌ Ни один эндпоинт не ответил: {errors}")
+            return
+        ttft = percentile(fastest.ttfts, 50)
+        ttft_text = f"{ttft * 1000:.0f} мс" if ttft is not None else "—"
+        self.status_label.config(
+            text=f"✅ Самый быстрый: {fastest.name} ({fastest.model}), TTFT p50 {ttft_text}"
+        )
+        self.fastest_btn.config(state=tk.NORMAL)
+    
+    def save_fastest(self):
+        """Подставляет самый быстрый эндпоинт в поля и сохраняет конфигурацию"""
+        fastest = self.fastest_result()
+        if fastest is None:
+            return
+        self.url_entry.delete(0, tk.END)
+        self.url_entry.insert(0, fastest.api_url)
+        self.model_entry.delete(0, tk.END)
+        self.model_entry.insert(0, fastest.model)
+        # Пинги эндпоинта со своим ключом шли с этим ключом — он и сохраняется
+        if fastest.api_key:
+            self.api_entry.delete(0, tk.END)
+            self.api_entry.insert(0, fastest.api_key)
+        self.save_config()
     
     def run(self):
         """Запуск окна"""
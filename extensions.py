@@ -0,0 +1,267 @@
+"""Реестр расширений (агентов), описанных манифестом или entry points.
+
+Манифест (по умолчанию extensions.json рядом с модулем) перечисляет агентов:
+имя, точку входа `модуль:атрибут`, описание и аргументы для каталога
+планировщика. Каталог строится только из манифеста, а модуль агента
+импортируется и объект создаётся при первом вызове, поэтому число расширений
+почти не влияет на время запуска. Время загрузки манифеста, импорта и первого
+вызова каждого агента собирается в `ExtensionStats`.
+
+Запуск: python extensions.py            — каталог и время загрузки манифеста
+        python extensions.py --load     — плюс импорт и создание каждого агента
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import inspect
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import tracing
+
+DEFAULT_MANIFEST = Path(__file__).with_name("extensions.json")
+CATALOG_PLACEHOLDER = "{agents}"
+
+
+@dataclass
+class ExtensionSpec:
+    name: str
+    entry_point: str
+    description: str = ""
+    arguments: Dict[str, str] = field(default_factory=dict)
+    required: Tuple[str, ...] = ()
+    options: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ExtensionSpec":
+        try:
+            name = str(data["name"]).lower().strip()
+            entry_point = str(data["entry_point"])
+        except KeyError as exc:
+            raise ValueError(f"В описании расширения нет поля {exc}: {data}") from exc
+        if ":" not in entry_point:
+            raise ValueError(f"Точка входа '{entry_point}' должна иметь вид 'модуль:атрибут'")
+        return cls(
+            name=name,
+            entry_point=entry_point,
+            description=str(data.get("description", "")),
+            arguments={str(key): str(value) for key, value in (data.get("arguments") or {}).items()},
+            required=tuple(data.get("required") or ()),
+            options=dict(data.get("options") or {}),
+        )
+
+
+@dataclass
+class ExtensionTiming:
+    import_seconds: float = 0.0
+    construct_seconds: float = 0.0
+    first_run_seconds: Optional[float] = None
+    runs: int = 0
+
+
+@dataclass
+class ExtensionStats:
+    manifest_seconds: float = 0.0
+    loaded: Dict[str, ExtensionTiming] = field(default_factory=dict)
+
+
+def load_manifest(path: Optional[str] = None) -> List[ExtensionSpec]:
+    manifest_path = Path(path) if path else DEFAULT_MANIFEST
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    entries = data.get("extensions", []) if isinstance(data, dict) else data
+    return [ExtensionSpec.from_dict(entry) for entry in entries]
+
+
+def entry_point_specs(group: str) -> List[ExtensionSpec]:
+    """Расширения из установленных пакетов; читаются только метаданные, без импорта."""
+    from importlib.metadata import entry_points
+
+    return [
+        ExtensionSpec(name=entry.name.lower(), entry_point=entry.value)
+        for entry in entry_points(group=group)
+    ]
+
+
+def format_catalog(specs: Sequence[ExtensionSpec]) -> str:
+    """Текст каталога агентов для системного промпта планировщика."""
+    lines = ['Доступные агенты (поле "agent"):', "- qa: ответ на вопрос без внешних действий"]
+    for spec in specs:
+        line = f"- {spec.name}: {spec.description}" if spec.description else f"- {spec.name}"
+        if spec.arguments:
+            described = ", ".join(
+                f"{name}{'' if name in spec.required else '?'} — {text}"
+                for name, text in spec.arguments.items()
+            )
+            line += f". Аргументы: {described}"
+        lines.append(line)
+    lines.append(
+        'Несколько действий за один ход — список шагов вместо "agent": {"steps": [{"id": "s1", '
+        '"agent": "...", "arguments": {...}, "depends_on": []}], "user_visible_message": "..."}. '
+        'Шаги без общих "depends_on" выполняются одновременно.'
+    )
+    return "\n".join(lines)
+
+
+def with_catalog(system_prompt: str, specs: Sequence[ExtensionSpec]) -> str:
+    """Подставляет каталог вместо `{agents}` или дописывает его в конец промпта."""
+    catalog = format_catalog(specs)
+    if CATALOG_PLACEHOLDER in system_prompt:
+        return system_prompt.replace(CATALOG_PLACEHOLDER, catalog)
+    return f"{system_prompt.rstrip()}\n\n{catalog}"
+
+
+def tool_definitions(specs: Sequence[ExtensionSpec]) -> List[Dict[str, Any]]:
+    """Агенты в формате `tools` Chat Completions для однозапросного режима."""
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": spec.name,
+                "description": spec.description or spec.name,
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        name: {"type": "string", "description": text}
+                        for name, text in spec.arguments.items()
+                    },
+                    "required": list(spec.required),
+                },
+            },
+        }
+        for spec in specs
+    ]
+
+
+def _resolve(entry_point: str) -> Any:
+    module_name, _, attribute = entry_point.partition(":")
+    target: Any = importlib.import_module(module_name)
+    for part in attribute.split("."):
+        target = getattr(target, part)
+    return target
+
+
+def _construct(factory: Any, options: Dict[str, Any], context: Dict[str, Any]) -> Any:
+    """Вызывает фабрику с опциями манифеста и теми ключами контекста, которые она принимает."""
+    try:
+        parameters = inspect.signature(factory).parameters
+    except (TypeError, ValueError):
+        return factory(**options)
+    accepts_any = any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters.values())
+    kwargs = {
+        key: value for key, value in context.items() if accepts_any or key in parameters
+    }
+    kwargs.update(options)
+    return factory(**kwargs)
+
+
+class ExtensionLoader:
+    """Импортирует и создаёт агентов по спецификациям при первом обращении."""
+
+    def __init__(
+        self, specs: Sequence[ExtensionSpec], context: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self.specs: Dict[str, ExtensionSpec] = {spec.name: spec for spec in specs}
+        self.context = dict(context or {})
+        self.stats = ExtensionStats()
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.specs
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                instance = self._instances[name] = self._load(self.specs[name])
+        return instance
+
+    def _load(self, spec: ExtensionSpec) -> Any:
+        timing = ExtensionTiming()
+        with tracing.span("extension.load", extension=spec.name):
+            started = time.perf_counter()
+            factory = _resolve(spec.entry_point)
+            timing.import_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            instance = _construct(factory, spec.options, self.context)
+            timing.construct_seconds = time.perf_counter() - started
+        self.stats.loaded[spec.name] = timing
+        return instance
+
+    def run(self, name: str, arguments: Dict[str, Any]) -> str:
+        agent = self.get(name)
+        started = time.perf_counter()
+        try:
+            return agent.run(arguments)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                timing = self.stats.loaded[name]
+                if timing.first_run_seconds is None:
+                    timing.first_run_seconds = elapsed
+                timing.runs += 1
+
+
+def load_specs(
+    manifest_path: Optional[str] = None, entry_point_group: Optional[str] = None
+) -> Tuple[List[ExtensionSpec], float]:
+    """Спецификации из манифеста и (опционально) entry points и время их загрузки."""
+    started = time.perf_counter()
+    specs: Dict[str, ExtensionSpec] = {}
+    if entry_point_group:
+        for spec in entry_point_specs(entry_point_group):
+            specs[spec.name] = spec
+    for spec in load_manifest(manifest_path):
+        specs[spec.name] = spec
+    return list(specs.values()), time.perf_counter() - started
+
+
+def default_extensions(
+    context: Optional[Dict[str, Any]] = None,
+    manifest_path: Optional[str] = None,
+    entry_point_group: Optional[str] = None,
+) -> ExtensionLoader:
+    specs, seconds = load_specs(manifest_path, entry_point_group)
+    loader = ExtensionLoader(specs, context)
+    loader.stats.manifest_seconds = seconds
+    return loader
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Каталог расширений и стоимость их загрузки")
+    parser.add_argument("--manifest", default=None)
+    parser.add_argument("--entry-point-group", default=None)
+    parser.add_argument("--load", action="store_true", help="импортировать и создать каждого агента")
+    args = parser.parse_args()
+
+    loader = default_extensions({"dry_run": True}, args.manifest, args.entry_point_group)
+    specs = list(loader.specs.values())
+    print(format_catalog(specs))
+    print(
+        f"\nМанифест: {len(specs)} расширений за {loader.stats.manifest_seconds * 1000:.2f} мс"
+    )
+    if args.load:
+        for spec in specs:
+            try:
+                loader.get(spec.name)
+            except Exception as exc:  # noqa: BLE001
+                print(f"  {spec.name}: ошибка загрузки — {exc}")
+                continue
+            timing = loader.stats.loaded[spec.name]
+            print(
+                f"  {spec.name}: импорт {timing.import_seconds * 1000:.2f} мс, "
+                f"создание {timing.construct_seconds * 1000:.2f} мс"
+            )
+
+
+if __name__ == "__main__":
+    main()
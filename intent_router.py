@@ -0,0 +1,316 @@
+from __future__ import annotations
+
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Protocol, Sequence, Tuple
+
+from agents import AgentPlan
+
+
+@dataclass
+class RouteDecision:
+    plan: AgentPlan
+    confidence: float
+    source: str
+
+
+class IntentRule(Protocol):
+    def match(self, text: str) -> Optional[RouteDecision]: ...
+
+
+# Без схемы и www. адресом считается только домен из списка известных зон, иначе
+# имена файлов вроде report.pdf или main.py ушли бы в браузер.
+_KNOWN_TLDS = (
+    "com|ru|org|net|io|dev|app|info|biz|edu|gov|su|рф|ua|by|kz|uk|de|fr|eu|co|us|me|tv"
+    "|xyz|site|online|tech|pro"
+)
+_URL_PATTERN = (
+    r"(?:https?://\S+|www\.[\w-]+(?:\.[\w-]+)+(?:/\S*)?"
+    rf"|[\w-]+(?:\.[\w-]+)*\.(?:{_KNOWN_TLDS})(?![\w-])(?:/\S*)?)"
+)
+_URL_RE = re.compile(_URL_PATTERN, re.IGNORECASE)
+
+
+def extract_url(text: str) -> Optional[str]:
+    match = _URL_RE.search(text)
+    if not match:
+        return None
+    return match.group(0).rstrip(".,!?;:)")
+
+
+class RegexRule:
+    """Maps a compiled regex to an agent; the ``url`` group becomes an argument."""
+
+    def __init__(self, name: str, pattern: str, agent: str, confidence: float) -> None:
+        self.name = name
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        self.agent = agent
+        self.confidence = confidence
+
+    def match(self, text: str) -> Optional[RouteDecision]:
+        match = self.pattern.search(text)
+        if not match:
+            return None
+        arguments: Dict[str, Any] = {}
+        if "url" in self.pattern.groupindex:
+            arguments["url"] = match.group("url").rstrip(".,!?;:)")
+        return RouteDecision(
+            plan=AgentPlan(agent=self.agent, arguments=arguments),
+            confidence=self.confidence,
+            source=self.name,
+        )
+
+
+class KeywordRule:
+    """Routes to an agent when the text starts with one of the keywords."""
+
+    def __init__(
+        self, name: str, keywords: Sequence[str], agent: str, confidence: float, suffix: str = ""
+    ) -> None:
+        self.name = name
+        self.keywords = tuple(keyword.lower() for keyword in keywords)
+        self.agent = agent
+        self.confidence = confidence
+        self.suffix = suffix
+
+    def match(self, text: str) -> Optional[RouteDecision]:
+        lowered = text.lower()
+        if self.suffix and not lowered.endswith(self.suffix):
+            return None
+        if not lowered.startswith(self.keywords):
+            return None
+        return RouteDecision(
+            plan=AgentPlan(agent=self.agent, arguments={}),
+            confidence=self.confidence,
+            source=self.name,
+        )
+
+
+DEFAULT_RULES: List[IntentRule] = [
+    RegexRule("bare_url", rf"^\s*(?P<url>{_URL_PATTERN})\s*$", "browser", 0.99),
+    RegexRule(
+        "open_command",
+        rf"^\s*(?:открой|открыть|откройте|зайди на|перейди на|запусти сайт|open|go to)"
+        rf"\s+(?:сайт\s+|страницу\s+)?(?P<url>{_URL_PATTERN})\s*$",
+        "browser",
+        0.95,
+    ),
+    KeywordRule(
+        "question_words",
+        ("что ", "как ", "почему ", "зачем ", "кто ", "когда ", "где ", "сколько ",
+         "what ", "how ", "why ", "who ", "when ", "where "),
+        "qa",
+        0.9,
+        suffix="?",
+    ),
+]
+
+
+DEFAULT_TRAINING_SET: List[Tuple[str, str]] = [
+    ("открой youtube.com", "browser"),
+    ("открой сайт погоды gismeteo.ru", "browser"),
+    ("перейди на github.com", "browser"),
+    ("зайди на vk.com", "browser"),
+    ("открой мне википедию wikipedia.org", "browser"),
+    ("запусти в браузере google.com", "browser"),
+    ("покажи страницу habr.com", "browser"),
+    ("open youtube.com", "browser"),
+    ("go to github.com please", "browser"),
+    ("открой вкладку с почтой mail.ru", "browser"),
+    ("что такое квантовый компьютер", "qa"),
+    ("расскажи анекдот", "qa"),
+    ("как приготовить борщ", "qa"),
+    ("почему небо голубое", "qa"),
+    ("объясни разницу между tcp и udp", "qa"),
+    ("напиши стихотворение про осень", "qa"),
+    ("кто написал войну и мир", "qa"),
+    ("переведи на английский привет", "qa"),
+    ("what is the capital of france", "qa"),
+    ("сколько будет два плюс два", "qa"),
+]
+
+
+def hashed_ngram_vector(
+    np: Any, text: str, n_features: int, ngram_range: Tuple[int, int] = (2, 4)
+) -> Any:
+    """L2-normalized bag of hashed character n-grams and words."""
+    vector = np.zeros(n_features, dtype=np.float32)
+    normalized = f" {' '.join(text.lower().split())} "
+    low, high = ngram_range
+    for size in range(low, high + 1):
+        for start in range(len(normalized) - size + 1):
+            gram = normalized[start : start + size]
+            vector[zlib.crc32(gram.encode("utf-8")) % n_features] += 1.0
+    for word in normalized.split():
+        vector[zlib.crc32(b"w:" + word.encode("utf-8")) % n_features] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class HashedNgramClassifier:
+    """Softmax regression over hashed character n-grams and words (NumPy).
+
+    Hashing uses CRC32 so feature indices are stable across processes.
+    """
+
+    def __init__(self, n_features: int = 2 ** 12, ngram_range: Tuple[int, int] = (2, 4)) -> None:
+        try:
+            import numpy as np
+        except ImportError as exc:
+            raise RuntimeError("Для классификатора намерений нужна библиотека numpy") from exc
+        self._np = np
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.labels: List[str] = []
+        self.weights: Any = None
+
+    def _vectorize(self, text: str) -> Any:
+        return hashed_ngram_vector(self._np, text, self.n_features, self.ngram_range)
+
+    def fit(
+        self,
+        samples: Sequence[Tuple[str, str]],
+        epochs: int = 300,
+        learning_rate: float = 2.0,
+        l2: float = 1e-4,
+    ) -> "HashedNgramClassifier":
+        np = self._np
+        self.labels = sorted({label for _, label in samples})
+        index = {label: i for i, label in enumerate(self.labels)}
+        features = np.stack([self._vectorize(text) for text, _ in samples])
+        targets = np.zeros((len(samples), len(self.labels)), dtype=np.float32)
+        targets[np.arange(len(samples)), [index[label] for _, label in samples]] = 1.0
+        weights = np.zeros((self.n_features, len(self.labels)), dtype=np.float32)
+        for _ in range(epochs):
+            probabilities = self._softmax(features @ weights)
+            gradient = features.T @ (probabilities - targets) / len(samples) + l2 * weights
+            weights -= learning_rate * gradient
+        self.weights = weights
+        return self
+
+    def _softmax(self, logits: Any) -> Any:
+        np = self._np
+        shifted = logits - logits.max(axis=-1, keepdims=True)
+        exp = np.exp(shifted)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        if self.weights is None:
+            raise RuntimeError("Классификатор не обучен")
+        probabilities = self._softmax(self._vectorize(text) @ self.weights)
+        best = int(probabilities.argmax())
+        return self.labels[best], float(probabilities[best])
+
+
+@dataclass
+class RouterStats:
+    calls: int = 0
+    hits: int = 0
+    router_seconds: float = 0.0
+    planner_calls: int = 0
+    planner_seconds: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.calls if self.calls else 0.0
+
+    @property
+    def saved_seconds(self) -> float:
+        """Estimated planner time avoided, based on the mean fallback latency."""
+        if not self.planner_calls:
+            return 0.0
+        mean_planner = self.planner_seconds / self.planner_calls
+        return max(self.hits * mean_planner - self.router_seconds, 0.0)
+
+
+class IntentRouter:
+    """Local pre-router that answers obvious intents without calling the planner.
+
+    Rules are tried in order; the classifier is consulted only when no rule
+    fired. A plan is emitted only if its confidence reaches ``threshold``.
+    """
+
+    def __init__(
+        self,
+        rules: Optional[Sequence[IntentRule]] = None,
+        classifier: Optional[HashedNgramClassifier] = None,
+        threshold: float = 0.85,
+    ) -> None:
+        self.rules = list(DEFAULT_RULES if rules is None else rules)
+        self.classifier = classifier
+        self.threshold = threshold
+        self.stats = RouterStats()
+
+    def route(self, text: str) -> Optional[AgentPlan]:
+        started = time.perf_counter()
+        decision = self._decide(text.strip())
+        self.stats.calls += 1
+        self.stats.router_seconds += time.perf_counter() - started
+        if decision is None or decision.confidence < self.threshold:
+            return None
+        self.stats.hits += 1
+        return decision.plan
+
+    def record_planner_call(self, seconds: float) -> None:
+        self.stats.planner_calls += 1
+        self.stats.planner_seconds += seconds
+
+    def _decide(self, text: str) -> Optional[RouteDecision]:
+        for rule in self.rules:
+            decision = rule.match(text)
+            if decision is not None:
+                return decision
+        classifier = self.classifier
+        if classifier is None:
+            return None
+        agent, confidence = classifier.predict(text)
+        arguments: Dict[str, Any] = {}
+        if agent == "browser":
+            url = extract_url(text)
+            # Several addresses need a multi-step plan, which only the planner builds.
+            if url is None or len(_URL_RE.findall(text)) > 1:
+                return None
+            arguments["url"] = url
+        return RouteDecision(
+            plan=AgentPlan(agent=agent, arguments=arguments),
+            confidence=confidence,
+            source="classifier",
+        )
+
+
+CLASSIFIER_AGENTS = frozenset({"qa", "browser"})
+
+
+def _train_default_classifier() -> Optional[HashedNgramClassifier]:
+    try:
+        return HashedNgramClassifier().fit(DEFAULT_TRAINING_SET)
+    except RuntimeError:
+        return None
+
+
+def default_intent_router(
+    threshold: float = 0.85, background: bool = False, agents: Sequence[str] = ()
+) -> IntentRouter:
+    """Builds the router with default rules and, if numpy is available, a trained classifier.
+
+    With ``background`` the classifier is trained in a daemon thread and the
+    router relies on rules alone until it is ready, so startup does not wait
+    for the numpy import. The classifier only knows ``CLASSIFIER_AGENTS``: if
+    ``agents`` (the registered agent names) includes any other, it is not
+    trained and only rule hits skip the planner, so commands for those agents
+    are never routed to QA by a near-threshold score.
+    """
+    if not set(agents) <= CLASSIFIER_AGENTS:
+        return IntentRouter(threshold=threshold)
+    if not background:
+        return IntentRouter(classifier=_train_default_classifier(), threshold=threshold)
+    router = IntentRouter(threshold=threshold)
+
+    def train() -> None:
+        router.classifier = _train_default_classifier()
+
+    threading.Thread(target=train, name="intent-router-training", daemon=True).start()
+    return router
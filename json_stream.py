@@ -0,0 +1,92 @@
+"""Инкрементальный разбор JSON-объекта, приходящего по частям.
+
+Парсер принимает фрагменты потока и отдаёт поля верхнего уровня, как только
+их значение закончилось, не дожидаясь конца объекта. Текст до первой `{`
+и после закрывающей `}` игнорируется, поэтому лишние скобки вокруг JSON
+разбор не ломают.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional
+
+
+class IncrementalJSONParser:
+    def __init__(self) -> None:
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self.failed = False
+        self._chars: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._value_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """Добавляет фрагмент и возвращает поля, завершившиеся в нём."""
+        completed: Dict[str, Any] = {}
+        for char in chunk:
+            if self.done or self.failed:
+                break
+            if self._depth == 0:
+                if char == "{":
+                    self._chars.append(char)
+                    self._depth = 1
+                continue
+            position = len(self._chars)
+            self._chars.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._value_start is None and self._key_start is not None:
+                        self._key = json.loads("".join(self._chars[self._key_start : position + 1]))
+                        self._key_start = None
+                continue
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._value_start is None:
+                    self._key_start = position
+            elif char == ":" and self._depth == 1:
+                self._value_start = position + 1
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete_value(position, completed)
+                    self.done = True
+            elif char == "," and self._depth == 1:
+                self._complete_value(position, completed)
+        return completed
+
+    def _complete_value(self, end: int, completed: Dict[str, Any]) -> None:
+        if self._key is None or self._value_start is None:
+            return
+        raw = "".join(self._chars[self._value_start : end]).strip()
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            self.failed = True
+            return
+        self.fields[self._key] = value
+        completed[self._key] = value
+        self._key = None
+        self._value_start = None
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """Полностью разобранный объект или None, если он не закончился или был невалиден."""
+        if not self.done or self.failed:
+            return None
+        return dict(self.fields)
+
+
+def parse_first_object(payload: str) -> Optional[Dict[str, Any]]:
+    parser = IncrementalJSONParser()
+    parser.feed(payload)
+    return parser.result()
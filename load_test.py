@@ -0,0 +1,172 @@
+"""Нагрузочный тест server.py на локальной подмене DeepSeek.
+
+Поднимает MockDeepSeekServer и ChatServer в одном процессе; каждая сессия —
+отдельный поток-клиент со своим keep-alive соединением, отправляющий `--turns`
+сообщений подряд. Печатает пропускную способность, задержку хода p50/p95,
+процессорное время сервера на ход и оценку сессий на ядро при заданном темпе
+пользователя (`--think-time` секунд между сообщениями), а также память на
+активную и на выгруженную сессию.
+
+Запуск: python load_test.py --sessions 200 --turns 5 --latency 0.05 --think-time 10
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+from bench import BENCH_TURN_PROMPTS, StageResult
+from mock_server import MockBehavior, MockDeepSeekServer
+from server import ChatServer, build_server
+
+
+def _request(
+    connection: http.client.HTTPConnection, method: str, path: str, body: Any = None
+) -> Dict[str, Any]:
+    data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+    headers = {"Content-Type": "application/json"} if data is not None else {}
+    connection.request(method, path, body=data, headers=headers)
+    response = connection.getresponse()
+    payload = json.loads(response.read() or b"{}")
+    if response.status >= 400:
+        raise RuntimeError(f"{method} {path}: {response.status} {payload}")
+    return payload
+
+
+def run_clients(server: ChatServer, sessions: int, turns: int) -> StageResult:
+    """Все сессии параллельно; в результат попадает задержка каждого хода."""
+    address = urlsplit(server.url)
+    result = StageResult("server_turn")
+    lock = threading.Lock()
+    start = threading.Barrier(sessions + 1)
+
+    def client() -> None:
+        connection = http.client.HTTPConnection(address.hostname, address.port, timeout=120)
+        samples: List[float] = []
+        errors = 0
+        try:
+            session_id = _request(connection, "POST", "/sessions")["session"]
+            start.wait()
+            for turn in range(turns):
+                prompt = BENCH_TURN_PROMPTS[turn % len(BENCH_TURN_PROMPTS)]
+                started = time.perf_counter()
+                reply = _request(
+                    connection, "POST", f"/sessions/{session_id}/messages", {"prompt": prompt}
+                )
+                samples.append(time.perf_counter() - started)
+                errors += bool(reply.get("error"))
+        finally:
+            connection.close()
+        with lock:
+            result.samples.extend(samples)
+            result.errors += errors
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(sessions)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    result.wall_seconds = time.perf_counter() - started
+    return result
+
+
+def _directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def measure_session_memory(
+    server: ChatServer, sessions: int, turns: int
+) -> Tuple[float, float, float]:
+    """Байт на активную сессию, на выгруженную (в памяти) и на её файл на диске."""
+    manager = server.manager
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    ids = [manager.create() for _ in range(sessions)]
+    for session_id in ids:
+        for turn in range(turns):
+            manager.handle(session_id, BENCH_TURN_PROMPTS[turn % len(BENCH_TURN_PROMPTS)])
+    gc.collect()
+    active = tracemalloc.get_traced_memory()[0] - baseline
+    manager.evict_idle(now=time.monotonic() + manager.idle_seconds)
+    gc.collect()
+    spilled = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    disk = _directory_size(manager.spool_dir)
+    return active / sessions, spilled / sessions, disk / sessions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест многосессионного сервера")
+    parser.add_argument("--sessions", type=int, default=100, help="одновременных сессий")
+    parser.add_argument("--turns", type=int, default=5, help="сообщений на сессию")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа API, сек")
+    parser.add_argument("--max-concurrent", type=int, default=32, help="лимит запросов к API")
+    parser.add_argument(
+        "--think-time", type=float, default=10.0, help="секунд между сообщениями пользователя"
+    )
+    parser.add_argument("--memory-sessions", type=int, default=500)
+    args = parser.parse_args()
+
+    from chat import DeepSeekChatClient, DeepSeekClientError
+
+    spool_dir = tempfile.mkdtemp(prefix="vais-sessions-")
+    try:
+        with MockDeepSeekServer(MockBehavior(latency=args.latency)) as mock:
+            client = DeepSeekChatClient(
+                "load", mock.url, "deepseek-chat", 0.7, 256, 30, pool_size=args.max_concurrent
+            )
+            server = build_server(
+                client,
+                DeepSeekClientError,
+                port=0,
+                max_concurrent=args.max_concurrent,
+                max_active=args.sessions + args.memory_sessions,
+                spool_dir=spool_dir,
+            )
+            with server:
+                result = run_clients(server, args.sessions, args.turns)
+                stats = server.stats()
+                per_session = measure_session_memory(server, args.memory_sessions, 2)
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    turns = len(result.samples) + result.errors
+    cpu_per_turn = stats["handler_cpu_seconds"] / turns if turns else 0.0
+    print(f"Сессий: {args.sessions}, ходов: {turns}, ошибок: {result.errors}")
+    print(
+        f"Пропускная способность: {result.throughput:.1f} ходов/с, "
+        f"p50 {result.percentile(50) * 1000:.1f} мс, p95 {result.percentile(95) * 1000:.1f} мс"
+    )
+    for name, cls in stats["scheduler"].items():
+        if cls["submitted"]:
+            print(
+                f"Запросов к API ({name}): {cls['completed']}, пик очереди: {cls['peak_queued']}, "
+                f"ожидание p50 {cls['wait_p50'] * 1000:.1f} мс, p95 {cls['wait_p95'] * 1000:.1f} мс"
+            )
+    if cpu_per_turn:
+        print(
+            f"CPU сервера на ход: {cpu_per_turn * 1000:.2f} мс → одно ядро обслуживает "
+            f"~{1 / cpu_per_turn:.0f} ходов/с, ~{args.think_time / cpu_per_turn:.0f} сессий "
+            f"при сообщении раз в {args.think_time:g} с"
+        )
+    active, spilled, disk = per_session
+    print(
+        f"Память на сессию: активная {active / 1024:.1f} КБ, выгруженная {spilled / 1024:.2f} КБ "
+        f"(файл на диске {disk / 1024:.1f} КБ)"
+    )
+
+
+if __name__ == "__main__":
+    main()
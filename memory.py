@@ -0,0 +1,217 @@
+"""Долговременная память диалога: журнал в SQLite и локальный векторный индекс.
+
+Каждое сообщение дописывается в таблицу SQLite (только добавление), а его
+вектор — хэшированные n-граммы, как у `intent_router` — строкой float32 в
+файл `<path>.vectors`. При открытии файл отображается в память (np.memmap),
+новые строки копятся в заранее выделенном хвосте на `TAIL_ROWS` строк; когда
+он заполняется, файл отображается заново и хвост очищается. Так запуск не
+перечитывает историю, а поиск top-k — не больше двух матрично-векторных
+умножений при любом числе добавлений в процессе. В промпт попадают только k
+самых похожих фрагментов, и его размер не растёт вместе с историей.
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+from bisect import bisect_left
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence
+
+from intent_router import hashed_ngram_vector
+
+MEMORY_HEADER = "Фрагменты прошлых разговоров, которые могут быть полезны:"
+SNIPPET_CHARS = 400
+TAIL_ROWS = 1024
+
+
+@dataclass
+class MemorySnippet:
+    id: int
+    role: str
+    content: str
+    created: float
+    score: float
+
+
+@dataclass
+class MemoryStats:
+    appended: int = 0
+    recalls: int = 0
+    recalled_snippets: int = 0
+    recall_seconds: float = 0.0
+
+    @property
+    def average_recall_ms(self) -> float:
+        return self.recall_seconds / self.recalls * 1000 if self.recalls else 0.0
+
+
+class LongTermMemory:
+    def __init__(
+        self,
+        path: str,
+        dimensions: int = 256,
+        top_k: int = 3,
+        min_score: float = 0.45,
+        session: Optional[str] = None,
+    ) -> None:
+        try:
+            import numpy as np
+        except ImportError as exc:
+            raise RuntimeError("Для долговременной памяти нужна библиотека numpy") from exc
+        self._np = np
+        self.path = path
+        self.vectors_path = f"{path}.vectors"
+        self.dimensions = dimensions
+        self.top_k = top_k
+        self.min_score = min_score
+        self.session = session or time.strftime("%Y%m%d-%H%M%S")
+        self.stats = MemoryStats()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY, session TEXT, role TEXT, content TEXT, created REAL)"
+        )
+        self._db.commit()
+        self._ids: List[int] = [
+            row[0] for row in self._db.execute("SELECT id FROM messages ORDER BY id")
+        ]
+        self._matrix = self._open_vectors()
+        self._tail = np.empty((TAIL_ROWS, dimensions), dtype=np.float32)
+        self._tail_rows = 0
+        self._vectors_file = open(self.vectors_path, "ab")
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def embed(self, text: str) -> Any:
+        return hashed_ngram_vector(self._np, text, self.dimensions, ngram_range=(3, 4))
+
+    def _open_vectors(self) -> Any:
+        """Отображает файл векторов; недостающие после сбоя строки пересчитываются из SQLite."""
+        np = self._np
+        row_bytes = self.dimensions * 4
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        stored = min(size // row_bytes, len(self._ids))
+        if size != stored * row_bytes:
+            with open(self.vectors_path, "r+b" if size else "wb") as f:
+                f.truncate(stored * row_bytes)
+        if stored < len(self._ids):
+            missing = self._db.execute(
+                "SELECT content FROM messages WHERE id >= ? ORDER BY id", (self._ids[stored],)
+            )
+            with open(self.vectors_path, "ab") as f:
+                for (content,) in missing:
+                    f.write(self.embed(content).astype(np.float32).tobytes())
+            stored = len(self._ids)
+        return self._map(stored)
+
+    def _map(self, rows: int) -> Any:
+        np = self._np
+        if not rows:
+            return np.zeros((0, self.dimensions), dtype=np.float32)
+        return np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimensions)
+        )
+
+    def append(self, role: str, content: str) -> int:
+        content = content.strip()
+        vector = self.embed(content).astype(self._np.float32)
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO messages (session, role, content, created) VALUES (?, ?, ?, ?)",
+                (self.session, role, content, time.time()),
+            )
+            self._db.commit()
+            self._vectors_file.write(vector.tobytes())
+            self._vectors_file.flush()
+            message_id = int(cursor.lastrowid)
+            self._ids.append(message_id)
+            if self._tail_rows == TAIL_ROWS:
+                # Поиск держит ссылки на прежние матрицы, поэтому хвост не переписывается.
+                self._matrix = self._map(len(self._ids) - 1)
+                self._tail = self._np.empty_like(self._tail)
+                self._tail_rows = 0
+            self._tail[self._tail_rows] = vector
+            self._tail_rows += 1
+            self.stats.appended += 1
+        return message_id
+
+    def search(
+        self, query: str, k: Optional[int] = None, exclude_from: Optional[int] = None
+    ) -> List[MemorySnippet]:
+        """Top-k сообщений по косинусной близости; строки с id от `exclude_from` не ищутся."""
+        np = self._np
+        k = k or self.top_k
+        query_vector = self.embed(query)
+        with self._lock:
+            searchable = len(self._ids)
+            if exclude_from is not None:
+                searchable = bisect_left(self._ids, exclude_from)
+            if searchable <= 0:
+                return []
+            matrix, tail = self._matrix, self._tail[: self._tail_rows]
+            ids = self._ids[:searchable]
+        scores = np.asarray(matrix[: min(len(matrix), searchable)] @ query_vector)
+        if searchable > len(matrix):
+            scores = np.concatenate([scores, tail[: searchable - len(matrix)] @ query_vector])
+        if len(scores) > k:
+            candidates = np.argpartition(-scores, k)[:k]
+        else:
+            candidates = np.arange(len(scores))
+        ranked = [
+            int(index)
+            for index in candidates[np.argsort(-scores[candidates])]
+            if scores[index] >= self.min_score
+        ]
+        return self._load(ids, ranked, scores)
+
+    def _load(self, ids: Sequence[int], ranked: List[int], scores: Any) -> List[MemorySnippet]:
+        if not ranked:
+            return []
+        wanted = [ids[index] for index in ranked]
+        placeholders = ",".join("?" * len(wanted))
+        with self._lock:
+            rows = {
+                row[0]: row
+                for row in self._db.execute(
+                    "SELECT id, role, content, created FROM messages "
+                    f"WHERE id IN ({placeholders})",
+                    wanted,
+                )
+            }
+        return [
+            MemorySnippet(
+                id=ids[index],
+                role=rows[ids[index]][1],
+                content=rows[ids[index]][2],
+                created=rows[ids[index]][3],
+                score=float(scores[index]),
+            )
+            for index in ranked
+            if ids[index] in rows
+        ]
+
+    def recall_block(self, query: str, exclude_from: Optional[int] = None) -> Optional[str]:
+        """Системное сообщение с найденными фрагментами или None, если ничего не нашлось."""
+        started = time.perf_counter()
+        snippets = self.search(query, exclude_from=exclude_from)
+        self.stats.recalls += 1
+        self.stats.recall_seconds += time.perf_counter() - started
+        if not snippets:
+            return None
+        self.stats.recalled_snippets += len(snippets)
+        lines = [MEMORY_HEADER]
+        for snippet in snippets:
+            speaker = "Пользователь" if snippet.role == "user" else "Ассистент"
+            created = time.strftime("%Y-%m-%d", time.localtime(snippet.created))
+            lines.append(f"- [{created}] {speaker}: {snippet.content[:SNIPPET_CHARS]}")
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        with self._lock:
+            self._vectors_file.close()
+            self._db.close()
@@ -0,0 +1,108 @@
+"""Компактные сообщения чата и сборка тела запроса из готовых байтов.
+
+`Message` — неизменяемый объект со `__slots__` вместо словаря: роль берётся
+из интернированных строк, а JSON сообщения кодируется один раз и хранится
+вместе с ним. Сообщение ведёт себя как Mapping (`message["content"]`,
+`dict(message)`), поэтому остальной код работать с ним не меняется.
+
+`RequestBodyBuilder` склеивает тело /chat/completions из байтов: параметры
+запроса кодируются заново (они короткие), описание `tools` кэшируется по
+объекту, а история — это `b", ".join` уже закодированных сообщений. Так
+длинная история не сериализуется целиком на каждом запросе.
+"""
+from __future__ import annotations
+
+import json
+import sys
+import threading
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+ROLES = {role: sys.intern(role) for role in ("system", "user", "assistant", "tool")}
+_FIELDS = ("role", "content")
+
+
+def intern_role(role: str) -> str:
+    return ROLES.get(role) or sys.intern(role)
+
+
+class Message(Mapping):
+    """`memory_id` — номер строки в долговременной памяти, если сообщение туда записано."""
+
+    __slots__ = ("role", "content", "memory_id", "_encoded")
+
+    def __init__(self, role: str, content: str) -> None:
+        self.role = intern_role(role)
+        self.content = content
+        self.memory_id: Optional[int] = None
+        self._encoded: Optional[bytes] = None
+
+    @classmethod
+    def from_mapping(cls, message: Any) -> "Message":
+        if isinstance(message, Message):
+            return message
+        return cls(message["role"], message["content"])
+
+    def __getitem__(self, key: str) -> str:
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(_FIELDS)
+
+    def __len__(self) -> int:
+        return len(_FIELDS)
+
+    def __repr__(self) -> str:
+        return f"Message(role={self.role!r}, content={self.content!r})"
+
+    @property
+    def encoded(self) -> bytes:
+        """JSON сообщения в UTF-8; считается при первом обращении."""
+        encoded = self._encoded
+        if encoded is None:
+            encoded = self._encoded = json.dumps(
+                {"role": self.role, "content": self.content}, ensure_ascii=False
+            ).encode("utf-8")
+        return encoded
+
+
+def encode_message(message: Any) -> bytes:
+    if isinstance(message, Message):
+        return message.encoded
+    return json.dumps(dict(message), ensure_ascii=False).encode("utf-8")
+
+
+class RequestBodyBuilder:
+    """Тело запроса из параметров, `tools` и сообщений; `tools` кодируются один раз на объект."""
+
+    def __init__(self) -> None:
+        self._tools: Optional[Tuple[Any, bytes]] = None
+        self._lock = threading.Lock()
+
+    def _encoded_tools(self, tools: List[Dict[str, Any]]) -> bytes:
+        cached = self._tools
+        if cached is not None and cached[0] is tools:
+            return cached[1]
+        encoded = json.dumps(tools, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self._tools = (tools, encoded)
+        return encoded
+
+    def build(
+        self,
+        params: Dict[str, Any],
+        messages: Sequence[Any],
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ) -> bytes:
+        head = json.dumps(params, ensure_ascii=False).encode("utf-8")[:-1]
+        separator = b", " if params else b""
+        parts = [head]
+        if tools:
+            parts += [separator, b'"tools": ', self._encoded_tools(tools)]
+            separator = b", "
+        parts += [separator, b'"messages": [', b", ".join(map(encode_message, messages)), b"]}"]
+        return b"".join(parts)
@@ -0,0 +1,311 @@
+"""Локальная подмена эндпоинта DeepSeek /chat/completions.
+
+Нужна для проверки повторов, хеджирования и circuit breaker без сети и для
+бенчмарков: задержка, джиттер, доля ошибок, темп потоковой выдачи и заранее
+заданные ответы-ошибки настраиваются.
+
+Запуск: python mock_server.py --port 8765 --latency 0.2 --jitter 0.05 --error-rate 0.1
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+PLANNER_MARKER = '"agent"'
+URL_PATTERN = re.compile(r"(?:https?://)?[\w-]+(?:\.[\w-]+)*\.[a-zа-я]{2,}\S*", re.IGNORECASE)
+MAX_SEEN_PREFIXES = 100_000
+
+
+def default_reply(payload: Dict[str, Any]) -> str:
+    """План для планировщика (шаг `browser` на каждый адрес), прочим — эхо последней реплики."""
+    messages: List[Dict[str, str]] = payload.get("messages") or []
+    system = messages[0]["content"] if messages and messages[0].get("role") == "system" else ""
+    last = messages[-1]["content"] if messages else ""
+    if PLANNER_MARKER in system:
+        urls = URL_PATTERN.findall(last)
+        plan: Dict[str, Any]
+        if len(urls) > 1:
+            plan = {
+                "steps": [
+                    {"id": f"s{number}", "agent": "browser", "arguments": {"url": url}}
+                    for number, url in enumerate(urls, start=1)
+                ]
+            }
+        elif urls:
+            plan = {"agent": "browser", "arguments": {"url": urls[0]}}
+        else:
+            plan = {"agent": "qa", "arguments": {}}
+        return json.dumps(plan, ensure_ascii=False)
+    return f"Ответ на: {last}"
+
+
+def default_tool_reply(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Вызов `browser` на каждый адрес запроса, если инструмент объявлен; иначе текстовый ответ."""
+    messages: List[Dict[str, str]] = payload.get("messages") or []
+    last = messages[-1]["content"] if messages else ""
+    names = {tool.get("function", {}).get("name") for tool in payload.get("tools") or []}
+    urls = URL_PATTERN.findall(last)
+    if "browser" in names and urls:
+        return {
+            "role": "assistant",
+            "content": "",
+            "tool_calls": [
+                {
+                    "id": f"call_mock_{number}",
+                    "type": "function",
+                    "function": {
+                        "name": "browser",
+                        "arguments": json.dumps({"url": url}, ensure_ascii=False),
+                    },
+                }
+                for number, url in enumerate(urls, start=1)
+            ],
+        }
+    return {"role": "assistant", "content": default_reply(payload)}
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+@dataclass
+class MockBehavior:
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    token_interval: float = 0.0
+    reply: Callable[[Dict[str, Any]], str] = default_reply
+    tool_reply: Callable[[Dict[str, Any]], Dict[str, Any]] = default_tool_reply
+    request_latency: Optional[Callable[[Dict[str, Any]], float]] = None
+
+    def sample_latency(self) -> float:
+        """Задержка до ответа (или первого токена): latency ± jitter, не меньше нуля."""
+        if not self.jitter:
+            return self.latency
+        return max(self.latency + random.uniform(-self.jitter, self.jitter), 0.0)
+
+    def latency_for(self, payload: Dict[str, Any]) -> float:
+        """Задержка конкретного запроса: из `request_latency`, если задана, иначе случайная."""
+        if self.request_latency is not None:
+            return self.request_latency(payload)
+        return self.sample_latency()
+
+
+class MockDeepSeekServer:
+    """HTTP-сервер в фоновом потоке; `url` подставляется в клиент вместо DeepSeek."""
+
+    def __init__(
+        self, behavior: Optional[MockBehavior] = None, host: str = "127.0.0.1", port: int = 0
+    ) -> None:
+        self.behavior = behavior or MockBehavior()
+        self.requests_served = 0
+        self._scripted_statuses: Deque[Tuple[int, Optional[float]]] = deque()
+        self._seen_prefixes: Set[str] = set()
+        self._lock = threading.Lock()
+        self._server = _QuietHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def fail_next(self, count: int, status: int = 503, retry_after: Optional[float] = None) -> None:
+        """Следующие `count` запросов получат ответ с кодом `status` и `Retry-After`, если задан."""
+        with self._lock:
+            self._scripted_statuses.extend([(status, retry_after)] * count)
+
+    def _cached_prompt_chars(self, messages: List[Dict[str, str]]) -> int:
+        """Длина самого длинного уже виденного префикса из целых сообщений (как кэш DeepSeek)."""
+        digest = hashlib.sha256()
+        cached = 0
+        length = 0
+        with self._lock:
+            if len(self._seen_prefixes) > MAX_SEEN_PREFIXES:
+                self._seen_prefixes.clear()
+            for message in messages:
+                encoded = json.dumps(message, ensure_ascii=False, sort_keys=True)
+                digest.update(encoded.encode("utf-8"))
+                length += len(message.get("content", ""))
+                key = digest.hexdigest()
+                if key in self._seen_prefixes:
+                    cached = length
+                else:
+                    self._seen_prefixes.add(key)
+        return cached
+
+    def _next_status(self) -> Tuple[int, Optional[float]]:
+        with self._lock:
+            self.requests_served += 1
+            if self._scripted_statuses:
+                return self._scripted_statuses.popleft()
+        if self.behavior.error_rate and random.random() < self.behavior.error_rate:
+            return self.behavior.error_status, None
+        return 200, None
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+                pass
+
+            def do_HEAD(self) -> None:  # noqa: N802
+                """Прогрев соединения клиентом: пустой ответ без закрытия keep-alive."""
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self) -> None:  # noqa: N802
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                status, retry_after = server._next_status()
+                delay = server.behavior.latency_for(payload)
+                if delay:
+                    time.sleep(delay)
+                if status != 200:
+                    headers = {"Retry-After": f"{retry_after:g}"} if retry_after is not None else {}
+                    body = {"error": {"message": f"mock error {status}"}}
+                    self._send_json(status, body, headers)
+                    return
+                cached_chars = server._cached_prompt_chars(payload.get("messages") or [])
+                if payload.get("tools"):
+                    message = server.behavior.tool_reply(payload)
+                    body = _completion(message.get("content") or "", payload, cached_chars)
+                    body["choices"][0]["message"] = message
+                    self._send_json(200, body)
+                    return
+                content = server.behavior.reply(payload)
+                if payload.get("stream"):
+                    self._send_stream(content, payload, cached_chars)
+                else:
+                    self._send_json(200, _completion(content, payload, cached_chars))
+
+            def _send_json(
+                self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None
+            ) -> None:
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(
+                self, content: str, payload: Dict[str, Any], cached_chars: int
+            ) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for index, token in enumerate(content.split(" ")):
+                    if index and server.behavior.token_interval:
+                        time.sleep(server.behavior.token_interval)
+                    chunk = {"choices": [{"delta": {"content": token + " "}}]}
+                    line = f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    self.wfile.write(line.encode("utf-8"))
+                    self.wfile.flush()
+                if (payload.get("stream_options") or {}).get("include_usage"):
+                    usage = {
+                        "choices": [],
+                        "usage": _completion(content, payload, cached_chars)["usage"],
+                    }
+                    self.wfile.write(f"data: {json.dumps(usage)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
+
+    def start(self) -> "MockDeepSeekServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Блокирующий запуск в текущем потоке (для запуска из командной строки)."""
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockDeepSeekServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+def _completion(content: str, payload: Dict[str, Any], cached_chars: int = 0) -> Dict[str, Any]:
+    prompt_chars = sum(len(message.get("content", "")) for message in payload.get("messages", []))
+    cache_hit_tokens = cached_chars // 4
+    return {
+        "id": "mock",
+        "object": "chat.completion",
+        "model": payload.get("model", "mock"),
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+        ],
+        "usage": {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": (prompt_chars + len(content)) // 4,
+            "prompt_cache_hit_tokens": cache_hit_tokens,
+            "prompt_cache_miss_tokens": prompt_chars // 4 - cache_hit_tokens,
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Локальная подмена DeepSeek /chat/completions")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки ±, сек")
+    parser.add_argument(
+        "--token-interval", type=float, default=0.0, help="пауза между токенами потока, сек"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов с ошибкой")
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+    behavior = MockBehavior(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        token_interval=args.token_interval,
+    )
+    server = MockDeepSeekServer(behavior, args.host, args.port)
+    print(f"Mock DeepSeek: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
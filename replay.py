@@ -0,0 +1,268 @@
+"""Воспроизведение записанных сессий под нагрузкой на локальной подмене DeepSeek.
+
+Читает записи session_trace (`SESSION_TRACE_DIR`) и прогоняет каждую сессию
+`--copies` раз одновременно: каждая копия — отдельный поток со своим
+диспетчером (`server.SessionFactory`, режим — из заголовка записи). Ходы
+отправляются с записанными паузами, ускоренными в `--speed` раз.
+MockDeepSeekServer отвечает записанным ответом на такой же запрос этой сессии
+с записанной задержкой, тоже ускоренной. Сессия узнаётся по имени модели в
+запросе.
+
+Печатает пропускную способность, задержку хода p50/p95/p99, число запросов
+без записанного ответа и расхождения решений планировщика (агент и аргументы или шаги)
+между записью и воспроизведением.
+
+Запуск: python replay.py sessions_trace/*.jsonl --speed 10 --copies 20
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from bench import StageResult
+from extensions import default_extensions
+from intent_router import default_intent_router
+from mock_server import MockBehavior, MockDeepSeekServer, default_reply, default_tool_reply
+from server import SessionFactory
+from session_trace import RecordedSession, load_session
+
+MODEL_PREFIX = "replay-"
+
+
+def _request_key(messages: List[Dict[str, Any]], tools: bool) -> Tuple[str, str, bool]:
+    """Системный промпт отличает планировщик, QA и выжимку, последнее сообщение — ход."""
+    system = messages[0]["content"] if messages and messages[0].get("role") == "system" else ""
+    last = (messages[-1].get("content") or "") if messages else ""
+    return system, last, tools
+
+
+class RecordedEndpoint:
+    """Ответы и задержки записанных обменов по сессиям; неизвестные запросы — ответ подмены."""
+
+    def __init__(self, sessions: List[RecordedSession], speed: float) -> None:
+        self.speed = speed
+        self.unmatched = 0
+        self._answers: List[Dict[Tuple[str, str, bool], Deque[Tuple[Any, float]]]] = []
+        self._pending: Dict[int, Optional[Tuple[Any, float]]] = {}
+        self._lock = threading.Lock()
+        for recorded in sessions:
+            answers: Dict[Tuple[str, str, bool], Deque[Tuple[Any, float]]] = {}
+            for exchange in recorded.exchanges:
+                if exchange.error is not None:
+                    continue
+                key = _request_key(exchange.messages, exchange.kind == "tools")
+                answers.setdefault(key, deque()).append((exchange.response, exchange.seconds))
+            self._answers.append(answers)
+
+    def behavior(self) -> MockBehavior:
+        return MockBehavior(
+            reply=self.reply, tool_reply=self.tool_reply, request_latency=self.latency
+        )
+
+    def _lookup(self, payload: Dict[str, Any]) -> Optional[Tuple[Any, float]]:
+        model = str(payload.get("model", ""))
+        if not model.startswith(MODEL_PREFIX):
+            return None
+        answers = self._answers[int(model[len(MODEL_PREFIX) :])]
+        key = _request_key(payload.get("messages") or [], bool(payload.get("tools")))
+        with self._lock:
+            queue = answers.get(key)
+            if not queue:
+                self.unmatched += 1
+                return None
+            # Последний ответ остаётся: повторный такой же запрос получит его снова.
+            return queue.popleft() if len(queue) > 1 else queue[0]
+
+    def latency(self, payload: Dict[str, Any]) -> float:
+        answer = self._lookup(payload)
+        with self._lock:
+            self._pending[id(payload)] = answer
+        return answer[1] / self.speed if answer is not None else 0.0
+
+    def _answer(self, payload: Dict[str, Any]) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            return self._pending.pop(id(payload), None)
+
+    def reply(self, payload: Dict[str, Any]) -> str:
+        answer = self._answer(payload)
+        if answer is None or not isinstance(answer[0], str):
+            return default_reply(payload)
+        return answer[0]
+
+    def tool_reply(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        answer = self._answer(payload)
+        if answer is None or not isinstance(answer[0], dict):
+            return default_tool_reply(payload)
+        return answer[0]
+
+
+@dataclass
+class PlanDiff:
+    session: str
+    turn: int
+    prompt: str
+    recorded: Tuple[str, Dict[str, Any]]
+    replayed: Tuple[str, Dict[str, Any]]
+
+
+@dataclass
+class ReplayResult:
+    turns: StageResult = field(default_factory=lambda: StageResult("replay_turn"))
+    compared: int = 0
+    diffs: List[PlanDiff] = field(default_factory=list)
+
+
+class _Shared:
+    """Общие для всех копий маршрутизатор намерений, расширения и пул потокового плана."""
+
+    def __init__(self, sessions: List[RecordedSession]) -> None:
+        self.extensions = default_extensions({"dry_run": True})
+        settings = [recorded.settings for recorded in sessions]
+        fast = [item for item in settings if item.get("fast_path_router")]
+        self.fast_router = (
+            default_intent_router(
+                fast[0].get("fast_path_threshold", 0.85), agents=list(self.extensions.specs)
+            )
+            if fast
+            else None
+        )
+        self.plan_executor = ThreadPoolExecutor(max_workers=32)
+
+    def factory(self, client: Any, error_cls: type, settings: Dict[str, Any]) -> SessionFactory:
+        return SessionFactory(
+            client,
+            error_cls,
+            self.extensions,
+            tools_mode=settings.get("dispatch_mode") == "tools",
+            fast_router=self.fast_router if settings.get("fast_path_router") else None,
+            plan_executor=self.plan_executor if settings.get("streaming_planner") else None,
+        )
+
+
+def replay(
+    sessions: List[RecordedSession], url: str, speed: float, copies: int
+) -> ReplayResult:
+    """Все сессии × `copies` параллельно с записанными паузами между ходами."""
+    from chat import DeepSeekChatClient, DeepSeekClientError
+
+    result = ReplayResult()
+    shared = _Shared(sessions)
+    lock = threading.Lock()
+    start = threading.Barrier(len(sessions) * copies + 1)
+
+    def run(index: int, recorded: RecordedSession) -> None:
+        client = DeepSeekChatClient("replay", url, f"{MODEL_PREFIX}{index}", 0.7, 256, 60)
+        dispatcher = shared.factory(client, DeepSeekClientError, recorded.settings).build()
+        samples: List[float] = []
+        diffs: List[PlanDiff] = []
+        errors = 0
+        start.wait()
+        began = time.perf_counter()
+        for number, turn in enumerate(recorded.turns):
+            delay = began + turn.t / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            started = time.perf_counter()
+            try:
+                outcome = dispatcher.handle(turn.prompt)
+            except Exception:  # noqa: BLE001
+                errors += 1
+                continue
+            samples.append(time.perf_counter() - started)
+            errors += outcome.error
+            steps = [asdict(step) for step in outcome.plan.steps]
+            replayed = _decision(outcome.plan.agent, outcome.plan.arguments, steps)
+            expected = _decision(turn.agent, turn.arguments, turn.steps)
+            if replayed != expected:
+                diffs.append(
+                    PlanDiff(
+                        os.path.basename(recorded.path), number, turn.prompt, expected, replayed
+                    )
+                )
+        with lock:
+            result.turns.samples.extend(samples)
+            result.turns.errors += errors
+            result.compared += len(recorded.turns)
+            result.diffs.extend(diffs)
+
+    threads = [
+        threading.Thread(target=run, args=(index, recorded), daemon=True)
+        for index, recorded in enumerate(sessions * copies)
+    ]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    result.turns.wall_seconds = time.perf_counter() - started
+    shared.plan_executor.shutdown(wait=False)
+    return result
+
+
+def _decision(
+    agent: str, arguments: Dict[str, Any], steps: List[Dict[str, Any]]
+) -> Tuple[str, Dict[str, Any]]:
+    """Агент и аргументы хода; у многошагового плана вместо аргументов — шаги."""
+    return (agent, {"steps": steps}) if steps else (agent, arguments)
+
+
+def _describe(plan: Tuple[str, Dict[str, Any]]) -> str:
+    agent, arguments = plan
+    return f"{agent} {json.dumps(arguments, ensure_ascii=False)}" if arguments else agent
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных сессий под нагрузкой")
+    parser.add_argument("traces", nargs="+", help="файлы записей или каталоги с ними")
+    parser.add_argument("--speed", type=float, default=10.0, help="ускорение пауз и ответов API")
+    parser.add_argument("--copies", type=int, default=1, help="копий каждой сессии")
+    parser.add_argument("--show-diffs", type=int, default=10, help="сколько расхождений печатать")
+    args = parser.parse_args()
+
+    paths: List[str] = []
+    for pattern in args.traces:
+        if os.path.isdir(pattern):
+            paths += sorted(glob.glob(os.path.join(pattern, "*.jsonl")))
+        else:
+            paths += sorted(glob.glob(pattern))
+    recorded = [session for session in map(load_session, paths) if session.turns]
+    if not recorded:
+        parser.error("в записях нет ни одного хода")
+
+    sessions = recorded * args.copies
+    endpoint = RecordedEndpoint(sessions, args.speed)
+    with MockDeepSeekServer(endpoint.behavior()) as mock:
+        result = replay(recorded, mock.url, args.speed, args.copies)
+        requests = mock.requests_served
+
+    turns = result.turns
+    print(
+        f"Сессий: {len(sessions)} ({len(recorded)} записей × {args.copies}), "
+        f"ходов: {result.compared}, ошибок: {turns.errors}, ускорение ×{args.speed:g}"
+    )
+    print(
+        f"Пропускная способность: {turns.throughput:.1f} ходов/с, "
+        f"p50 {turns.percentile(50) * 1000:.1f} мс, p95 {turns.percentile(95) * 1000:.1f} мс, "
+        f"p99 {turns.percentile(99) * 1000:.1f} мс"
+    )
+    print(f"Запросов к API: {requests}, без записанного ответа: {endpoint.unmatched}")
+    matched = result.compared - len(result.diffs)
+    print(f"Решения планировщика: совпало {matched}/{result.compared}")
+    for diff in result.diffs[: args.show_diffs]:
+        print(
+            f"  {diff.session} ход {diff.turn} «{diff.prompt}»: "
+            f"запись {_describe(diff.recorded)} → повтор {_describe(diff.replayed)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
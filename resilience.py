@@ -0,0 +1,143 @@
+"""Политики устойчивости HTTP-клиента: повторы, хеджирование и circuit breaker.
+
+Модуль не зависит от транспорта: клиент сам решает, какие ошибки повторяемы,
+и сообщает о результатах вызовов. Часы и sleep можно подменить в тестах.
+"""
+from __future__ import annotations
+
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Optional
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+@dataclass
+class RetryPolicy:
+    """Экспоненциальная задержка с джиттером между повторами на 429/5xx и сетевых ошибках."""
+
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    jitter: float = 0.1
+    sleep: Callable[[float], None] = time.sleep
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Пауза перед попыткой `attempt + 1` (нумерация с 1)."""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        backoff = min(self.base_delay * (2 ** (attempt - 1)), self.max_delay)
+        return backoff * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных запросов для оценки перцентилей."""
+
+    def __init__(self, window: int = 200) -> None:
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(int(q / 100 * len(samples)), len(samples) - 1)
+        return samples[index]
+
+
+@dataclass
+class HedgePolicy:
+    """Дублирующий запрос, если первый не ответил за p95 последних задержек."""
+
+    percentile: float = 95.0
+    min_delay: float = 1.0
+    max_delay: float = 10.0
+    min_samples: int = 20
+    max_hedges: int = 1
+
+    def delay(self, tracker: LatencyTracker) -> float:
+        if len(tracker) < self.min_samples:
+            return self.max_delay
+        observed = tracker.percentile(self.percentile) or self.max_delay
+        return min(max(observed, self.min_delay), self.max_delay)
+
+
+class CircuitBreaker:
+    """Размыкается после `failure_threshold` подряд ошибок и пропускает пробный вызов через `reset_timeout`."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """Освобождает пробный вызов, не меняя состояния.
+
+        Для ошибок, которые ничего не говорят о здоровье сервиса (400, 401).
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+
+
+@dataclass
+class ResilienceStats:
+    calls: int = 0
+    retries: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    short_circuits: int = 0
+    failures: int = 0
+    latency: LatencyTracker = field(default_factory=LatencyTracker)
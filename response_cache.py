@@ -0,0 +1,361 @@
+"""Кэш ответов LLM поверх протокола ChatBackend.
+
+Два уровня: LRU в памяти с TTL и SQLite на диске; устаревшие записи диска
+периодически удаляются, а их число ограничено. Для QA дополнительно можно
+включить поиск почти-дубликатов последнего вопроса по локальным эмбеддингам
+(hashed n-grams), если установлен numpy. Контекст почти-дубликата — системный
+промпт и несколько последних реплик, а не вся история.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from agents import ChatBackend
+from intent_router import hashed_ngram_vector
+
+
+@dataclass
+class CachePolicy:
+    """Политика кэширования для одного вызывающего агента."""
+
+    enabled: bool = True
+    ttl_seconds: float = 3600.0
+    persist: bool = True
+    near_duplicate: bool = False
+    similarity_threshold: float = 0.92
+    near_context_messages: int = 2
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    near_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits + self.near_hits
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def normalize_messages(messages: Sequence[Mapping[str, str]]) -> List[Dict[str, str]]:
+    return [
+        {"role": message["role"], "content": " ".join(message["content"].split())}
+        for message in messages
+    ]
+
+
+def cache_key(messages: Sequence[Mapping[str, str]], params: Dict[str, Any]) -> str:
+    body = json.dumps(
+        {"params": params, "messages": normalize_messages(messages)},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Потокобезопасный LRU в памяти с TTL на запись."""
+
+    def __init__(self, capacity: int, stats: CacheStats) -> None:
+        self.capacity = max(capacity, 1)
+        self.stats = stats
+        self._items: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, ttl_seconds: float) -> Optional[str]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            created, value = item
+            if time.time() - created > ttl_seconds:
+                del self._items[key]
+                self.stats.expirations += 1
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str, created: Optional[float] = None) -> None:
+        with self._lock:
+            self._items[key] = (time.time() if created is None else created, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+                self.stats.evictions += 1
+
+
+class SQLiteResponseStore:
+    """Постоянное хранилище ответов: ключ — хэш сообщений и параметров модели."""
+
+    def __init__(self, path: str) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, namespace TEXT, response TEXT, created REAL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_created ON responses (namespace, created)"
+            )
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created, response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put(self, key: str, namespace: str, value: str, created: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, namespace, response, created) "
+                "VALUES (?, ?, ?, ?)",
+                (key, namespace, value, created),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def prune(self, namespace: str, ttl_seconds: float, max_entries: int) -> int:
+        """Удаляет записи `namespace` старше TTL и самые старые сверх `max_entries`."""
+        with self._lock, self._conn:
+            expired = self._conn.execute(
+                "DELETE FROM responses WHERE namespace = ? AND created < ?",
+                (namespace, time.time() - ttl_seconds),
+            ).rowcount
+            overflow = self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                "ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (max_entries,),
+            ).rowcount
+        return expired + overflow
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class NearDuplicateIndex:
+    """Поиск похожего последнего вопроса среди ответов с тем же контекстом."""
+
+    def __init__(self, n_features: int = 2 ** 12, max_entries: int = 512) -> None:
+        try:
+            import numpy as np
+        except ImportError as exc:
+            raise RuntimeError("Для поиска почти-дубликатов нужна библиотека numpy") from exc
+        self._np = np
+        self.n_features = n_features
+        self.max_entries = max_entries
+        self._entries: Dict[str, List[Tuple[Any, float, str]]] = {}
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> Any:
+        return hashed_ngram_vector(self._np, text.strip().rstrip("?!.…"), self.n_features)
+
+    def lookup(
+        self, context_key: str, question: str, threshold: float, ttl_seconds: float
+    ) -> Optional[str]:
+        with self._lock:
+            entries = list(self._entries.get(context_key, ()))
+        if not entries:
+            return None
+        now = time.time()
+        fresh = [entry for entry in entries if now - entry[1] <= ttl_seconds]
+        if not fresh:
+            return None
+        matrix = self._np.stack([entry[0] for entry in fresh])
+        scores = matrix @ self.embed(question)
+        best = int(scores.argmax())
+        return fresh[best][2] if scores[best] >= threshold else None
+
+    def add(self, context_key: str, question: str, value: str) -> None:
+        entry = (self.embed(question), time.time(), value)
+        with self._lock:
+            bucket = self._entries.setdefault(context_key, [])
+            bucket.append(entry)
+            del bucket[: -self.max_entries]
+
+
+class ResponseCache:
+    """Общие хранилища кэша; `wrap` создаёт обёртку клиента со своей политикой."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        capacity: int = 256,
+        max_disk_entries: int = 10_000,
+        sweep_every: int = 100,
+    ) -> None:
+        self.stats = CacheStats()
+        self.memory = LRUCache(capacity, self.stats)
+        self.store = SQLiteResponseStore(path) if path else None
+        self.max_disk_entries = max_disk_entries
+        self.sweep_every = max(sweep_every, 1)
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        self._near_index: Optional[NearDuplicateIndex] = None
+        self._near_index_failed = False
+
+    @property
+    def near_index(self) -> Optional[NearDuplicateIndex]:
+        if self._near_index is None and not self._near_index_failed:
+            try:
+                self._near_index = NearDuplicateIndex()
+            except RuntimeError:
+                self._near_index_failed = True
+        return self._near_index
+
+    def wrap(
+        self, backend: ChatBackend, policy: CachePolicy, namespace: str
+    ) -> "CachingChatBackend":
+        return CachingChatBackend(backend, self, policy, namespace)
+
+    def persisted(self, namespace: str, ttl_seconds: float) -> None:
+        """Учитывает запись на диск; каждая `sweep_every`-я (и первая) чистит хранилище."""
+        if self.store is None:
+            return
+        with self._writes_lock:
+            sweep = self._writes % self.sweep_every == 0
+            self._writes += 1
+        if sweep:
+            self.stats.expirations += self.store.prune(
+                namespace, ttl_seconds, self.max_disk_entries
+            )
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+
+
+class CachingChatBackend:
+    """ChatBackend, отдающий сохранённые ответы вместо повторных запросов."""
+
+    def __init__(
+        self, backend: ChatBackend, cache: ResponseCache, policy: CachePolicy, namespace: str
+    ) -> None:
+        self.backend = backend
+        self.cache = cache
+        self.policy = policy
+        self.namespace = namespace
+
+    def _params(self) -> Dict[str, Any]:
+        return {
+            "namespace": self.namespace,
+            "model": getattr(self.backend, "model", None),
+            "temperature": getattr(self.backend, "temperature", None),
+            "max_tokens": getattr(self.backend, "max_tokens", None),
+            "response_format": getattr(self.backend, "response_format", None),
+        }
+
+    def _lookup(self, messages: Sequence[Mapping[str, str]]) -> Tuple[str, Optional[str]]:
+        params = self._params()
+        key = cache_key(messages, params)
+        cached = self.cache.memory.get(key, self.policy.ttl_seconds)
+        if cached is not None:
+            self.cache.stats.memory_hits += 1
+            return key, cached
+        if self.policy.persist and self.cache.store is not None:
+            row = self.cache.store.get(key)
+            if row is not None:
+                created, value = row
+                if time.time() - created <= self.policy.ttl_seconds:
+                    self.cache.memory.put(key, value, created)
+                    self.cache.stats.disk_hits += 1
+                    return key, value
+                self.cache.store.delete(key)
+                self.cache.stats.expirations += 1
+        near = self._near_lookup(messages, params)
+        if near is not None:
+            self.cache.stats.near_hits += 1
+            return key, near
+        self.cache.stats.misses += 1
+        return key, None
+
+    def _near_context(
+        self, messages: Sequence[Mapping[str, str]], params: Dict[str, Any]
+    ) -> Optional[Tuple[str, str]]:
+        """Ключ контекста вопроса: системный промпт и последние `near_context_messages` реплик.
+
+        Вся история в ключе сделала бы почти-дубликаты возможными только в
+        первом ходе. Прочие системные сообщения (фрагменты памяти, выжимки)
+        меняются от хода к ходу и в ключ не входят.
+        """
+        if not self.policy.near_duplicate or not messages or messages[-1]["role"] != "user":
+            return None
+        head = list(messages[:1]) if messages[0]["role"] == "system" else []
+        turns = [message for message in messages[len(head) : -1] if message["role"] != "system"]
+        keep = self.policy.near_context_messages
+        window = turns[-keep:] if keep > 0 else []
+        return cache_key(head + window, params), messages[-1]["content"]
+
+    def _near_lookup(
+        self, messages: Sequence[Mapping[str, str]], params: Dict[str, Any]
+    ) -> Optional[str]:
+        context = self._near_context(messages, params)
+        index = self.cache.near_index if context else None
+        if context is None or index is None:
+            return None
+        return index.lookup(
+            context[0], context[1], self.policy.similarity_threshold, self.policy.ttl_seconds
+        )
+
+    def _store(self, key: str, messages: Sequence[Mapping[str, str]], value: str) -> None:
+        created = time.time()
+        self.cache.memory.put(key, value, created)
+        if self.policy.persist and self.cache.store is not None:
+            self.cache.store.put(key, self.namespace, value, created)
+            self.cache.persisted(self.namespace, self.policy.ttl_seconds)
+        context = self._near_context(messages, self._params())
+        index = self.cache.near_index if context else None
+        if context is not None and index is not None:
+            index.add(context[0], context[1], value)
+
+    def send(self, messages: Sequence[Mapping[str, str]]) -> str:
+        if not self.policy.enabled:
+            return self.backend.send(messages)
+        key, cached = self._lookup(messages)
+        if cached is not None:
+            return cached
+        value = self.backend.send(messages)
+        self._store(key, messages, value)
+        return value
+
+    def stream(self, messages: Sequence[Mapping[str, str]]) -> Iterator[str]:
+        stream = getattr(self.backend, "stream", None)
+        if not self.policy.enabled:
+            if stream is None:
+                yield self.backend.send(messages)
+            else:
+                yield from stream(messages)
+            return
+        key, cached = self._lookup(messages)
+        if cached is not None:
+            yield cached
+            return
+        if stream is None:
+            value = self.backend.send(messages)
+            self._store(key, messages, value)
+            yield value
+            return
+        parts: List[str] = []
+        for token in stream(messages):
+            parts.append(token)
+            yield token
+        self._store(key, messages, "".join(parts).strip())
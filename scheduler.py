@@ -0,0 +1,276 @@
+"""Приоритетный планировщик запросов к LLM, общий для всех вызывающих.
+
+Каждый запрос проходит через `RequestScheduler.slot(класс, токены)`: заявки
+ждут в очереди по приоритету класса (планировщик → интерактивные ответы →
+фоновая работа), а выпускаются, когда есть свободный слот общего и классового
+лимита параллелизма и хватает ёмкости token bucket запросов и токенов в
+минуту. Очередь строго приоритетная: пока интерактивная заявка ждёт
+пополнения bucket, фоновые её не обгоняют. Глубина очереди и время ожидания
+по классам собираются в `SchedulerStats` и отдаются в метрики tracing.
+"""
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import tracing
+from agents import MESSAGE_TOKEN_OVERHEAD, estimate_tokens
+from resilience import LatencyTracker
+
+PLANNER = "planner"
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = {PLANNER: 0, INTERACTIVE: 1, BACKGROUND: 2}
+
+
+class TokenBucket:
+    """Ёмкость `burst` (по умолчанию — минутная норма), пополняется со скоростью `per_minute`."""
+
+    def __init__(
+        self,
+        per_minute: float,
+        burst: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = per_minute / 60.0
+        self.capacity = burst or per_minute
+        self.clock = clock
+        self.tokens = self.capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Через сколько секунд в bucket наберётся `amount` (не больше ёмкости)."""
+        self._refill()
+        deficit = min(amount, self.capacity) - self.tokens
+        return deficit / self.rate if deficit > 0 else 0.0
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+@dataclass
+class SchedulerPolicy:
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+    max_concurrent: int = 8
+    class_limits: Dict[str, int] = field(default_factory=lambda: {BACKGROUND: 1})
+    completion_tokens: int = 256
+
+
+@dataclass
+class ClassStats:
+    submitted: int = 0
+    completed: int = 0
+    queued: int = 0
+    peak_queued: int = 0
+    in_flight: int = 0
+    wait_seconds: float = 0.0
+    waits: LatencyTracker = field(default_factory=LatencyTracker)
+
+    def wait_percentile(self, q: float) -> float:
+        return self.waits.percentile(q) or 0.0
+
+
+@dataclass
+class SchedulerStats:
+    classes: Dict[str, ClassStats] = field(
+        default_factory=lambda: {name: ClassStats() for name in PRIORITIES}
+    )
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(stats.queued for stats in self.classes.values())
+
+
+@dataclass(order=True)
+class _Ticket:
+    priority: int
+    sequence: int
+    request_class: str = field(compare=False)
+    requests: int = field(compare=False)
+    tokens: int = field(compare=False)
+    enqueued: float = field(compare=False)
+
+
+class RequestScheduler:
+    def __init__(
+        self, policy: Optional[SchedulerPolicy] = None, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.policy = policy or SchedulerPolicy()
+        self.clock = clock
+        self.stats = SchedulerStats()
+        self.request_bucket = (
+            TokenBucket(self.policy.requests_per_minute, clock=clock)
+            if self.policy.requests_per_minute
+            else None
+        )
+        self.token_bucket = (
+            TokenBucket(self.policy.tokens_per_minute, clock=clock)
+            if self.policy.tokens_per_minute
+            else None
+        )
+        self._queue: List[_Ticket] = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def _class_stats(self, request_class: str) -> ClassStats:
+        stats = self.stats.classes.get(request_class)
+        if stats is None:
+            stats = self.stats.classes[request_class] = ClassStats()
+        return stats
+
+    def _has_capacity(self, request_class: str) -> bool:
+        if self._in_flight >= self.policy.max_concurrent:
+            return False
+        limit = self.policy.class_limits.get(request_class)
+        return limit is None or self._class_stats(request_class).in_flight < limit
+
+    def _rate_wait(self, ticket: _Ticket) -> float:
+        wait = 0.0
+        if self.request_bucket is not None and ticket.requests:
+            wait = max(wait, self.request_bucket.wait_time(ticket.requests))
+        if self.token_bucket is not None and ticket.tokens:
+            wait = max(wait, self.token_bucket.wait_time(ticket.tokens))
+        return wait
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        """Первая по приоритету заявка, для которой есть свободный слот."""
+        for ticket in sorted(self._queue):
+            if self._has_capacity(ticket.request_class):
+                return ticket
+        return None
+
+    def _publish_depth(self, request_class: str, stats: ClassStats) -> None:
+        tracing.set_gauge("scheduler_queue_depth", stats.queued, request_class=request_class)
+
+    @contextmanager
+    def slot(self, request_class: str, tokens: int = 0, requests: int = 1) -> Iterator[None]:
+        """Ждёт очереди и лимитов, держит слот на время блока `with`."""
+        priority = PRIORITIES.get(request_class, max(PRIORITIES.values()) + 1)
+        with self._condition:
+            ticket = _Ticket(
+                priority, next(self._sequence), request_class, requests, tokens, self.clock()
+            )
+            self._queue.append(ticket)
+            stats = self._class_stats(request_class)
+            stats.submitted += 1
+            stats.queued += 1
+            stats.peak_queued = max(stats.peak_queued, stats.queued)
+            self._publish_depth(request_class, stats)
+            try:
+                self._wait_for(ticket)
+            except BaseException:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    stats.queued -= 1
+                self._condition.notify_all()
+                raise
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                stats.in_flight -= 1
+                stats.completed += 1
+                self._condition.notify_all()
+
+    def _wait_for(self, ticket: _Ticket) -> None:
+        with tracing.span(f"scheduler.wait.{ticket.request_class}") as wait_span:
+            while True:
+                head = self._next_ticket()
+                timeout: Optional[float] = None
+                if head is ticket:
+                    timeout = self._rate_wait(ticket)
+                    if timeout <= 0:
+                        break
+                self._condition.wait(timeout)
+            self._queue.remove(ticket)
+            if self.request_bucket is not None:
+                self.request_bucket.consume(ticket.requests)
+            if self.token_bucket is not None:
+                self.token_bucket.consume(ticket.tokens)
+            self._in_flight += 1
+            stats = self._class_stats(ticket.request_class)
+            stats.queued -= 1
+            stats.in_flight += 1
+            waited = self.clock() - ticket.enqueued
+            stats.wait_seconds += waited
+            stats.waits.record(waited)
+            wait_span.set(waited=round(waited, 6))
+            self._publish_depth(ticket.request_class, stats)
+            self._condition.notify_all()
+
+    def estimate_tokens(self, messages: Sequence[Mapping[str, str]]) -> int:
+        """Промпт по оценке буфера плюс ожидаемый ответ — для лимита токенов в минуту."""
+        prompt = sum(
+            estimate_tokens(message["content"]) + MESSAGE_TOKEN_OVERHEAD for message in messages
+        )
+        return prompt + self.policy.completion_tokens
+
+
+class ScheduledBackend:
+    """Клиент, чьи запросы идут через планировщик с классом `request_class`.
+
+    Поток держит слот до конца выдачи; прочие атрибуты (`model`, `stats`)
+    берутся у исходного клиента. `warm_up` занимает слот без расхода лимитов.
+    """
+
+    def __init__(self, backend: Any, scheduler: RequestScheduler, request_class: str) -> None:
+        self.backend = backend
+        self.scheduler = scheduler
+        self.request_class = request_class
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.backend, name)
+
+    def for_class(self, request_class: str) -> "ScheduledBackend":
+        return ScheduledBackend(self.backend, self.scheduler, request_class)
+
+    def with_json_mode(self) -> "ScheduledBackend":
+        return ScheduledBackend(self.backend.with_json_mode(), self.scheduler, self.request_class)
+
+    def _slot(self, messages: Sequence[Mapping[str, str]]) -> Any:
+        return self.scheduler.slot(self.request_class, self.scheduler.estimate_tokens(messages))
+
+    def send(self, messages: Sequence[Mapping[str, str]]) -> str:
+        with self._slot(messages):
+            return self.backend.send(messages)
+
+    def send_with_tools(
+        self, messages: Sequence[Mapping[str, str]], tools: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        with self._slot(messages):
+            return self.backend.send_with_tools(messages, tools)
+
+    def stream(self, messages: Sequence[Mapping[str, str]]) -> Iterator[str]:
+        with self._slot(messages):
+            yield from self.backend.stream(messages)
+
+    def warm_up(self) -> bool:
+        with self.scheduler.slot(self.request_class, tokens=0, requests=0):
+            return self.backend.warm_up()
+
+
+def format_stats(stats: SchedulerStats) -> List[Tuple[str, str]]:
+    """Строки сводки по классам для печати при завершении."""
+    return [
+        (
+            name,
+            f"запросов: {cls.completed}/{cls.submitted}, пик очереди: {cls.peak_queued}, "
+            f"ожидание p50 {cls.wait_percentile(50) * 1000:.1f} мс, "
+            f"p95 {cls.wait_percentile(95) * 1000:.1f} мс",
+        )
+        for name, cls in stats.classes.items()
+        if cls.submitted
+    ]
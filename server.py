@@ -0,0 +1,611 @@
+"""Многопользовательский режим: HTTP-сервер диспетчера для многих сессий.
+
+У каждой сессии своя пара буферов (чат и планировщик), свой Planner и агент
+QA, а клиент DeepSeek с пулом keep-alive соединений, каталог расширений,
+быстрый маршрутизатор и кэш ответов — общие. Запросы всех сессий идут через
+общий `RequestScheduler`: не больше `max_concurrent` одновременно, в пределах
+лимитов запросов и токенов в минуту, планы — вне очереди. Сессии без активности
+дольше `idle_seconds` (и самые давние сверх `max_active`) выгружаются на диск
+JSON-файлом с историей и поднимаются обратно при следующем сообщении.
+
+API (JSON):
+    POST   /sessions                  → {"session": id}
+    POST   /sessions/<id>/messages    {"prompt": "..."} → {"reply", "agent", "error"}
+    DELETE /sessions/<id>
+    GET    /stats
+
+Запуск: python server.py --port 8080
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from settings import (
+    SYSTEM_PROMPT,
+    PLANNER_SYSTEM_PROMPT,
+    CHAT_HISTORY_LIMIT,
+    PLANNER_HISTORY_LIMIT,
+    CHAT_TOKEN_BUDGET,
+    PLANNER_TOKEN_BUDGET,
+    HISTORY_EVICTION_CHUNK,
+    FAST_PATH_ROUTER,
+    FAST_PATH_THRESHOLD,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_TTL,
+    STREAMING_PLANNER,
+    PLAN_STEP_WORKERS,
+    DISPATCH_MODE,
+    EXTENSIONS_MANIFEST,
+    EXTENSION_ENTRY_POINT_GROUP,
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_MAX_CONCURRENT_REQUESTS,
+    SERVER_IDLE_SECONDS,
+    SERVER_MAX_ACTIVE_SESSIONS,
+    SERVER_SESSION_DIR,
+    SCHEDULER_REQUESTS_PER_MINUTE,
+    SCHEDULER_TOKENS_PER_MINUTE,
+    SCHEDULER_BACKGROUND_CONCURRENCY,
+)
+from agents import (
+    AgentRegistry,
+    ConversationBuffer,
+    Dispatcher,
+    Planner,
+    QuestionAnswerAgent,
+    ToolCallingDispatcher,
+    TurnResult,
+)
+from extensions import ExtensionLoader, default_extensions, tool_definitions, with_catalog
+from intent_router import default_intent_router
+from response_cache import CachePolicy, ResponseCache
+from scheduler import (
+    BACKGROUND,
+    INTERACTIVE,
+    PLANNER,
+    RequestScheduler,
+    ScheduledBackend,
+    SchedulerPolicy,
+    SchedulerStats,
+)
+import tracing
+
+SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+@dataclass
+class Session:
+    id: str
+    dispatcher: Union[Dispatcher, ToolCallingDispatcher]
+    last_active: float = field(default_factory=time.monotonic)
+    turns: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def dump(self) -> Dict[str, Any]:
+        planner_buffer = self.dispatcher.planner_buffer
+        return {
+            "id": self.id,
+            "turns": self.turns,
+            "chat": [dict(message) for message in self.dispatcher.user_buffer.history()],
+            "planner": [
+                dict(message)
+                for message in (planner_buffer.history() if planner_buffer is not None else [])
+            ],
+        }
+
+
+class SessionFactory:
+    """Собирает диспетчер сессии поверх общих клиента, расширений и маршрутизатора.
+
+    С `scheduler` запросы планировщика и вызов с tools (он заменяет план) идут
+    классом `planner`, остальные — `interactive`. `step_executor` — общий пул шагов многошаговых планов.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        error_cls: type,
+        extensions: ExtensionLoader,
+        tools_mode: bool = False,
+        fast_router: Any = None,
+        response_cache: Optional[ResponseCache] = None,
+        plan_executor: Optional[ThreadPoolExecutor] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        step_executor: Optional[ThreadPoolExecutor] = None,
+    ) -> None:
+        planner_client: Any = client
+        if scheduler is not None:
+            planner_client = ScheduledBackend(client, scheduler, PLANNER)
+            client = ScheduledBackend(client, scheduler, INTERACTIVE)
+        self.client = client
+        self.tools_client = planner_client
+        self.error_cls = error_cls
+        self.extensions = extensions
+        self.tools_mode = tools_mode
+        self.fast_router = fast_router
+        self.plan_executor = plan_executor
+        self.step_executor = step_executor
+        specs = list(extensions.specs.values())
+        self.planner_prompt = with_catalog(PLANNER_SYSTEM_PROMPT, specs)
+        self.tools = tool_definitions(specs)
+        self.planner_client: Any = (
+            planner_client.with_json_mode() if plan_executor is not None else planner_client
+        )
+        self.qa_client: Any = client
+        if response_cache is not None:
+            self.planner_client = response_cache.wrap(
+                self.planner_client,
+                CachePolicy(ttl_seconds=RESPONSE_CACHE_TTL),
+                namespace="planner",
+            )
+            self.qa_client = response_cache.wrap(
+                client,
+                CachePolicy(ttl_seconds=RESPONSE_CACHE_TTL, near_duplicate=True),
+                namespace="qa",
+            )
+
+    def build(self) -> Union[Dispatcher, ToolCallingDispatcher]:
+        user_buffer = ConversationBuffer(
+            SYSTEM_PROMPT,
+            CHAT_HISTORY_LIMIT,
+            CHAT_TOKEN_BUDGET,
+            eviction_chunk=HISTORY_EVICTION_CHUNK,
+        )
+        registry = AgentRegistry(
+            qa_agent=QuestionAnswerAgent(client=self.qa_client, buffer=user_buffer),
+            extensions=self.extensions,
+            step_executor=self.step_executor,
+        )
+        if self.tools_mode:
+            return ToolCallingDispatcher(
+                client=self.tools_client,
+                registry=registry,
+                user_buffer=user_buffer,
+                tools=self.tools,
+                fast_router=self.fast_router,
+                on_notice=lambda message: None,
+            )
+        planner_buffer = ConversationBuffer(
+            self.planner_prompt,
+            PLANNER_HISTORY_LIMIT,
+            PLANNER_TOKEN_BUDGET,
+            eviction_chunk=HISTORY_EVICTION_CHUNK,
+        )
+        return Dispatcher(
+            planner=Planner(
+                client=self.planner_client, buffer=planner_buffer, error_cls=self.error_cls
+            ),
+            registry=registry,
+            user_buffer=user_buffer,
+            planner_buffer=planner_buffer,
+            fast_router=self.fast_router,
+            on_notice=lambda message: None,
+            plan_executor=self.plan_executor,
+        )
+
+
+@dataclass
+class SessionStats:
+    created: int = 0
+    closed: int = 0
+    turns: int = 0
+    spilled: int = 0
+    restored: int = 0
+    spill_seconds: float = 0.0
+    restore_seconds: float = 0.0
+
+
+class SessionNotFound(KeyError):
+    pass
+
+
+class SessionManager:
+    """Активные сессии в памяти (в порядке последнего обращения), остальные — на диске."""
+
+    def __init__(
+        self,
+        build: Callable[[], Union[Dispatcher, ToolCallingDispatcher]],
+        spool_dir: str,
+        idle_seconds: float = 300.0,
+        max_active: int = 1000,
+    ) -> None:
+        self.build = build
+        self.spool_dir = spool_dir
+        self.idle_seconds = idle_seconds
+        self.max_active = max(max_active, 1)
+        self.stats = SessionStats()
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        os.makedirs(spool_dir, exist_ok=True)
+
+    @property
+    def active(self) -> int:
+        return len(self._sessions)
+
+    def spooled(self) -> int:
+        return sum(1 for name in os.listdir(self.spool_dir) if name.endswith(".json"))
+
+    def _spool_path(self, session_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{session_id}.json")
+
+    def create(self) -> str:
+        session = Session(uuid.uuid4().hex, self.build())
+        with self._lock:
+            self._sessions[session.id] = session
+            self.stats.created += 1
+        self._enforce_limit()
+        return session.id
+
+    def _get(self, session_id: str) -> Session:
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise SessionNotFound(session_id)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                # Свежая отметка под общим замком: сборщик не выгрузит сессию до начала хода.
+                session.last_active = time.monotonic()
+                return session
+            session = self._restore(session_id)
+            self._sessions[session_id] = session
+        self._enforce_limit()
+        return session
+
+    def _registered(self, session: Session) -> bool:
+        with self._lock:
+            return self._sessions.get(session.id) is session
+
+    def _restore(self, session_id: str) -> Session:
+        started = time.perf_counter()
+        path = self._spool_path(session_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError as exc:
+            raise SessionNotFound(session_id) from exc
+        dispatcher = self.build()
+        dispatcher.user_buffer.restore(data.get("chat") or [])
+        if dispatcher.planner_buffer is not None:
+            dispatcher.planner_buffer.restore(data.get("planner") or [])
+        os.remove(path)
+        self.stats.restored += 1
+        self.stats.restore_seconds += time.perf_counter() - started
+        return Session(session_id, dispatcher, turns=int(data.get("turns", 0)))
+
+    def handle(self, session_id: str, user_prompt: str) -> TurnResult:
+        while True:
+            session = self._get(session_id)
+            with session.lock:
+                # Между `_get` и замком сессию могли выгрузить на диск: тогда берём её заново.
+                if not self._registered(session):
+                    continue
+                session.last_active = time.monotonic()
+                with tracing.span("session.turn", session=session_id):
+                    result = session.dispatcher.handle(user_prompt)
+                session.turns += 1
+                session.last_active = time.monotonic()
+            break
+        with self._lock:
+            self.stats.turns += 1
+        return result
+
+    def close(self, session_id: str) -> None:
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise SessionNotFound(session_id)
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        path = self._spool_path(session_id)
+        if session is None and not os.path.exists(path):
+            raise SessionNotFound(session_id)
+        if os.path.exists(path):
+            os.remove(path)
+        self.stats.closed += 1
+
+    def _spill(self, session: Session, wait: bool = False) -> bool:
+        """Пишет историю сессии на диск и убирает её из памяти, если она не занята ходом."""
+        if not session.lock.acquire(blocking=wait):
+            return False
+        try:
+            if not self._registered(session):
+                return False
+            started = time.perf_counter()
+            path = self._spool_path(session.id)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(session.dump(), f, ensure_ascii=False)
+            os.replace(f"{path}.tmp", path)
+            with self._lock:
+                self._sessions.pop(session.id, None)
+            self.stats.spilled += 1
+            self.stats.spill_seconds += time.perf_counter() - started
+            return True
+        finally:
+            session.lock.release()
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [
+                session
+                for session in self._sessions.values()
+                if now - session.last_active >= self.idle_seconds
+            ]
+        return sum(self._spill(session) for session in idle)
+
+    def _enforce_limit(self) -> None:
+        with self._lock:
+            excess = max(len(self._sessions) - self.max_active, 0)
+            overflow = list(self._sessions.values())[:excess]
+        for session in overflow:
+            self._spill(session)
+
+    def start_reaper(self, interval: Optional[float] = None) -> None:
+        interval = interval or max(min(self.idle_seconds / 2, 30.0), 0.1)
+
+        def reap() -> None:
+            while not self._stopped.wait(interval):
+                self.evict_idle()
+
+        self._reaper = threading.Thread(target=reap, name="session-reaper", daemon=True)
+        self._reaper.start()
+
+    def shutdown(self) -> None:
+        """Останавливает фоновую выгрузку и сохраняет все сессии на диск."""
+        self._stopped.set()
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            self._spill(session, wait=True)
+
+
+def scheduler_summary(stats: SchedulerStats) -> Dict[str, Dict[str, float]]:
+    return {
+        name: {
+            "submitted": cls.submitted,
+            "completed": cls.completed,
+            "queued": cls.queued,
+            "peak_queued": cls.peak_queued,
+            "wait_seconds": cls.wait_seconds,
+            "wait_p50": cls.wait_percentile(50),
+            "wait_p95": cls.wait_percentile(95),
+        }
+        for name, cls in stats.classes.items()
+    }
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class ChatServer:
+    """HTTP-сервер в фоновом потоке поверх `SessionManager`.
+
+    `handler_cpu_seconds` — процессорное время потоков-обработчиков на ходы
+    (без ожидания API); по нему нагрузочный тест считает сессии на ядро.
+    """
+
+    def __init__(
+        self,
+        manager: SessionManager,
+        scheduler: Optional[RequestScheduler] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.manager = manager
+        self.scheduler = scheduler
+        self.handler_cpu_seconds = 0.0
+        self._cpu_lock = threading.Lock()
+        self._server = _QuietHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stats(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "active_sessions": self.manager.active,
+            "spooled_sessions": self.manager.spooled(),
+            "sessions": asdict(self.manager.stats),
+            "handler_cpu_seconds": self.handler_cpu_seconds,
+        }
+        if self.scheduler is not None:
+            data["scheduler"] = scheduler_summary(self.scheduler.stats)
+        return data
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+                pass
+
+            def _read_json(self) -> Dict[str, Any]:
+                length = int(self.headers.get("Content-Length") or 0)
+                data = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(data, dict):
+                    raise ValueError("ожидался JSON-объект")
+                return data
+
+            def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _route(self) -> List[str]:
+                return [part for part in self.path.split("?", 1)[0].split("/") if part]
+
+            def do_GET(self) -> None:  # noqa: N802
+                if self._route() == ["stats"]:
+                    self._send_json(200, server.stats())
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self) -> None:  # noqa: N802
+                parts = self._route()
+                try:
+                    if parts == ["sessions"]:
+                        self._send_json(201, {"session": server.manager.create()})
+                    elif len(parts) == 3 and parts[0] == "sessions" and parts[2] == "messages":
+                        prompt = str(self._read_json().get("prompt") or "").strip()
+                        if not prompt:
+                            self._send_json(400, {"error": "пустой prompt"})
+                            return
+                        started = time.thread_time()
+                        result = server.manager.handle(parts[1], prompt)
+                        with server._cpu_lock:
+                            server.handler_cpu_seconds += time.thread_time() - started
+                        body = {
+                            "reply": result.reply,
+                            "agent": result.plan.agent,
+                            "steps": [asdict(step) for step in result.plan.steps],
+                            "error": result.error,
+                        }
+                        self._send_json(200, body)
+                    else:
+                        self._send_json(404, {"error": "not found"})
+                except SessionNotFound:
+                    self._send_json(404, {"error": "сессия не найдена"})
+                except ValueError as exc:
+                    self._send_json(400, {"error": f"некорректный JSON: {exc}"})
+
+            def do_DELETE(self) -> None:  # noqa: N802
+                parts = self._route()
+                if len(parts) != 2 or parts[0] != "sessions":
+                    self._send_json(404, {"error": "not found"})
+                    return
+                try:
+                    server.manager.close(parts[1])
+                except SessionNotFound:
+                    self._send_json(404, {"error": "сессия не найдена"})
+                    return
+                self._send_json(200, {"closed": parts[1]})
+
+        return Handler
+
+    def start(self) -> "ChatServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "ChatServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+def build_server(
+    client: Any,
+    error_cls: type,
+    host: str = SERVER_HOST,
+    port: int = SERVER_PORT,
+    max_concurrent: int = SERVER_MAX_CONCURRENT_REQUESTS,
+    idle_seconds: float = SERVER_IDLE_SECONDS,
+    max_active: int = SERVER_MAX_ACTIVE_SESSIONS,
+    spool_dir: str = SERVER_SESSION_DIR,
+) -> ChatServer:
+    """Сервер с настройками из config.py поверх общего клиента `client`."""
+    scheduler = RequestScheduler(
+        SchedulerPolicy(
+            requests_per_minute=SCHEDULER_REQUESTS_PER_MINUTE,
+            tokens_per_minute=SCHEDULER_TOKENS_PER_MINUTE,
+            max_concurrent=max_concurrent,
+            class_limits={BACKGROUND: SCHEDULER_BACKGROUND_CONCURRENCY},
+        )
+    )
+    extensions = default_extensions(
+        manifest_path=EXTENSIONS_MANIFEST, entry_point_group=EXTENSION_ENTRY_POINT_GROUP
+    )
+    factory = SessionFactory(
+        client,
+        error_cls,
+        extensions,
+        tools_mode=DISPATCH_MODE == "tools",
+        fast_router=(
+            default_intent_router(
+                FAST_PATH_THRESHOLD, background=True, agents=list(extensions.specs)
+            )
+            if FAST_PATH_ROUTER
+            else None
+        ),
+        response_cache=ResponseCache(RESPONSE_CACHE_PATH) if RESPONSE_CACHE_ENABLED else None,
+        plan_executor=(
+            ThreadPoolExecutor(max_workers=max_concurrent) if STREAMING_PLANNER else None
+        ),
+        scheduler=scheduler,
+        step_executor=(
+            ThreadPoolExecutor(max_workers=max_concurrent * PLAN_STEP_WORKERS)
+            if PLAN_STEP_WORKERS > 1
+            else None
+        ),
+    )
+    manager = SessionManager(factory.build, spool_dir, idle_seconds, max_active)
+    return ChatServer(manager, scheduler, host, port)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="HTTP-сервер диспетчера для многих сессий")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = parser.parse_args()
+
+    from chat import DeepSeekClientError, _configure_tracing, build_client
+
+    _configure_tracing()
+    server = build_server(
+        build_client(pool_size=SERVER_MAX_CONCURRENT_REQUESTS),
+        DeepSeekClientError,
+        host=args.host,
+        port=args.port,
+    )
+    server.manager.start_reaper()
+    print(f"Сервер диспетчера: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.manager.shutdown()
+        tracing.shutdown()
+        print(json.dumps(server.stats(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
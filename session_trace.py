@@ -0,0 +1,226 @@
+"""Запись сессий чата для воспроизведения под нагрузкой (replay.py).
+
+`SessionRecorder` пишет JSONL: заголовок с режимом диспетчера, каждый обмен с
+API (роль вызывающего, сообщения, ответ, длительность, ошибка) и каждый ход —
+промпт, решение планировщика (агент и аргументы), ответ и время хода. Время
+событий хранится как смещение от начала сессии, поэтому при воспроизведении
+сохраняются реальные паузы между ходами.
+
+`RecordingBackend` и `RecordingDispatcher` — обёртки клиента и диспетчера,
+прочие атрибуты берутся у исходных объектов.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence
+
+from agents import AgentPlan, TurnResult
+
+
+class SessionRecorder:
+    def __init__(self, path: str, settings: Optional[Dict[str, Any]] = None) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.session = uuid.uuid4().hex
+        self.turns = 0
+        self.exchanges = 0
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+        self._write(
+            {
+                "type": "session",
+                "session": self.session,
+                "started": datetime.now(timezone.utc).isoformat(),
+                "settings": settings or {},
+            }
+        )
+
+    @classmethod
+    def in_directory(
+        cls, directory: str, settings: Optional[Dict[str, Any]] = None
+    ) -> "SessionRecorder":
+        """Новый файл `<каталог>/<время>-<id>.jsonl`."""
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        return cls(os.path.join(directory, f"{stamp}-{uuid.uuid4().hex[:8]}.jsonl"), settings)
+
+    def offset(self) -> float:
+        return time.perf_counter() - self._started
+
+    def _write(self, event: Dict[str, Any]) -> None:
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def exchange(
+        self,
+        role: str,
+        kind: str,
+        messages: Sequence[Mapping[str, str]],
+        started: float,
+        response: Any = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        self.exchanges += 1
+        self._write(
+            {
+                "type": "exchange",
+                "t": round(started, 6),
+                "seconds": round(self.offset() - started, 6),
+                "role": role,
+                "kind": kind,
+                "messages": [dict(message) for message in messages],
+                "response": response,
+                "error": str(error) if error is not None else None,
+            }
+        )
+
+    def turn(self, prompt: str, started: float, result: TurnResult) -> None:
+        self.turns += 1
+        self._write(
+            {
+                "type": "turn",
+                "t": round(started, 6),
+                "seconds": round(self.offset() - started, 6),
+                "prompt": prompt,
+                "agent": result.plan.agent,
+                "arguments": result.plan.arguments,
+                "steps": [asdict(step) for step in result.plan.steps],
+                "reply": result.reply,
+                "error": result.error,
+            }
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class RecordingBackend:
+    """Клиент, чьи запросы и ответы пишутся в `recorder` с ролью `role`."""
+
+    def __init__(self, backend: Any, recorder: SessionRecorder, role: str) -> None:
+        self.backend = backend
+        self.recorder = recorder
+        self.role = role
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.backend, name)
+
+    def with_json_mode(self) -> "RecordingBackend":
+        return RecordingBackend(self.backend.with_json_mode(), self.recorder, self.role)
+
+    def send(self, messages: Sequence[Mapping[str, str]]) -> str:
+        started = self.recorder.offset()
+        try:
+            reply = self.backend.send(messages)
+        except Exception as exc:
+            self.recorder.exchange(self.role, "send", messages, started, error=exc)
+            raise
+        self.recorder.exchange(self.role, "send", messages, started, reply)
+        return reply
+
+    def send_with_tools(
+        self, messages: Sequence[Mapping[str, str]], tools: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        started = self.recorder.offset()
+        try:
+            message = self.backend.send_with_tools(messages, tools)
+        except Exception as exc:
+            self.recorder.exchange(self.role, "tools", messages, started, error=exc)
+            raise
+        self.recorder.exchange(self.role, "tools", messages, started, message)
+        return message
+
+    def stream(self, messages: Sequence[Mapping[str, str]]) -> Iterator[str]:
+        started = self.recorder.offset()
+        tokens: List[str] = []
+        try:
+            for token in self.backend.stream(messages):
+                tokens.append(token)
+                yield token
+        except Exception as exc:
+            self.recorder.exchange(self.role, "stream", messages, started, "".join(tokens), exc)
+            raise
+        self.recorder.exchange(self.role, "stream", messages, started, "".join(tokens))
+
+
+class RecordingDispatcher:
+    """Диспетчер, чьи ходы и решения пишутся в `recorder`."""
+
+    def __init__(self, dispatcher: Any, recorder: SessionRecorder) -> None:
+        self.dispatcher = dispatcher
+        self.recorder = recorder
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.dispatcher, name)
+
+    def handle(self, user_prompt: str, planned: Optional[AgentPlan] = None) -> TurnResult:
+        started = self.recorder.offset()
+        if planned is None:
+            result = self.dispatcher.handle(user_prompt)
+        else:
+            result = self.dispatcher.handle(user_prompt, planned)
+        self.recorder.turn(user_prompt, started, result)
+        return result
+
+
+@dataclass
+class RecordedExchange:
+    t: float
+    seconds: float
+    role: str
+    kind: str
+    messages: List[Dict[str, str]]
+    response: Any
+    error: Optional[str] = None
+
+
+@dataclass
+class RecordedTurn:
+    t: float
+    seconds: float
+    prompt: str
+    agent: str
+    arguments: Dict[str, Any]
+    reply: str = ""
+    error: bool = False
+    steps: List[Dict[str, Any]] = field(default_factory=list)
+
+
+@dataclass
+class RecordedSession:
+    path: str
+    session: str = ""
+    settings: Dict[str, Any] = field(default_factory=dict)
+    turns: List[RecordedTurn] = field(default_factory=list)
+    exchanges: List[RecordedExchange] = field(default_factory=list)
+
+
+def load_session(path: str) -> RecordedSession:
+    recorded = RecordedSession(path)
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            kind = event.pop("type", None)
+            if kind == "session":
+                recorded.session = event.get("session", "")
+                recorded.settings = event.get("settings") or {}
+            elif kind == "turn":
+                recorded.turns.append(RecordedTurn(**event))
+            elif kind == "exchange":
+                recorded.exchanges.append(RecordedExchange(**event))
+    return recorded
@@ -0,0 +1,90 @@
+"""Настройки из пользовательского config.py со значениями по умолчанию.
+
+config.py создаётся config_gui или копированием config.py.example и может
+быть старым: config_gui записывает только параметры подключения и
+SYSTEM_PROMPT. Всё остальное, включая промпт планировщика и лимиты истории,
+берётся из этого модуля со значением по умолчанию, если в config.py его нет;
+описания параметров — в config.py.example. Возможности,
+меняющие поведение (потоковый вывод, быстрый маршрутизатор, прогрев
+соединения), по умолчанию выключены.
+"""
+import config
+
+# Обязательные: без них клиент и диспетчер не собрать.
+DEEPSEEK_API_KEY = config.DEEPSEEK_API_KEY
+DEEPSEEK_API_URL = config.DEEPSEEK_API_URL
+DEEPSEEK_MODEL = config.DEEPSEEK_MODEL
+TEMPERATURE = config.TEMPERATURE
+MAX_TOKENS = config.MAX_TOKENS
+TIMEOUT = config.TIMEOUT
+SYSTEM_PROMPT = config.SYSTEM_PROMPT
+
+# Список агентов подставляется вместо {agents}.
+DEFAULT_PLANNER_SYSTEM_PROMPT = """\
+Ты - планировщик голосового ассистента. По последней реплике пользователя
+выбери агента, который должен её выполнить, и верни строго JSON:
+{"agent": "имя_агента", "arguments": {...}, "user_visible_message": "короткий ответ пользователю"}
+
+{agents}
+"""
+PLANNER_SYSTEM_PROMPT = getattr(config, "PLANNER_SYSTEM_PROMPT", DEFAULT_PLANNER_SYSTEM_PROMPT)
+CHAT_HISTORY_LIMIT = getattr(config, "CHAT_HISTORY_LIMIT", 20)
+PLANNER_HISTORY_LIMIT = getattr(config, "PLANNER_HISTORY_LIMIT", 10)
+
+RETRY_MAX_ATTEMPTS = getattr(config, "RETRY_MAX_ATTEMPTS", 3)
+RETRY_BASE_DELAY = getattr(config, "RETRY_BASE_DELAY", 0.5)
+HEDGE_REQUESTS = getattr(config, "HEDGE_REQUESTS", False)
+HEDGE_MIN_DELAY = getattr(config, "HEDGE_MIN_DELAY", 1.0)
+CIRCUIT_FAILURE_THRESHOLD = getattr(config, "CIRCUIT_FAILURE_THRESHOLD", 5)
+CIRCUIT_RESET_TIMEOUT = getattr(config, "CIRCUIT_RESET_TIMEOUT", 30)
+CHAT_TOKEN_BUDGET = getattr(config, "CHAT_TOKEN_BUDGET", None)
+PLANNER_TOKEN_BUDGET = getattr(config, "PLANNER_TOKEN_BUDGET", None)
+HISTORY_EVICTION_CHUNK = getattr(config, "HISTORY_EVICTION_CHUNK", 0)
+CHAT_COMPRESSION_ENABLED = getattr(config, "CHAT_COMPRESSION_ENABLED", False)
+PLANNER_COMPRESSION_ENABLED = getattr(config, "PLANNER_COMPRESSION_ENABLED", False)
+COMPRESSION_TRIGGER_MESSAGES = getattr(config, "COMPRESSION_TRIGGER_MESSAGES", 8)
+TRACE_PATH = getattr(config, "TRACE_PATH", None)
+METRICS_PATH = getattr(config, "METRICS_PATH", None)
+STREAM_RESPONSES = getattr(config, "STREAM_RESPONSES", False)
+SPECULATIVE_QA = getattr(config, "SPECULATIVE_QA", False)
+STREAMING_PLANNER = getattr(config, "STREAMING_PLANNER", False)
+PLAN_STEP_WORKERS = getattr(config, "PLAN_STEP_WORKERS", 4)
+DISPATCH_MODE = getattr(config, "DISPATCH_MODE", "planner")
+WARM_UP_CONNECTION = getattr(config, "WARM_UP_CONNECTION", False)
+EXTENSIONS_MANIFEST = getattr(config, "EXTENSIONS_MANIFEST", None)
+EXTENSION_ENTRY_POINT_GROUP = getattr(config, "EXTENSION_ENTRY_POINT_GROUP", None)
+FAST_PATH_ROUTER = getattr(config, "FAST_PATH_ROUTER", False)
+FAST_PATH_THRESHOLD = getattr(config, "FAST_PATH_THRESHOLD", 0.85)
+RESPONSE_CACHE_ENABLED = getattr(config, "RESPONSE_CACHE_ENABLED", False)
+RESPONSE_CACHE_PATH = getattr(config, "RESPONSE_CACHE_PATH", "response_cache.sqlite3")
+RESPONSE_CACHE_TTL = getattr(config, "RESPONSE_CACHE_TTL", 3600)
+MEMORY_ENABLED = getattr(config, "MEMORY_ENABLED", False)
+MEMORY_PATH = getattr(config, "MEMORY_PATH", "memory.sqlite3")
+MEMORY_TOP_K = getattr(config, "MEMORY_TOP_K", 3)
+SCHEDULER_ENABLED = getattr(config, "SCHEDULER_ENABLED", False)
+SCHEDULER_REQUESTS_PER_MINUTE = getattr(config, "SCHEDULER_REQUESTS_PER_MINUTE", None)
+SCHEDULER_TOKENS_PER_MINUTE = getattr(config, "SCHEDULER_TOKENS_PER_MINUTE", None)
+SCHEDULER_MAX_CONCURRENT = getattr(config, "SCHEDULER_MAX_CONCURRENT", 8)
+SCHEDULER_BACKGROUND_CONCURRENCY = getattr(config, "SCHEDULER_BACKGROUND_CONCURRENCY", 1)
+LLM_BACKENDS = getattr(config, "LLM_BACKENDS", None)
+LLM_ROUTES = getattr(
+    config,
+    "LLM_ROUTES",
+    {"planner": ["fast", "main"], "qa": ["main", "fast"], "summarizer": ["fast"]},
+)
+LLM_ROUTING_STRATEGY = getattr(config, "LLM_ROUTING_STRATEGY", "fastest")
+LLM_BACKEND_COOLDOWN = getattr(config, "LLM_BACKEND_COOLDOWN", 30)
+VOICE_SAMPLE_RATE = getattr(config, "VOICE_SAMPLE_RATE", 16000)
+VOICE_ENERGY_THRESHOLD_DB = getattr(config, "VOICE_ENERGY_THRESHOLD_DB", -45)
+VOICE_PAUSE_MS = getattr(config, "VOICE_PAUSE_MS", 200)
+VOICE_HANGOVER_MS = getattr(config, "VOICE_HANGOVER_MS", 500)
+VOICE_STT_MODEL = getattr(config, "VOICE_STT_MODEL", "small")
+VOICE_LANGUAGE = getattr(config, "VOICE_LANGUAGE", "ru")
+VOICE_PLAN_ON_PARTIAL = getattr(config, "VOICE_PLAN_ON_PARTIAL", True)
+SESSION_TRACE_DIR = getattr(config, "SESSION_TRACE_DIR", None)
+SERVER_HOST = getattr(config, "SERVER_HOST", "127.0.0.1")
+SERVER_PORT = getattr(config, "SERVER_PORT", 8080)
+SERVER_MAX_CONCURRENT_REQUESTS = getattr(config, "SERVER_MAX_CONCURRENT_REQUESTS", 16)
+SERVER_IDLE_SECONDS = getattr(config, "SERVER_IDLE_SECONDS", 300)
+SERVER_MAX_ACTIVE_SESSIONS = getattr(config, "SERVER_MAX_ACTIVE_SESSIONS", 1000)
+SERVER_SESSION_DIR = getattr(config, "SERVER_SESSION_DIR", "sessions")
@@ -0,0 +1,120 @@
+"""Профиль запуска: время импорта модулей и этапов инициализации.
+
+Импорт замеряется в отдельном интерпретаторе с `-X importtime`, чтобы уже
+загруженные модули текущего процесса не искажали результат. Этапы
+инициализации замеряются `PhaseTimer` в текущем процессе.
+"""
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@dataclass
+class ImportTiming:
+    module: str
+    self_seconds: float
+    cumulative_seconds: float
+    depth: int
+
+    @property
+    def is_project(self) -> bool:
+        top_level = self.module.split(".")[0]
+        return os.path.exists(os.path.join(PROJECT_DIR, f"{top_level}.py"))
+
+
+def parse_importtime(text: str) -> List[ImportTiming]:
+    """Разбирает строки `import time: self [us] | cumulative | module` из stderr."""
+    timings: List[ImportTiming] = []
+    for line in text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:") :].split("|", 2)
+            self_value, cumulative_value = int(self_us), int(cumulative_us)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        timings.append(
+            ImportTiming(name.strip(), self_value / 1e6, cumulative_value / 1e6, depth)
+        )
+    return timings
+
+
+def profile_imports(module: str) -> List[ImportTiming]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.getcwd(),
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    return parse_importtime(result.stderr)
+
+
+class PhaseTimer:
+    def __init__(self) -> None:
+        self.phases: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+
+def subtree(imports: List[ImportTiming], root: str) -> List[ImportTiming]:
+    """Модуль `root` и всё, что было импортировано при его импорте.
+
+    `-X importtime` печатает вложенные импорты перед родителем, поэтому
+    поддерево — это непрерывный блок строк с depth > 0 перед строкой корня.
+    """
+    for index in range(len(imports) - 1, -1, -1):
+        if imports[index].depth == 0 and imports[index].module == root:
+            start = index
+            while start > 0 and imports[start - 1].depth > 0:
+                start -= 1
+            return imports[start : index + 1]
+    return []
+
+
+def print_report(
+    imports: List[ImportTiming], phases: List[Tuple[str, float]], root: str, top: int = 15
+) -> None:
+    """Печатает модули проекта, самые тяжёлые прямые зависимости и этапы инициализации."""
+    timings = subtree(imports, root)
+    if timings:
+        print(f"Импорт {root}: {timings[-1].cumulative_seconds * 1000:.1f} мс")
+    project = [timing for timing in timings if timing.is_project]
+    direct = sorted(
+        (timing for timing in timings if timing.depth == 1 and not timing.is_project),
+        key=lambda timing: timing.cumulative_seconds,
+        reverse=True,
+    )[:top]
+    print(f"\n{'модуль':<36}{'свой, мс':>10}{'всего, мс':>11}")
+    for timing in sorted(project, key=lambda timing: timing.cumulative_seconds, reverse=True):
+        print(
+            f"{timing.module:<36}{timing.self_seconds * 1000:>10.2f}"
+            f"{timing.cumulative_seconds * 1000:>11.2f}"
+        )
+    if direct:
+        print("\nСторонние модули, импортируемые при запуске:")
+        for timing in direct:
+            print(
+                f"{timing.module:<36}{timing.self_seconds * 1000:>10.2f}"
+                f"{timing.cumulative_seconds * 1000:>11.2f}"
+            )
+    if phases:
+        print(f"\n{'этап инициализации':<36}{'мс':>10}")
+        for name, seconds in phases:
+            print(f"{name:<36}{seconds * 1000:>10.2f}")
+        print(f"{'итого':<36}{sum(seconds for _, seconds in phases) * 1000:>10.2f}")
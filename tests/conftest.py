@@ -0,0 +1,22 @@
+"""Общая настройка тестов: модули из корня репозитория и конфигурация по умолчанию.
+
+`chat.py` читает `config.py`, которого нет в репозитории (его создаёт
+config_gui). Если локального файла нет, используется `config.py.example`.
+"""
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if importlib.util.find_spec("config") is None:
+    _loader = importlib.machinery.SourceFileLoader(
+        "config", os.path.join(ROOT, "config.py.example")
+    )
+    _config = importlib.util.module_from_spec(
+        importlib.util.spec_from_loader("config", _loader)
+    )
+    _loader.exec_module(_config)
+    sys.modules["config"] = _config
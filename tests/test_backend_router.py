@@ -0,0 +1,115 @@
+"""Выбор бэкенда, переключение при ошибках и раздельные оценки задержки BackendRouter."""
+import pytest
+
+from backend_router import BackendRouter, RoutingPolicy
+from chat import DeepSeekClientError
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeBackend:
+    def __init__(self, clock, name, send_seconds=0.0, first_token_seconds=0.0, error=None):
+        self.clock = clock
+        self.name = name
+        self.send_seconds = send_seconds
+        self.first_token_seconds = first_token_seconds
+        self.error = error
+        self.calls = 0
+
+    def send(self, messages):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        self.clock.now += self.send_seconds
+        return self.name
+
+    def stream(self, messages):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        self.clock.now += self.first_token_seconds
+        yield self.name
+        self.clock.now += self.send_seconds
+
+
+def make_router(clock, **backends):
+    return BackendRouter(
+        backends,
+        {"qa": list(backends)},
+        RoutingPolicy(explore_every=0, cooldown=30.0),
+        clock=clock,
+    )
+
+
+def test_retryable_error_fails_over_and_cools_down():
+    clock = FakeClock()
+    broken = FakeBackend(clock, "a", error=DeepSeekClientError("503", status=503, retryable=True))
+    router = make_router(clock, a=broken, b=FakeBackend(clock, "b"))
+
+    assert router.for_role("qa").send([]) == "b"
+    assert router.health["a"].failures == 1
+    assert router.candidates("qa")[0] == "b"
+
+
+def test_non_retryable_error_is_raised_without_failover():
+    clock = FakeClock()
+    bad_request = DeepSeekClientError("400", status=400, retryable=False)
+    first = FakeBackend(clock, "a", error=bad_request)
+    second = FakeBackend(clock, "b")
+    router = make_router(clock, a=first, b=second)
+
+    with pytest.raises(DeepSeekClientError):
+        router.for_role("qa").send([])
+    assert second.calls == 0
+    assert router.health["a"].failures == 0
+    assert router.health["a"].healthy(router.policy, clock.now)
+
+
+def test_stream_and_send_are_ranked_by_their_own_latency():
+    clock = FakeClock()
+    # «a» быстро начинает поток, но долго отвечает целиком; «b» наоборот.
+    a = FakeBackend(clock, "a", send_seconds=2.0, first_token_seconds=0.1)
+    b = FakeBackend(clock, "b", send_seconds=0.5, first_token_seconds=0.4)
+    router = make_router(clock, a=a, b=b)
+    qa = router.for_role("qa")
+    for backend in (a, b):
+        router.health[backend.name].record_success(backend.send_seconds)
+        router.health[backend.name].record_first_token(backend.first_token_seconds)
+
+    assert router.candidates("qa")[0] == "b"
+    assert router.candidates("qa", streaming=True)[0] == "a"
+    assert list(qa.stream([])) == ["a"]
+    assert qa.send([]) == "b"
+
+
+def test_programming_error_is_raised_without_failover():
+    clock = FakeClock()
+    second = FakeBackend(clock, "b")
+    router = make_router(clock, a=FakeBackend(clock, "a", error=TypeError("bug")), b=second)
+
+    with pytest.raises(TypeError):
+        router.for_role("qa").send([])
+    assert second.calls == 0
+    assert router.health["a"].failures == 0
+
+
+def test_failed_backend_recovers_after_its_errors_decay():
+    clock = FakeClock()
+    outage = DeepSeekClientError("503", status=503, retryable=True)
+    a = FakeBackend(clock, "a", error=outage)
+    router = make_router(clock, a=a, b=FakeBackend(clock, "b", send_seconds=1.0))
+    for _ in range(10):
+        router.health["a"].record_failure(clock.now)
+    assert not router.health["a"].healthy(router.policy, clock.now + router.policy.cooldown)
+
+    a.error = None
+    clock.now += router.policy.cooldown + router.policy.error_half_life
+    assert router.health["a"].healthy(router.policy, clock.now)
+    assert router.candidates("qa")[0] == "a"
+    assert router.for_role("qa").send([]) == "a"
@@ -0,0 +1,101 @@
+"""Пакетный прогон: продолжение после сбоя и повтор фраз, записанных с ошибкой."""
+import json
+
+import pytest
+
+from batch import BatchSettings, completed_ids, run_batch
+from extensions import default_extensions
+
+PLANNER_PROMPT = "Ты планировщик."
+PLAN = json.dumps({"agent": "qa", "arguments": {}, "user_visible_message": None})
+
+
+class StubClient:
+    """Планировщик всегда выбирает qa; QA падает на фразах из `failing`."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.answered = []
+
+    def send(self, messages):
+        if messages[0].content.startswith(PLANNER_PROMPT):
+            return PLAN
+        prompt = messages[-1].content
+        if prompt in self.failing:
+            raise RuntimeError("503 Service Unavailable")
+        self.answered.append(prompt)
+        return f"ответ на {prompt}"
+
+
+@pytest.fixture
+def paths(tmp_path):
+    source = tmp_path / "prompts.jsonl"
+    source.write_text(
+        "".join(json.dumps({"id": i, "prompt": f"фраза {i}"}) + "\n" for i in range(1, 4)),
+        encoding="utf-8",
+    )
+    return str(source), str(tmp_path / "results.jsonl")
+
+
+def run(client, paths, retry_failed=True):
+    settings = BatchSettings(
+        system_prompt="Ты ассистент.",
+        planner_system_prompt=PLANNER_PROMPT,
+        chat_history_limit=10,
+        planner_history_limit=10,
+        concurrency=2,
+        retry_failed=retry_failed,
+    )
+    return run_batch(client, settings, default_extensions({"dry_run": True}), *paths)
+
+
+def latest(output_path):
+    records = {}
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            records[record["id"]] = record
+    return records
+
+
+def test_rerun_skips_completed_and_retries_failed(paths):
+    first = run(StubClient(failing={"фраза 2"}), paths)
+    assert (first.processed, first.failed, first.skipped) == (3, 1, 0)
+    assert latest(paths[1])["2"]["error"] is True
+
+    client = StubClient()
+    second = run(client, paths)
+    assert (second.processed, second.failed, second.skipped) == (1, 0, 2)
+    assert client.answered == ["фраза 2"]
+    assert latest(paths[1])["2"]["reply"] == "ответ на фраза 2"
+
+    client = StubClient()
+    third = run(client, paths)
+    assert (third.processed, third.skipped) == (0, 3)
+    assert client.answered == []
+
+
+def test_failed_records_are_kept_without_retry(paths):
+    run(StubClient(failing={"фраза 2"}), paths)
+
+    client = StubClient()
+    summary = run(client, paths, retry_failed=False)
+
+    assert (summary.processed, summary.skipped) == (0, 3)
+    assert client.answered == []
+
+
+def test_completed_ids_uses_the_latest_record_and_ignores_a_torn_line(tmp_path):
+    output = tmp_path / "results.jsonl"
+    output.write_text(
+        '{"id": "a", "error": true}\n'
+        '{"id": "b", "error": false}\n'
+        '{"id": "a", "error": false}\n'
+        '{"id": "c", "error": true}\n'
+        '{"id": "d", "er',
+        encoding="utf-8",
+    )
+
+    assert completed_ids(str(output)) == {"a", "b"}
+    assert completed_ids(str(output), retry_failed=False) == {"a", "b", "c"}
+    assert completed_ids(str(tmp_path / "missing.jsonl")) == set()
@@ -0,0 +1,196 @@
+"""Окно истории ConversationBuffer: лимит сообщений, бюджет токенов и подмена summary."""
+import threading
+
+from agents import MESSAGE_TOKEN_OVERHEAD, ConversationBuffer
+from compression import SUMMARY_PREFIX, CompressionPolicy, HistoryCompressor
+
+SYSTEM = "ты помощник"
+
+
+def words(text):
+    return len(text.split())
+
+
+def cost(text):
+    return words(text) + MESSAGE_TOKEN_OVERHEAD
+
+
+def make_buffer(limit=100, token_budget=None, eviction_chunk=0.0):
+    return ConversationBuffer(
+        SYSTEM, limit, token_budget=token_budget, token_counter=words,
+        eviction_chunk=eviction_chunk,
+    )
+
+
+def contents(buffer):
+    return [message.content for message in buffer.history()]
+
+
+def test_token_budget_evicts_oldest_and_keeps_system_prompt():
+    # Системный промпт — 6 токенов, каждое сообщение из трёх слов — 7.
+    buffer = make_buffer(token_budget=6 + 3 * 7)
+    for index in range(5):
+        buffer.add_user(f"сообщение номер {index}")
+
+    assert contents(buffer) == [f"сообщение номер {index}" for index in (2, 3, 4)]
+    assert buffer.snapshot()[0].content == SYSTEM
+    assert buffer.total_tokens == cost(SYSTEM) + 3 * 7 <= buffer.token_budget
+    assert buffer.history_tokens == sum(cost(text) for text in contents(buffer))
+
+
+def test_oversized_message_evicts_everything_older_but_stays():
+    buffer = make_buffer(token_budget=30)
+    buffer.add_user("короткий вопрос")
+    buffer.add_assistant("короткий ответ")
+    huge = " ".join(["слово"] * 50)
+    buffer.add_user(huge)
+
+    # Последнее сообщение нельзя выбросить — на него отвечает модель.
+    assert contents(buffer) == [huge]
+    assert buffer.snapshot()[0].content == SYSTEM
+    assert buffer.history_tokens == cost(huge)
+
+    buffer.add_assistant("ответ")
+    assert contents(buffer) == ["ответ"]
+    assert buffer.total_tokens <= buffer.token_budget
+
+
+def test_message_limit_counts_the_system_prompt():
+    buffer = make_buffer(limit=4)
+    for index in range(6):
+        buffer.add_user(str(index))
+
+    assert contents(buffer) == ["3", "4", "5"]
+    assert len(buffer.snapshot()) == 4
+
+
+def test_restore_applies_the_budget():
+    buffer = make_buffer(token_budget=cost(SYSTEM) + 2 * cost("a"))
+    buffer.restore([{"role": "user", "content": letter} for letter in "abcd"])
+
+    assert contents(buffer) == ["c", "d"]
+    assert buffer.history_tokens == 2 * cost("a")
+
+
+def test_eviction_chunk_keeps_the_prefix_between_evictions():
+    # Десять мест под историю, переполнение освобождает половину.
+    buffer = make_buffer(limit=11, eviction_chunk=0.5)
+    for index in range(11):
+        buffer.add_user(str(index))
+
+    assert contents(buffer) == ["6", "7", "8", "9", "10"]
+    assert buffer.evictions == 1
+
+    prefixes = []
+    for index in range(11, 16):
+        buffer.add_user(str(index))
+        prefixes.append(contents(buffer)[0])
+    assert prefixes == ["6"] * 5
+    assert buffer.evictions == 1
+
+    buffer.add_user("16")
+    assert contents(buffer) == ["12", "13", "14", "15", "16"]
+    assert buffer.evictions == 2
+
+
+def test_eviction_chunk_frees_part_of_the_token_budget():
+    budget = cost(SYSTEM) + 10 * cost("a")
+    buffer = make_buffer(token_budget=budget, eviction_chunk=0.5)
+    for letter in "abcdefghijk":
+        buffer.add_user(letter)
+
+    # Бюджет 56, после вытеснения не больше 28: промпт 6 и четыре сообщения по 5.
+    assert contents(buffer) == ["h", "i", "j", "k"]
+    assert buffer.total_tokens <= budget // 2
+    assert buffer.evictions == 1
+
+
+def test_zero_eviction_chunk_slides_by_one_message():
+    buffer = make_buffer(limit=4)
+    for index in range(5):
+        buffer.add_user(str(index))
+
+    assert contents(buffer) == ["2", "3", "4"]
+    assert buffer.evictions == 2
+
+
+def test_summary_replaces_the_prefix_and_keeps_later_messages():
+    buffer = make_buffer()
+    for letter in "abcd":
+        buffer.add_user(letter)
+    summarized = buffer.history()[:3]
+    buffer.add_user("e")
+
+    buffer.replace_with_summary(summarized, "итог")
+
+    assert contents(buffer) == ["итог", "d", "e"]
+    assert buffer.history()[0].role == "system"
+    assert buffer.history_tokens == sum(cost(text) for text in contents(buffer))
+
+
+def test_summary_skips_messages_already_evicted():
+    buffer = make_buffer(limit=4)
+    for letter in "abc":
+        buffer.add_user(letter)
+    summarized = buffer.history()[:2]
+    buffer.add_user("d")
+
+    # «a» уже вытеснен лимитом, подменяется только оставшийся «b».
+    buffer.replace_with_summary(summarized, "итог")
+
+    assert contents(buffer) == ["итог", "c", "d"]
+
+
+def test_summary_under_concurrent_adds():
+    buffer = make_buffer(limit=1000)
+    for index in range(50):
+        buffer.add_user(f"старое {index}")
+    summarized = buffer.history()
+    added = [f"новое {index}" for index in range(300)]
+    start = threading.Barrier(2)
+
+    def writer():
+        start.wait()
+        for text in added:
+            buffer.add_user(text)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    start.wait()
+    buffer.replace_with_summary(summarized, "итог")
+    thread.join()
+
+    assert contents(buffer) == ["итог", *added]
+    assert buffer.history_tokens == sum(cost(text) for text in contents(buffer))
+
+
+class GatedSummarizer:
+    """Возвращает summary только после `release`, пока пользователь продолжает писать."""
+
+    def __init__(self):
+        self.requested = threading.Event()
+        self.release = threading.Event()
+
+    def send(self, messages):
+        self.requested.set()
+        assert self.release.wait(5)
+        return "итог"
+
+
+def test_compressor_keeps_messages_added_while_summarizing():
+    buffer = make_buffer()
+    for letter in "abcdef":
+        buffer.add_user(letter)
+    client = GatedSummarizer()
+    compressor = HistoryCompressor(client, buffer, CompressionPolicy(trigger_messages=6))
+
+    assert compressor.maybe_compress()
+    assert client.requested.wait(5)
+    buffer.add_user("g")
+    buffer.add_user("h")
+    client.release.set()
+    compressor.wait(5)
+    compressor.close()
+
+    assert contents(buffer) == [f"{SUMMARY_PREFIX}\nитог", "e", "f", "g", "h"]
+    assert compressor.stats.runs == 1
@@ -0,0 +1,98 @@
+"""Инкрементальный разбор JSON планировщика и ранний выбор агента в PlanStream."""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agents import ConversationBuffer, Planner
+from json_stream import IncrementalJSONParser, parse_first_object
+
+PLAN = {
+    "agent": "browser",
+    "arguments": {"url": "https://example.com/?q=\"a,b\"", "tabs": [1, {"x": "}"}]},
+    "user_visible_message": "Открываю \\ \"пример\" — {готово}",
+}
+PAYLOAD = json.dumps(PLAN, ensure_ascii=False)
+
+
+def test_any_chunk_split_gives_the_same_object():
+    # Разрезы попадают внутрь строк, экранирований и вложенного `arguments`.
+    for split in range(1, len(PAYLOAD)):
+        parser = IncrementalJSONParser()
+        completed = {}
+        for chunk in (PAYLOAD[:split], PAYLOAD[split:]):
+            completed.update(parser.feed(chunk))
+
+        assert parser.result() == PLAN, split
+        assert completed == PLAN, split
+
+
+def test_fields_complete_before_the_object_ends():
+    parser = IncrementalJSONParser()
+    seen = []
+    for char in PAYLOAD:
+        seen.extend(parser.feed(char))
+        if "arguments" in parser.fields:
+            break
+
+    assert seen == ["agent", "arguments"]
+    assert parser.fields["arguments"] == PLAN["arguments"]
+    assert not parser.done
+    assert parser.result() is None
+
+
+def test_parse_first_object_ignores_surrounding_text():
+    payload = 'Вот план: {"agent": "qa", "arguments": {}} и ещё {"agent": "browser"}'
+
+    assert parse_first_object(payload) == {"agent": "qa", "arguments": {}}
+    assert parse_first_object('{"agent": "qa", "arguments": {') is None
+    assert parse_first_object('{"agent": qa}') is None
+
+
+class GatedPlannerClient:
+    """Отдаёт `agent` и `arguments`, затем ждёт `release` перед остатком ответа."""
+
+    def __init__(self, head, tail):
+        self.head = head
+        self.tail = tail
+        self.release = threading.Event()
+
+    def stream(self, messages):
+        yield from self.head
+        assert self.release.wait(5)
+        yield from self.tail
+
+    def send(self, messages):
+        return "".join(self.head + self.tail)
+
+
+def test_plan_stream_dispatches_before_the_stream_ends():
+    client = GatedPlannerClient(
+        ['{"agent": "brow', 'ser", "arguments": {"url": "exa', 'mple.com"}, '],
+        ['"user_visible_message": "Открываю"}'],
+    )
+    planner = Planner(client, ConversationBuffer("планировщик", 10), error_cls=RuntimeError)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        stream = planner.stream_plan(executor, lambda fields: "arguments" in fields)
+        early = stream.early_plan()
+        assert not stream.future.done()
+        client.release.set()
+        final = stream.final_plan()
+
+    assert (early.agent, early.arguments) == ("browser", {"url": "example.com"})
+    assert early.user_visible_message is None
+    assert final.user_visible_message == "Открываю"
+    assert stream.time_to_dispatch is not None
+
+
+def test_plan_stream_raises_planner_error_on_invalid_json():
+    client = GatedPlannerClient(["не JSON"], [])
+    client.release.set()
+    planner = Planner(client, ConversationBuffer("планировщик", 10), error_cls=ValueError)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        stream = planner.stream_plan(executor, lambda fields: "arguments" in fields)
+        with pytest.raises(ValueError):
+            stream.early_plan()
@@ -0,0 +1,102 @@
+"""Долговременная память: поиск, рост memmap и совпадение строк векторов с id в SQLite."""
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import memory
+from memory import MEMORY_HEADER, LongTermMemory
+
+TOPICS = [
+    "как приготовить борщ со сметаной",
+    "расписание электричек до Твери",
+    "настройка роутера и пароль от wifi",
+    "прогноз погоды на выходные в Казани",
+    "ремонт велосипедной цепи и смазка",
+    "курс доллара к рублю сегодня",
+]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "memory.sqlite")
+
+
+def store(mem, topics):
+    return {topic: mem.append("user", topic) for topic in topics}
+
+
+def best_id(mem, query):
+    snippets = mem.search(query, k=1)
+    return snippets[0].id if snippets else None
+
+
+def test_recall_finds_the_stored_message(path):
+    mem = LongTermMemory(path)
+    ids = store(mem, TOPICS)
+
+    for topic, message_id in ids.items():
+        assert best_id(mem, topic) == message_id
+    block = mem.recall_block("пароль от wifi на роутере")
+    assert block.splitlines()[0] == MEMORY_HEADER
+    assert "Пользователь: настройка роутера и пароль от wifi" in block
+    assert mem.recall_block("квантовая хромодинамика") is None
+    assert mem.stats.recalls == 2
+    mem.close()
+
+
+def test_exclude_from_hides_the_current_turn(path):
+    mem = LongTermMemory(path)
+    first = mem.append("user", TOPICS[0])
+    current = mem.append("user", TOPICS[0])
+
+    assert [s.id for s in mem.search(TOPICS[0], exclude_from=current)] == [first]
+    assert mem.search(TOPICS[0], exclude_from=first) == []
+    mem.close()
+
+
+def test_tail_overflow_remaps_the_file(path, monkeypatch):
+    monkeypatch.setattr(memory, "TAIL_ROWS", 2)
+    mem = LongTermMemory(path)
+    ids = store(mem, TOPICS)
+
+    # Шесть строк при хвосте на две: отображение обновлялось дважды.
+    assert len(mem._matrix) == 4
+    assert mem._tail_rows == 2
+    assert os.path.getsize(mem.vectors_path) == len(TOPICS) * mem.dimensions * 4
+    for topic, message_id in ids.items():
+        assert best_id(mem, topic) == message_id
+    mem.close()
+
+
+def test_reopened_file_keeps_rows_aligned_with_ids(path):
+    mem = LongTermMemory(path)
+    old = store(mem, TOPICS[:3])
+    mem.close()
+
+    mem = LongTermMemory(path)
+    assert len(mem) == 3
+    assert len(mem._matrix) == 3
+    new = store(mem, TOPICS[3:])
+
+    for topic, message_id in {**old, **new}.items():
+        assert best_id(mem, topic) == message_id
+    mem.close()
+
+
+def test_missing_vectors_are_rebuilt_from_sqlite(path):
+    mem = LongTermMemory(path)
+    ids = store(mem, TOPICS)
+    mem.close()
+    # Сбой между записью в SQLite и в файл векторов: последних строк нет,
+    # а от предпоследней остался обрывок.
+    row_bytes = mem.dimensions * 4
+    with open(mem.vectors_path, "r+b") as f:
+        f.truncate(3 * row_bytes + 10)
+
+    mem = LongTermMemory(path)
+    assert os.path.getsize(mem.vectors_path) == len(TOPICS) * row_bytes
+    for topic, message_id in ids.items():
+        assert best_id(mem, topic) == message_id
+    mem.close()
@@ -0,0 +1,113 @@
+"""Многошаговые планы: зависимости, пропуск после ошибки, цикл и порядок ответов."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agents import AgentRegistry, ConversationBuffer, PlanStep, QuestionAnswerAgent
+
+
+class StepAgents:
+    """Расширения-заглушки: шаг пишет начало и конец в журнал и может ждать другой шаг.
+
+    Аргументы шага: `reply`, `fail`, `wait_started` — id шага, который должен
+    начаться, прежде чем этот закончится.
+    """
+
+    def __init__(self):
+        self.log = []
+        self.started = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name == "step"
+
+    def _event(self, step_id):
+        with self._lock:
+            return self.started.setdefault(step_id, threading.Event())
+
+    def run(self, name, arguments):
+        step_id = arguments["id"]
+        with self._lock:
+            self.log.append(("start", step_id))
+        self._event(step_id).set()
+        other = arguments.get("wait_started")
+        if other is not None:
+            assert self._event(other).wait(5), f"шаг {other} не начался"
+        with self._lock:
+            self.log.append(("end", step_id))
+        if arguments.get("fail"):
+            raise RuntimeError(f"сбой {step_id}")
+        return arguments.get("reply", step_id)
+
+
+def step(step_id, depends_on=(), **arguments):
+    return PlanStep(step_id, "step", {"id": step_id, **arguments}, list(depends_on))
+
+
+@pytest.fixture
+def registry():
+    executor = ThreadPoolExecutor(max_workers=4)
+    qa = QuestionAnswerAgent(client=None, buffer=ConversationBuffer("s", 10))
+    yield AgentRegistry(qa_agent=qa, extensions=StepAgents(), step_executor=executor)
+    executor.shutdown(wait=True)
+
+
+def test_dependent_step_waits_while_independent_steps_overlap(registry):
+    log = registry.extensions.log
+    # «a» заканчивается, только когда начался «c»: без параллельности тест зависнет.
+    reply = registry.run_steps(
+        [step("a", wait_started="c"), step("b", depends_on=["a"]), step("c")]
+    )
+
+    assert reply == "a\nb\nc"
+    assert log.index(("start", "b")) > log.index(("end", "a"))
+    assert log.index(("start", "c")) < log.index(("end", "a"))
+
+
+def test_steps_after_a_failed_step_are_skipped(registry):
+    reply = registry.run_steps(
+        [
+            step("a", fail=True),
+            step("b", depends_on=["a"]),
+            step("c", depends_on=["b"]),
+            step("d"),
+        ]
+    )
+
+    lines = reply.splitlines()
+    assert lines[0] == "[Ошибка агента step] сбой a"
+    assert lines[1] == "[Шаг b пропущен: не выполнен шаг a]"
+    assert lines[2] == "[Шаг c пропущен: не выполнен шаг b]"
+    assert lines[3] == "d"
+    started = [entry[1] for entry in registry.extensions.log if entry[0] == "start"]
+    assert sorted(started) == ["a", "d"]
+    assert registry.step_stats.failed == 3
+
+
+def test_dependency_cycle_starts_the_first_waiting_step(registry):
+    reply = registry.run_steps([step("a", depends_on=["b"]), step("b", depends_on=["a"])])
+
+    assert reply == "a\nb"
+    assert registry.extensions.log == [("start", "a"), ("end", "a"), ("start", "b"), ("end", "b")]
+
+
+def test_replies_are_merged_in_plan_order_not_completion_order(registry):
+    # «first» ждёт начала «last», поэтому заканчивается последним.
+    reply = registry.run_steps(
+        [step("first", wait_started="last"), step("middle"), step("last")]
+    )
+
+    assert registry.extensions.log[-1] == ("end", "first")
+    assert reply == "first\nmiddle\nlast"
+    assert registry.step_stats.steps == 3
+
+
+def test_steps_run_one_by_one_without_an_executor():
+    qa = QuestionAnswerAgent(client=None, buffer=ConversationBuffer("s", 10))
+    registry = AgentRegistry(qa_agent=qa, extensions=StepAgents())
+
+    reply = registry.run_steps([step("a"), step("b", depends_on=["a"])])
+
+    assert reply == "a\nb"
+    assert registry.extensions.log == [("start", "a"), ("end", "a"), ("start", "b"), ("end", "b")]
@@ -0,0 +1,242 @@
+"""Повторы, Retry-After, circuit breaker и хеджирование DeepSeekChatClient на MockDeepSeekServer."""
+import asyncio
+import itertools
+import threading
+
+import pytest
+
+from chat import AsyncDeepSeekChatClient, DeepSeekChatClient, DeepSeekClientError
+from mock_server import MockBehavior, MockDeepSeekServer
+from resilience import CircuitBreaker, HedgePolicy, RetryPolicy
+
+MESSAGES = [{"role": "user", "content": "привет"}]
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def mock():
+    with MockDeepSeekServer() as server:
+        yield server
+
+
+def make_client(url, **policies):
+    return DeepSeekChatClient("test", url, "deepseek-chat", 0.7, 64, 5, **policies)
+
+
+def recording_retry_policy(max_attempts=3):
+    delays = []
+    policy = RetryPolicy(max_attempts=max_attempts, base_delay=0.01, jitter=0.0)
+    policy.sleep = delays.append
+    return policy, delays
+
+
+def test_retries_retryable_status_until_success(mock):
+    policy, delays = recording_retry_policy(max_attempts=3)
+    client = make_client(mock.url, retry_policy=policy)
+    mock.fail_next(2, status=503)
+
+    assert client.send(MESSAGES) == "Ответ на: привет"
+    assert mock.requests_served == 3
+    assert client.stats.retries == 2
+    assert delays == [0.01, 0.02]
+
+
+def test_gives_up_after_max_attempts(mock):
+    policy, _ = recording_retry_policy(max_attempts=3)
+    client = make_client(mock.url, retry_policy=policy)
+    mock.fail_next(5, status=502)
+
+    with pytest.raises(DeepSeekClientError) as error:
+        client.send(MESSAGES)
+    assert error.value.status == 502
+    assert mock.requests_served == 3
+    assert client.stats.failures == 1
+
+
+def test_non_retryable_status_is_not_retried(mock):
+    policy, delays = recording_retry_policy()
+    client = make_client(mock.url, retry_policy=policy)
+    mock.fail_next(1, status=400)
+
+    with pytest.raises(DeepSeekClientError) as error:
+        client.send(MESSAGES)
+    assert error.value.status == 400
+    assert not error.value.retryable
+    assert mock.requests_served == 1
+    assert delays == []
+
+
+def test_honors_retry_after(mock):
+    policy, delays = recording_retry_policy()
+    client = make_client(mock.url, retry_policy=policy)
+    mock.fail_next(1, status=429, retry_after=2.5)
+
+    client.send(MESSAGES)
+    assert delays == [2.5]
+
+
+def test_breaker_opens_half_opens_and_closes(mock):
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10.0, clock=clock)
+    client = make_client(mock.url, circuit_breaker=breaker)
+    mock.fail_next(2, status=503)
+
+    for _ in range(2):
+        with pytest.raises(DeepSeekClientError):
+            client.send(MESSAGES)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(DeepSeekClientError):
+        client.send(MESSAGES)
+    assert mock.requests_served == 2
+    assert client.stats.short_circuits == 1
+
+    clock.now = 10.0
+    assert client.send(MESSAGES) == "Ответ на: привет"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_trial_reopens_breaker(mock):
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=clock)
+    client = make_client(mock.url, circuit_breaker=breaker)
+    mock.fail_next(2, status=500)
+
+    with pytest.raises(DeepSeekClientError):
+        client.send(MESSAGES)
+    clock.now = 10.0
+    with pytest.raises(DeepSeekClientError):
+        client.send(MESSAGES)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert mock.requests_served == 2
+
+
+def test_non_retryable_error_leaves_half_open_breaker_untouched(mock):
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=clock)
+    client = make_client(mock.url, circuit_breaker=breaker)
+    mock.fail_next(1, status=503)
+    with pytest.raises(DeepSeekClientError):
+        client.send(MESSAGES)
+
+    clock.now = 10.0
+    mock.fail_next(1, status=401)
+    with pytest.raises(DeepSeekClientError):
+        client.send(MESSAGES)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # Пробный вызов освобождён: следующий запрос проходит и замыкает breaker.
+    assert client.send(MESSAGES) == "Ответ на: привет"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_hedge_wins_when_primary_is_slow():
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    def latency(payload):
+        with lock:
+            return 1.0 if next(counter) == 0 else 0.0
+
+    hedge = HedgePolicy(min_delay=0.05, max_delay=0.05, min_samples=0, max_hedges=1)
+    with MockDeepSeekServer(MockBehavior(request_latency=latency)) as server:
+        client = make_client(server.url, hedge_policy=hedge)
+        assert client.send(MESSAGES) == "Ответ на: привет"
+        assert client.stats.hedges == 1
+        assert client.stats.hedge_wins == 1
+        assert server.requests_served == 2
+
+
+def test_no_hedge_when_primary_is_fast(mock):
+    hedge = HedgePolicy(min_delay=0.5, max_delay=0.5, min_samples=0, max_hedges=1)
+    client = make_client(mock.url, hedge_policy=hedge)
+
+    client.send(MESSAGES)
+    assert client.stats.hedges == 0
+    assert mock.requests_served == 1
+
+
+async def _async_call(client, call):
+    try:
+        return await call(client)
+    finally:
+        await client.close()
+
+
+def make_async_client(url, **policies):
+    pytest.importorskip("aiohttp")
+    return AsyncDeepSeekChatClient("test", url, "deepseek-chat", 0.7, 64, 5, **policies)
+
+
+def test_async_client_retries_retryable_status(mock):
+    policy = RetryPolicy(max_attempts=3, base_delay=0.01, jitter=0.0)
+    client = make_async_client(mock.url, retry_policy=policy)
+    mock.fail_next(2, status=503)
+
+    reply = asyncio.run(_async_call(client, lambda c: c.send(MESSAGES)))
+    assert reply == "Ответ на: привет"
+    assert mock.requests_served == 3
+    assert client.stats.retries == 2
+
+
+def test_async_client_retries_opening_a_stream(mock):
+    policy = RetryPolicy(max_attempts=2, base_delay=0.01, jitter=0.0)
+    client = make_async_client(mock.url, retry_policy=policy)
+    mock.fail_next(1, status=502)
+
+    async def collect(c):
+        return "".join([token async for token in c.stream(MESSAGES)]).strip()
+
+    assert asyncio.run(_async_call(client, collect)) == "Ответ на: привет"
+    assert client.stats.retries == 1
+
+
+def test_async_client_breaker_short_circuits(mock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=FakeClock())
+    client = make_async_client(mock.url, circuit_breaker=breaker)
+    mock.fail_next(1, status=500)
+
+    async def twice(c):
+        for _ in range(2):
+            with pytest.raises(DeepSeekClientError):
+                await c.send(MESSAGES)
+
+    asyncio.run(_async_call(client, twice))
+    assert breaker.state == CircuitBreaker.OPEN
+    assert mock.requests_served == 1
+    assert client.stats.short_circuits == 1
+
+
+def test_null_content_is_a_non_retryable_client_error():
+    with pytest.raises(DeepSeekClientError) as error:
+        DeepSeekChatClient._extract_content({"choices": [{"message": {"content": None}}]})
+    assert not error.value.retryable
+
+
+def test_unexpected_exception_releases_half_open_trial(mock, monkeypatch):
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=clock)
+    client = make_client(mock.url, circuit_breaker=breaker)
+    mock.fail_next(1, status=503)
+    with pytest.raises(DeepSeekClientError):
+        client.send(MESSAGES)
+
+    clock.now = 10.0
+    def broken(messages):
+        raise AttributeError("'NoneType' object has no attribute 'strip'")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(client, "_post_completion", broken)
+        with pytest.raises(AttributeError):
+            client.send(MESSAGES)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    assert client.send(MESSAGES) == "Ответ на: привет"
+    assert breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,71 @@
+"""Ключи, почти-дубликаты и очистка диска ResponseCache."""
+import time
+
+from response_cache import CachePolicy, ResponseCache
+
+
+class CountingBackend:
+    model = "deepseek-chat"
+    temperature = 0.7
+    max_tokens = 64
+    response_format = None
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def send(self, messages):
+        self.calls += 1
+        return f"ответ {self.calls}"
+
+    def with_json_mode(self):
+        clone = CountingBackend()
+        clone.response_format = {"type": "json_object"}
+        return clone
+
+
+def conversation(turns, question):
+    messages = [{"role": "system", "content": "Ты ассистент"}]
+    for number in range(turns):
+        messages.append({"role": "user", "content": f"вопрос {number}"})
+        messages.append({"role": "assistant", "content": f"ответ {number}"})
+    messages.append({"role": "user", "content": question})
+    return messages
+
+
+def test_near_duplicate_hits_late_in_long_conversations():
+    cache = ResponseCache()
+    backend = cache.wrap(CountingBackend(), CachePolicy(near_duplicate=True), namespace="qa")
+
+    first = backend.send(conversation(5, "какая столица франции?"))
+    # Другая ранняя история, те же последние реплики и почти тот же вопрос.
+    messages = conversation(5, "какая столица франции")
+    messages[1] = {"role": "user", "content": "совсем другое начало"}
+    assert backend.send(messages) == first
+    assert cache.stats.near_hits == 1
+
+
+def test_json_mode_is_part_of_the_key():
+    cache = ResponseCache()
+    plain = CountingBackend()
+    json_mode = plain.with_json_mode()
+    plain_cached = cache.wrap(plain, CachePolicy(), namespace="planner")
+    json_cached = cache.wrap(json_mode, CachePolicy(), namespace="planner")
+
+    messages = conversation(0, "привет")
+    plain_cached.send(messages)
+    json_cached.send(messages)
+    assert (plain.calls, json_mode.calls) == (1, 1)
+    assert cache.stats.misses == 2
+
+
+def test_disk_store_is_swept(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_disk_entries=3, sweep_every=1)
+    backend = cache.wrap(CountingBackend(), CachePolicy(ttl_seconds=60), namespace="qa")
+    cache.store.put("old", "qa", "устарел", time.time() - 3600)
+
+    for number in range(5):
+        backend.send(conversation(0, f"вопрос {number}"))
+
+    count = cache.store._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    assert count == 3
+    assert cache.store.get("old") is None
@@ -0,0 +1,106 @@
+"""Порядок приоритетов, token bucket и классовые лимиты RequestScheduler."""
+import threading
+import time
+
+from scheduler import (
+    BACKGROUND,
+    INTERACTIVE,
+    PLANNER,
+    RequestScheduler,
+    SchedulerPolicy,
+    TokenBucket,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "условие не выполнилось"
+        time.sleep(0.005)
+
+
+def hold_slot(scheduler, request_class, release, entered=None, **kwargs):
+    def run():
+        with scheduler.slot(request_class, **kwargs):
+            if entered is not None:
+                entered.append(request_class)
+            release.wait(5)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_token_bucket_refills_at_its_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(per_minute=60, burst=2, clock=clock)
+
+    bucket.consume(2)
+    assert bucket.wait_time(1) == 1.0
+    clock.now = 0.5
+    assert bucket.wait_time(1) == 0.5
+    clock.now = 10.0
+    assert bucket.wait_time(5) == 0.0
+    assert bucket.tokens == 2
+
+
+def test_queued_requests_run_in_priority_order():
+    scheduler = RequestScheduler(SchedulerPolicy(max_concurrent=1, class_limits={}))
+    release_first = threading.Event()
+    blocker = hold_slot(scheduler, INTERACTIVE, release_first)
+    wait_until(lambda: scheduler.stats.classes[INTERACTIVE].in_flight == 1)
+
+    order = []
+    released = threading.Event()
+    released.set()
+    waiting = [
+        hold_slot(scheduler, request_class, released, entered=order)
+        for request_class in (BACKGROUND, INTERACTIVE, PLANNER)
+    ]
+    wait_until(lambda: scheduler.stats.queue_depth == 3)
+    release_first.set()
+    for thread in [blocker, *waiting]:
+        thread.join(5)
+
+    assert order == [PLANNER, INTERACTIVE, BACKGROUND]
+    assert scheduler.stats.queue_depth == 0
+
+
+def test_token_limit_delays_admission_until_refill():
+    scheduler = RequestScheduler(SchedulerPolicy(tokens_per_minute=6000))
+    with scheduler.slot(INTERACTIVE, tokens=6000):
+        pass
+
+    started = time.monotonic()
+    with scheduler.slot(INTERACTIVE, tokens=30):
+        waited = time.monotonic() - started
+
+    assert 0.2 <= waited < 2.0
+    assert scheduler.stats.classes[INTERACTIVE].completed == 2
+
+
+def test_background_limit_does_not_starve_interactive():
+    scheduler = RequestScheduler(SchedulerPolicy(max_concurrent=4, class_limits={BACKGROUND: 1}))
+    release = threading.Event()
+    entered = []
+    first = hold_slot(scheduler, BACKGROUND, release, entered=entered)
+    wait_until(lambda: entered == [BACKGROUND])
+    second = hold_slot(scheduler, BACKGROUND, release, entered=entered)
+    wait_until(lambda: scheduler.stats.classes[BACKGROUND].queued == 1)
+
+    with scheduler.slot(INTERACTIVE):
+        assert scheduler.stats.classes[BACKGROUND].queued == 1
+
+    release.set()
+    for thread in (first, second):
+        thread.join(5)
+    assert entered == [BACKGROUND, BACKGROUND]
+    assert scheduler.stats.classes[BACKGROUND].completed == 2
@@ -0,0 +1,136 @@
+"""Спекулятивный ответ QA: используется при плане qa и отменяется в остальных случаях."""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agents import (
+    AgentRegistry,
+    ConversationBuffer,
+    Dispatcher,
+    Planner,
+    QuestionAnswerAgent,
+    Speculator,
+)
+
+
+class StreamingQA:
+    """Стримит `tokens` или, если их нет, длинный ответ, пока поток не закроют.
+
+    `closed` ставится только при закрытии потока до конца ответа.
+    """
+
+    def __init__(self, tokens=None):
+        self.tokens = tokens
+        self.started = threading.Event()
+        self.closed = threading.Event()
+
+    def _endless(self):
+        for _ in range(5000):
+            time.sleep(0.001)
+            yield "слово "
+
+    def stream(self, messages):
+        self.started.set()
+        try:
+            yield from self.tokens if self.tokens is not None else self._endless()
+        except GeneratorExit:
+            self.closed.set()
+            raise
+
+    def send(self, messages):
+        return "".join(self.stream(messages)).strip()
+
+
+class StubPlanner:
+    """Отвечает после старта спекуляции: планом для `agent` или исключением `error`."""
+
+    def __init__(self, qa, agent="qa", error=None):
+        self.qa = qa
+        self.agent = agent
+        self.error = error
+
+    def send(self, messages):
+        assert self.qa.started.wait(5)
+        if self.error is not None:
+            raise self.error
+        return json.dumps({"agent": self.agent, "arguments": {}, "user_visible_message": None})
+
+
+class BrowserOnly:
+    def __contains__(self, name):
+        return name == "browser"
+
+    def run(self, name, arguments):
+        return "Открываю браузер"
+
+
+class PlannerError(Exception):
+    pass
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        yield pool
+
+
+def make_dispatcher(executor, qa_client, **planner_options):
+    user_buffer = ConversationBuffer("ты помощник", 10)
+    planner_buffer = ConversationBuffer("ты планировщик", 10)
+    qa = QuestionAnswerAgent(client=qa_client, buffer=user_buffer)
+    return Dispatcher(
+        planner=Planner(
+            StubPlanner(qa_client, **planner_options), planner_buffer, error_cls=PlannerError
+        ),
+        registry=AgentRegistry(qa_agent=qa, extensions=BrowserOnly()),
+        user_buffer=user_buffer,
+        planner_buffer=planner_buffer,
+        speculator=Speculator(qa, executor),
+        on_notice=lambda notice: None,
+    )
+
+
+def test_speculative_answer_is_used_for_a_qa_plan(executor):
+    dispatcher = make_dispatcher(executor, StreamingQA(["Сорок ", "два"]))
+
+    result = dispatcher.handle("сколько будет шесть на семь?")
+
+    assert result.reply == "Сорок два"
+    assert (dispatcher.speculator.stats.used, dispatcher.speculator.stats.wasted) == (1, 0)
+
+
+def test_speculative_answer_is_discarded_for_another_agent(executor):
+    qa_client = StreamingQA()
+    dispatcher = make_dispatcher(executor, qa_client, agent="browser")
+
+    result = dispatcher.handle("открой сайт")
+
+    assert result.reply == "Открываю браузер"
+    assert qa_client.closed.wait(5)
+    stats = dispatcher.speculator.stats
+    assert (stats.started, stats.used, stats.wasted, stats.cancelled_in_flight) == (1, 0, 1, 1)
+
+
+def test_speculative_answer_is_discarded_when_the_planner_raises(executor):
+    qa_client = StreamingQA()
+    dispatcher = make_dispatcher(executor, qa_client, error=RuntimeError("сбой планировщика"))
+
+    with pytest.raises(RuntimeError):
+        dispatcher.handle("открой сайт")
+
+    assert qa_client.closed.wait(5)
+    stats = dispatcher.speculator.stats
+    assert (stats.used, stats.wasted, stats.cancelled_in_flight) == (0, 1, 1)
+
+
+def test_planner_error_falls_back_to_the_speculative_answer(executor):
+    qa_client = StreamingQA(["Ответ"])
+    dispatcher = make_dispatcher(executor, qa_client, error=PlannerError("не JSON"))
+
+    result = dispatcher.handle("привет")
+
+    assert result.reply == "Ответ"
+    assert dispatcher.speculator.stats.used == 1
@@ -0,0 +1,106 @@
+"""VAD и VoicePipeline офлайн на синтетической WAV-фикстуре."""
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from voice import (  # noqa: E402
+    ScriptedSpeechToText,
+    VadPolicy,
+    VoiceActivityDetector,
+    VoicePipeline,
+    WavSource,
+    synthesize_fixture,
+)
+
+UTTERANCES = (1.2, 0.8, 1.5)
+PAUSE = 0.8
+TRANSCRIPTS = ["привет", "открой github.com", "какая погода"]
+
+
+class FakeDispatcher:
+    def __init__(self):
+        self.planned_for = []
+        self.handled = []
+
+    def plan_ahead(self, text, executor):
+        self.planned_for.append(text)
+        plan = Future()
+        plan.set_result(("план", text))
+        return plan
+
+    def handle(self, text, planned=None):
+        self.handled.append((text, planned))
+        return text
+
+
+@pytest.fixture
+def fixture_wav(tmp_path):
+    path = str(tmp_path / "fixture.wav")
+    synthesize_fixture(path, utterances=UTTERANCES, pause=PAUSE)
+    return path
+
+
+def speech_bounds():
+    bounds, position = [], PAUSE
+    for duration in UTTERANCES:
+        bounds.append((position, position + duration))
+        position += duration + PAUSE
+    return bounds
+
+
+def test_detector_finds_each_utterance(fixture_wav):
+    source = WavSource(fixture_wav)
+    policy = VadPolicy(sample_rate=source.sample_rate)
+    detector = VoiceActivityDetector(policy)
+    segments = [segment for chunk in source for segment in detector.feed(chunk)]
+    segments += detector.flush()
+
+    finals = [segment for segment in segments if segment.final]
+    assert [segment.index for segment in finals] == [0, 1, 2]
+    padding = policy.padding_ms / 1000
+    for segment, (start, end) in zip(finals, speech_bounds()):
+        assert segment.start == pytest.approx(start - padding, abs=0.1)
+        assert segment.speech_end == pytest.approx(end, abs=0.1)
+    assert sum(segment.at_pause for segment in segments) == 3
+
+
+def test_pipeline_reuses_pause_transcript_and_prefetched_plan(fixture_wav):
+    source = WavSource(fixture_wav)
+    dispatcher = FakeDispatcher()
+    pipeline = VoicePipeline(
+        VoiceActivityDetector(VadPolicy(sample_rate=source.sample_rate)),
+        ScriptedSpeechToText(TRANSCRIPTS),
+        dispatcher,
+        on_notice=lambda message: None,
+    )
+
+    stats = pipeline.run(source)
+
+    assert stats.utterances == 3
+    assert stats.reused_transcripts == 3
+    assert stats.prefetched_plans == 3
+    assert stats.wasted_plans == 0
+    assert dispatcher.planned_for == TRANSCRIPTS
+    assert dispatcher.handled == [(text, ("план", text)) for text in TRANSCRIPTS]
+
+
+def test_pipeline_without_plan_ahead_still_dispatches(fixture_wav):
+    class HandleOnly:
+        def __init__(self):
+            self.handled = []
+
+        def handle(self, text):
+            self.handled.append(text)
+
+    source = WavSource(fixture_wav)
+    dispatcher = HandleOnly()
+    stats = VoicePipeline(
+        VoiceActivityDetector(VadPolicy(sample_rate=source.sample_rate)),
+        ScriptedSpeechToText(TRANSCRIPTS),
+        dispatcher,
+    ).run(source)
+
+    assert dispatcher.handled == TRANSCRIPTS
+    assert stats.prefetched_plans == 0
@@ -0,0 +1,272 @@
+"""Встроенная трассировка хода диспетчера и экспорт метрик.
+
+Спаны (`with tracing.span("planner.plan"):`) пишутся в JSONL-файл трассы, а
+их длительности, счётчики токенов из `usage` ответов API и показатели
+(`set_gauge`) агрегируются в снимок метрик в текстовом формате Prometheus.
+Пока `configure` не вызван, `span` возвращает общий пустой объект, и накладные
+расходы — один вызов функции.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("vais_current_span", default=None)
+_usage_listener: ContextVar[Optional[Callable[[Dict[str, Any]], None]]] = ContextVar(
+    "vais_usage_listener", default=None
+)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> bool:
+        return False
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    __slots__ = (
+        "tracer",
+        "name",
+        "attrs",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "started_at",
+        "_start",
+        "duration",
+        "_token",
+    )
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.span_id = uuid.uuid4().hex[:16]
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.duration = 0.0
+
+    def __enter__(self) -> "Span":
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> bool:
+        self.duration = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer._finish(self)
+        return False
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count", "errors")
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+        self.errors = 0
+
+    def observe(self, value: float, error: bool) -> None:
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+        self.total += value
+        self.count += 1
+        self.errors += int(error)
+
+
+class Tracer:
+    def __init__(self, trace_path: Optional[str] = None, metrics_path: Optional[str] = None) -> None:
+        self.trace_path = trace_path
+        self.metrics_path = metrics_path
+        self._trace_file: Optional[TextIO] = (
+            open(trace_path, "a", encoding="utf-8") if trace_path else None
+        )
+        self._histograms: Dict[str, _Histogram] = {}
+        self._tokens: Dict[str, int] = {}
+        self._gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._lock = threading.Lock()
+
+    def span(self, name: str, **attrs: Any) -> Span:
+        return Span(self, name, attrs)
+
+    def record_usage(self, usage: Dict[str, Any]) -> None:
+        """Добавляет целочисленные поля `usage` к счётчикам и к текущему спану."""
+        counts = {key: value for key, value in usage.items() if isinstance(value, int)}
+        current = _current_span.get()
+        if current is not None:
+            current.attrs["usage"] = counts
+        with self._lock:
+            for key, value in counts.items():
+                self._tokens[key] = self._tokens.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        key = (name, tuple(sorted((label, str(text)) for label, text in labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def _finish(self, span: Span) -> None:
+        record = None
+        if self._trace_file is not None:
+            record = json.dumps(
+                {
+                    "trace_id": span.trace_id,
+                    "span_id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "name": span.name,
+                    "start": span.started_at,
+                    "duration": round(span.duration, 6),
+                    "attrs": span.attrs,
+                },
+                ensure_ascii=False,
+                default=str,
+            )
+        with self._lock:
+            histogram = self._histograms.get(span.name)
+            if histogram is None:
+                histogram = self._histograms[span.name] = _Histogram()
+            histogram.observe(span.duration, "error" in span.attrs)
+            if record is not None and self._trace_file is not None:
+                self._trace_file.write(record + "\n")
+        if span.parent_id is None:
+            self.flush()
+
+    def prometheus_text(self) -> str:
+        lines: List[str] = [
+            "# HELP vais_span_duration_seconds Длительность этапов диспетчера.",
+            "# TYPE vais_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            tokens = sorted(self._tokens.items())
+            gauges = sorted(self._gauges.items())
+            for name, histogram in histograms:
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    lines.append(
+                        f'vais_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'vais_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {histogram.count}'
+                )
+                lines.append(f'vais_span_duration_seconds_sum{{span="{name}"}} {histogram.total:.6f}')
+                lines.append(f'vais_span_duration_seconds_count{{span="{name}"}} {histogram.count}')
+            lines.append("# HELP vais_span_errors_total Этапы, завершившиеся исключением.")
+            lines.append("# TYPE vais_span_errors_total counter")
+            for name, histogram in histograms:
+                lines.append(f'vais_span_errors_total{{span="{name}"}} {histogram.errors}')
+        lines.append("# HELP vais_llm_tokens_total Токены из поля usage ответов API.")
+        lines.append("# TYPE vais_llm_tokens_total counter")
+        for key, value in tokens:
+            lines.append(f'vais_llm_tokens_total{{type="{key}"}} {value}')
+        for name in sorted({name for (name, _), _ in gauges}):
+            lines.append(f"# TYPE vais_{name} gauge")
+            for (gauge, labels), value in gauges:
+                if gauge == name:
+                    rendered = ",".join(f'{label}="{text}"' for label, text in labels)
+                    lines.append(f"vais_{name}{{{rendered}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self, path: str) -> None:
+        """Атомарно перезаписывает снимок метрик (подходит для textfile collector)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._trace_file is not None:
+                self._trace_file.flush()
+        if self.metrics_path:
+            self.write_metrics(self.metrics_path)
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._trace_file is not None:
+                self._trace_file.close()
+                self._trace_file = None
+
+
+_tracer: Optional[Tracer] = None
+
+
+def configure(trace_path: Optional[str] = None, metrics_path: Optional[str] = None) -> Tracer:
+    """Включает трассировку для всего процесса."""
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+    _tracer = Tracer(trace_path, metrics_path)
+    return _tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def span(name: str, **attrs: Any) -> Any:
+    tracer = _tracer
+    if tracer is None:
+        return _NOOP_SPAN
+    return tracer.span(name, **attrs)
+
+
+def record_usage(usage: Any) -> None:
+    if not isinstance(usage, dict):
+        return
+    listener = _usage_listener.get()
+    if listener is not None:
+        listener(usage)
+    tracer = _tracer
+    if tracer is not None:
+        tracer.record_usage(usage)
+
+
+def set_gauge(name: str, value: float, **labels: Any) -> None:
+    """Текущее значение показателя (например, глубины очереди) для снимка метрик."""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.set_gauge(name, value, **labels)
+
+
+@contextmanager
+def usage_listener(listener: Callable[[Dict[str, Any]], None]) -> Iterator[None]:
+    """Передаёт `usage` запросов внутри блока в `listener`; работает и без `configure`."""
+    token = _usage_listener.set(listener)
+    try:
+        yield
+    finally:
+        _usage_listener.reset(token)
+
+
+def shutdown() -> None:
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+        _tracer = None